@@ -0,0 +1,316 @@
+# gone/arena.py
+'''
+Arena AST
+=========
+For very large (usually machine generated) programs, creating an
+object for every node of the AST takes a lot of memory.  This file
+implements an alternative storage mode where all of the nodes of a
+tree live in a NodeArena, a handful of parallel arrays:
+
+       kinds      Class of each node (index into NodeArena.classes)
+       linenos    Line number of each node (-1 if none)
+       offsets    Start of the fields of each node in slots
+       slots      Encoded field values
+
+Each field value is encoded as a 32-bit integer whose low two bits
+give its tag:
+
+       NODE       Index of a child node
+       VALUE      Index into the interned values (names, operators, ...)
+       LIST       Index of an array holding the indices of child nodes
+       NONE       None
+
+Nodes are accessed through lightweight views.  A view is an instance
+of a subclass of the corresponding class from ast.py that just holds
+the arena and the index of the node, so NodeVisitor, flatten() and the
+CheckProgramVisitor work on them unchanged.  Attributes set on views
+by later stages (type, sym, gen_location and the extra slots of some
+classes, such as ArrayType.length) are stored in the arena as well.
+Views are created on demand and can be discarded at any time.  The
+structure of an arena can't be changed once it has been built.
+
+To parse directly into an arena, use parse():
+
+       tree = parse(source)         # View of the top-level Statements
+       check_program(tree)
+'''
+
+from array import array
+
+from . import ast
+
+# Field encoding tags
+NODE, VALUE, LIST, NONE = range(4)
+
+# Placeholder at index 0 of NodeArena.values.  Attributes with this
+# value have not been set.
+_unset = object()
+
+class NodeRef(object):
+    '''
+    Reference to a node in an arena.  These are handed to the parser
+    in place of AST nodes while an arena is being built.
+    '''
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+class ListNodeRef(NodeRef):
+    '''
+    Reference to a node (such as Statements) that the parser may append
+    to.  The appended nodes go to the node's first list field.
+    '''
+    __slots__ = ('items',)
+
+    def __init__(self, index, items):
+        self.index = index
+        self.items = items
+
+    def append(self, ref):
+        self.items.append(ref.index)
+
+class NodeArena(object):
+    '''
+    Storage for all of the nodes of an AST.
+    '''
+    def __init__(self):
+        self.classes = []
+        self.view_classes = []
+        self.kind_of = {}
+        self.kinds = array('B')
+        self.linenos = array('i')
+        self.offsets = array('i')
+        self.slots = array('i')
+        self.lists = []
+        self.values = [_unset]
+        self.value_index = {}
+        self.attributes = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def intern(self, value):
+        '''
+        Return the index of a value in self.values, adding it if needed.
+        Values are interned separately for each type (so that 1, 1.0
+        and True are kept apart).
+        '''
+        index_of = self.value_index.get(type(value))
+        if index_of is None:
+            index_of = self.value_index[type(value)] = {}
+        try:
+            index = index_of.get(value)
+        except TypeError:
+            index_of = index = None
+        if index is None:
+            index = len(self.values)
+            self.values.append(value)
+            if index_of is not None:
+                index_of[value] = index
+        return index
+
+    def encode(self, value):
+        if value is None:
+            return NONE
+        elif isinstance(value, NodeRef):
+            return value.index << 2 | NODE
+        elif isinstance(value, list):
+            self.lists.append(array('i', [ref.index for ref in value]))
+            return (len(self.lists) - 1) << 2 | LIST
+        else:
+            return self.intern(value) << 2 | VALUE
+
+    def decode(self, code):
+        tag = code & 3
+        if tag == NODE:
+            return self.node(code >> 2)
+        elif tag == VALUE:
+            return self.values[code >> 2]
+        elif tag == LIST:
+            node = self.node
+            return [node(index) for index in self.lists[code >> 2]]
+        return None
+
+    def add(self, cls, args, lineno=None):
+        '''
+        Add a node of class cls with the given field values.  Return a
+        reference to it.
+        '''
+        if len(args) != len(cls._fields):
+            raise TypeError('%s expects %d fields' % (cls.__name__, len(cls._fields)))
+        kind = self.kind_of.get(cls)
+        if kind is None:
+            kind = self.kind_of[cls] = len(self.classes)
+            self.classes.append(cls)
+            self.view_classes.append(view_class(cls))
+
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.linenos.append(-1 if lineno is None else lineno)
+        self.offsets.append(len(self.slots))
+        items = None
+        for value in args:
+            code = self.encode(value)
+            if items is None and code & 3 == LIST:
+                items = self.lists[code >> 2]
+            self.slots.append(code)
+
+        if items is not None and hasattr(cls, 'append'):
+            return ListNodeRef(index, items)
+        return NodeRef(index)
+
+    def node(self, index):
+        '''
+        Return a view of the node with the given index.
+        '''
+        return self.view_classes[self.kinds[index]](self, index)
+
+    def field(self, index, n):
+        return self.decode(self.slots[self.offsets[index] + n])
+
+    def field_values(self, index):
+        start = self.offsets[index]
+        nfields = len(self.classes[self.kinds[index]]._fields)
+        return tuple(self.decode(code) for code in self.slots[start:start+nfields])
+
+    def get_lineno(self, index):
+        lineno = self.linenos[index]
+        return None if lineno < 0 else lineno
+
+    def set_lineno(self, index, lineno):
+        self.linenos[index] = -1 if lineno is None else lineno
+
+    def get_attribute(self, index, name):
+        values = self.attributes.get(name)
+        if values is None or not values[index]:
+            raise AttributeError(name)
+        return self.values[values[index]]
+
+    def set_attribute(self, index, name, value):
+        values = self.attributes.get(name)
+        if values is None:
+            values = self.attributes[name] = array('i', bytes(4 * len(self)))
+        values[index] = self.intern(value)
+
+    def memory_usage(self):
+        '''
+        Return the approximate number of bytes used by the arrays of
+        the arena (not counting the interned values).
+        '''
+        arrays = [self.kinds, self.linenos, self.offsets, self.slots]
+        arrays.extend(self.lists)
+        arrays.extend(self.attributes.values())
+        return sum(a.itemsize * len(a) for a in arrays)
+
+class ArenaNodes(object):
+    '''
+    Node constructors that add the nodes to an arena.  Each attribute
+    is named after a class in ast.py and takes the same arguments.
+    Use it as the nodes attribute of a GoneParser.
+    '''
+    def __init__(self, arena):
+        self.arena = arena
+
+    def __getattr__(self, name):
+        cls = getattr(ast, name)
+        add = self.arena.add
+
+        def make(*args, lineno=None):
+            return add(cls, args, lineno)
+        setattr(self, name, make)
+        return make
+
+# ----------------------------------------------------------------------
+# Views
+
+def _view_init(self, arena, index):
+    self._arena = arena
+    self._index = index
+
+def _view_eq(self, other):
+    return (type(other) is type(self) and other._index == self._index
+            and other._arena is self._arena)
+
+def _view_hash(self):
+    return hash(self._index)
+
+def _view_field_values(self):
+    return self._arena.field_values(self._index)
+
+def _field_property(n):
+    return property(lambda self: self._arena.field(self._index, n))
+
+def _attribute_property(name):
+    def getter(self):
+        return self._arena.get_attribute(self._index, name)
+    def setter(self, value):
+        self._arena.set_attribute(self._index, name, value)
+    return property(getter, setter)
+
+_lineno_property = property(lambda self: self._arena.get_lineno(self._index),
+                            lambda self, lineno: self._arena.set_lineno(self._index, lineno))
+
+_view_classes = {}
+
+def view_class(cls):
+    '''
+    Return the view class for an AST node class.
+    '''
+    view = _view_classes.get(cls)
+    if view is None:
+        namespace = {
+            '__slots__': ('_arena', '_index'),
+            '__init__': _view_init,
+            '__eq__': _view_eq,
+            '__hash__': _view_hash,
+            '__qualname__': cls.__qualname__,
+            '__module__': cls.__module__,
+            '_field_values': _view_field_values,
+        }
+        for n, name in enumerate(cls._fields):
+            namespace[name] = _field_property(n)
+        # Attributes of all nodes and slots that are specific to a class
+        # (e.g., ArrayType.length) are both stored in the arena
+        extra = tuple(getattr(cls, '__slots__', ()))
+        for name in ast.AST._attributes + extra:
+            if name not in namespace:
+                namespace[name] = _lineno_property if name == 'lineno' else _attribute_property(name)
+        view = _view_classes[cls] = type(cls)(cls.__name__, (cls,), namespace)
+    return view
+
+def parse(source, lexer=None):
+    '''
+    Parse source code into a NodeArena.  Return a view of the top of
+    the AST tree.
+    '''
+    from .parser import GoneParser
+    from .tokenizer import GoneLexer
+
+    arena = NodeArena()
+    parser = GoneParser()
+    parser.nodes = ArenaNodes(arena)
+    if lexer is None:
+        lexer = GoneLexer()
+    ref = parser.parse(lexer.tokenize(source))
+    return arena.node(ref.index) if ref is not None else None
+
+def main():
+    '''
+    Main program. Used for testing.
+    '''
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.stderr.write('Usage: python3 -m gone.arena filename\n')
+        raise SystemExit(1)
+
+    tree = parse(open(sys.argv[1]).read())
+    if tree is not None:
+        for depth, node in ast.flatten(tree):
+            print('%s%s' % (' ' * (4 * depth), node))
+        arena = tree._arena
+        print('%d nodes, %d bytes' % (len(arena), arena.memory_usage()))
+
+if __name__ == '__main__':
+    main()
@@ -9,25 +9,72 @@ each kind of grammar rule.  A few sample AST nodes can be found at the
 top of this file.  You will need to add more on your own.
 '''
 
-
-# DO NOT MODIFY
-class AST(object):
+from types import GeneratorType
+
+def _make_init(fields):
+    '''
+    Create a positional __init__() method for a node with the given
+    _fields.  Generating the code (like collections.namedtuple does)
+    avoids the setattr() loops of a generic constructor.
+    '''
+    args = ''.join('%s, ' % name for name in fields)
+    body = ''.join('    self.%s = %s\n' % (name, name) for name in fields)
+    code = ('def __init__(self, %s*, lineno=None, **kwargs):\n'
+            '%s'
+            '    self.lineno = lineno\n'
+            '    for name, value in kwargs.items():\n'
+            '        setattr(self, name, value)\n') % (args, body)
+    namespace = {}
+    exec(code, namespace)
+    return namespace['__init__']
+
+def _make_field_values(fields):
+    '''
+    Create a _field_values() method returning a tuple with the values
+    of the given _fields.  Used to visit the children of a node.
+    '''
+    values = ''.join('self.%s, ' % name for name in fields)
+    code = 'def _field_values(self):\n    return (%s)\n' % values
+    namespace = {}
+    exec(code, namespace)
+    return namespace['_field_values']
+
+class ASTMeta(type):
+    '''
+    Metaclass for AST nodes.  Every node class gets __slots__ for its
+    _fields (instead of a per-node __dict__) and a generated positional
+    constructor, and a _field_values() method returning the values of
+    its _fields as a tuple.  The attributes listed in AST._attributes
+    are slots of the base class and are shared by all nodes.
+    '''
+    def __new__(meta, name, bases, namespace):
+        fields = list(namespace.get('_fields', ()))
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for cls in base.__mro__:
+                    inherited.update(getattr(cls, '__slots__', ()))
+            namespace['__slots__'] = tuple(f for f in fields if f not in inherited)
+        cls = super().__new__(meta, name, bases, namespace)
+        if '__init__' not in namespace:
+            cls.__init__ = _make_init(cls._fields)
+        if '_field_values' not in namespace:
+            cls._field_values = _make_field_values(cls._fields)
+        return cls
+
+class AST(object, metaclass=ASTMeta):
     '''
     Base class for all of the AST nodes.  Each node is expected to
     define the _fields attribute which lists the names of stored
-    attributes.   The __init__() method below takes positional
-    arguments and assigns them to the appropriate fields.  Any
-    additional arguments specified as keywords are also assigned. 
+    attributes.   The __init__() method takes positional arguments
+    and assigns them to the appropriate fields.  The line number can
+    be given as the keyword argument lineno.  Any other keywords must
+    be one of the attributes in _attributes, which are filled in by
+    later stages of the compiler (type checking, code generation).
     '''
     _fields = []
-
-    def __init__(self, *args, **kwargs):
-        assert len(args) == len(self._fields)
-        for name, value in zip(self._fields, args):
-            setattr(self, name, value)
-        # Assign additional keyword arguments if supplied
-        for name, value in kwargs.items():
-            setattr(self, name, value)
+    _attributes = ('lineno', 'type', 'sym', 'gen_location')
+    __slots__ = _attributes
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, ' '.join(['%s=%s' % (f, getattr(self, f)) for f in self._fields]))
@@ -166,9 +213,11 @@ class ExternFunctionDeclaration(AST):
 
 class ArrayType(AST):
     '''
-    An array datatype.  For example 'int [50]'
+    An array datatype.  For example 'int [50]'.  The checker sets
+    length to the value of the size expression.
     '''
     _fields = ['typename', 'size']
+    __slots__ = ('typename', 'size', 'length')
 
 
 class StoreArray(AST):
@@ -221,7 +270,42 @@ class NodeVisitor(object):
 
         tree = parse(txt)
         VisitOps().visit(tree)
+
+    The method used for each class of node is looked up once per visitor
+    class and cached in the _handlers dictionary.
+
+    Deeply nested trees (such as long chains of binary operators) can
+    exceed Python's recursion limit.  To avoid this, a visit_NodeName()
+    method may be written as a generator that yields the child nodes to
+    visit instead of calling self.visit() on them.  The value of each
+    yield is the result of visiting the child.  For example:
+
+            def visit_Binop(self, node):
+                yield node.left
+                yield node.right
+                print('Binary operator', node.op)
+
+    Such methods are run from an explicit stack so the depth of the tree
+    doesn't matter.  Setting iterative = True in a visitor class makes the
+    default traversal of generic_visit() non-recursive in the same way.
     '''
+    _handlers = {}
+    iterative = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._handlers = {}
+
+    @classmethod
+    def _lookup(cls, nodecls):
+        '''
+        Find and cache the method that visits nodes of class nodecls.
+        '''
+        handler = getattr(cls, 'visit_' + nodecls.__name__, None)
+        if handler is None:
+            handler = cls.iter_generic_visit if cls.iterative else cls.generic_visit
+        cls._handlers[nodecls] = handler
+        return handler
 
     def visit(self, node):
         '''
@@ -229,26 +313,73 @@ class NodeVisitor(object):
         NodeName is the name of the class of a particular node.
         '''
         if node:
-            method = 'visit_' + node.__class__.__name__
-            visitor = getattr(self, method, self.generic_visit)
-            return visitor(node)
+            try:
+                handler = self._handlers[node.__class__]
+            except KeyError:
+                handler = self._lookup(node.__class__)
+            result = handler(self, node)
+            if isinstance(result, GeneratorType):
+                result = self._run(result)
+            return result
         else:
             return None
 
+    def _run(self, gen):
+        '''
+        Run a generator returned by a visit_NodeName() method, visiting
+        the nodes it yields without recursion.
+        '''
+        handlers = self._handlers
+        stack = [gen]
+        value = None
+        while stack:
+            try:
+                node = stack[-1].send(value)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+                continue
+            value = None
+            if node:
+                try:
+                    handler = handlers[node.__class__]
+                except KeyError:
+                    handler = self._lookup(node.__class__)
+                value = handler(self, node)
+                if isinstance(value, GeneratorType):
+                    stack.append(value)
+                    value = None
+        return value
+
     def generic_visit(self, node):
         '''
         Method executed if no applicable visit_ method can be found.
         This examines the node to see if it has _fields, is a list,
         or can be further traversed.
         '''
-        for field in getattr(node, '_fields'):
-            value = getattr(node, field, None)
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, AST):
-                        self.visit(item)
-            elif isinstance(value, AST):
-                self.visit(value)
+        for child in iter_child_nodes(node):
+            self.visit(child)
+
+    def iter_generic_visit(self, node):
+        '''
+        Generator version of generic_visit() used if iterative is set.
+        '''
+        for child in iter_child_nodes(node):
+            yield child
+
+
+def iter_child_nodes(node):
+    '''
+    Yield the direct child nodes of a node (including the nodes in
+    fields holding lists of nodes).
+    '''
+    for value in node._field_values():
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, AST):
+                    yield item
+        elif isinstance(value, AST):
+            yield value
 
 
 # DO NOT MODIFY
@@ -259,18 +390,12 @@ def flatten(top):
     form (depth, node) where depth is an integer representing the
     parse tree depth and node is the associated AST node.
     '''
-
-    class Flattener(NodeVisitor):
-        def __init__(self):
-            self.depth = 0
-            self.nodes = []
-
-        def generic_visit(self, node):
-            self.nodes.append((self.depth, node))
-            self.depth += 1
-            NodeVisitor.generic_visit(self, node)
-            self.depth -= 1
-
-    d = Flattener()
-    d.visit(top)
-    return d.nodes
+    nodes = []
+    stack = [(0, top)] if top else []
+    while stack:
+        depth, node = stack.pop()
+        nodes.append((depth, node))
+        children = [(depth + 1, child) for child in iter_child_nodes(node) if child]
+        children.reverse()
+        stack.extend(children)
+    return nodes
@@ -0,0 +1,257 @@
+# gone/batch.py
+'''
+Batch Compiler
+==============
+The compile, run and interp programs handle a single file each and pay
+the start-up cost of Python, the parser and LLVM every time.  This
+program compiles many Gone files in one go:
+
+       python3 -m gone.batch [options] file-or-glob ...
+
+Arguments may be files, glob patterns (e.g., 'src/**/*.g') or
+directories (all .g files below them).  The files are distributed over
+a pool of worker processes.  Each worker sets up a lexer, a parser and
+an LLVM target machine once and reuses them for every file it gets.
+
+For each input file foo.g, one of the following is written (--emit):
+
+       ir     foo.ir   Intermediate code (one instruction per line)
+       ll     foo.ll   LLVM assembly
+       o      foo.o    Object code for the host (the default)
+
+Outputs go next to the inputs unless -o names a directory.  A line
+with the time taken (and any error messages) is printed for each file,
+followed by a summary.  The exit status is 1 if any file had errors.
+With --time-phases or --mem-phases, the time and memory taken by each
+phase of the compiler is reported for every file (see phases.py).
+'''
+
+import os
+import io
+import sys
+import glob
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from .errors import errors_reported, clear_errors
+from .phases import phase, record_phases, print_phases, add_arguments
+
+class BatchResult(object):
+    '''
+    The result of compiling one file.
+    '''
+    def __init__(self, filename, output=None, seconds=0.0, errors=(), phases=None):
+        self.filename = filename
+        self.output = output
+        self.seconds = seconds
+        self.errors = list(errors)
+        self.phases = phases
+
+    @property
+    def ok(self):
+        return not self.errors
+
+class BatchCompiler(object):
+    '''
+    Compiles files one after the other, reusing one lexer, parser and
+    LLVM target machine.  If phases is 'time' or 'memory', the phases
+    of each compilation are recorded in the result.
+    '''
+    def __init__(self, emit='o', optlevel=0, outdir=None, phases=None):
+        from .dfalex import DFALexer
+        from .parser import GoneParser
+
+        self.emit = emit
+        self.optlevel = optlevel
+        self.outdir = outdir
+        self.phases = phases
+        self.lexer = DFALexer()
+        self.parser = GoneParser()
+        self.target_machine = None
+        if emit == 'o':
+            from . import run
+            run.initialize()
+            self.target_machine = run.create_target_machine(optlevel)
+
+    def output_filename(self, filename):
+        base = os.path.splitext(filename)[0]
+        if self.outdir:
+            base = os.path.join(self.outdir, os.path.basename(base))
+        return '%s.%s' % (base, self.emit)
+
+    def compile_ircode(self, source):
+        from .checker import check_program
+        from .ircode import GenerateCode
+
+        with phase('parse'):
+            ast = self.parser.parse(self.lexer.tokenize(source))
+        if errors_reported():
+            return []
+        with phase('check'):
+            check_program(ast)
+        if errors_reported():
+            return []
+        gen = GenerateCode()
+        with phase('ircode'):
+            gen.visit(ast)
+        if self.optlevel > 0:
+            from .opt import optimize_code
+            with phase('opt'):
+                return optimize_code(gen.code)
+        return gen.code
+
+    def compile_llvm(self, source):
+        from .llvmgen import GenerateLLVM
+
+        code = self.compile_ircode(source)
+        if errors_reported():
+            return ''
+        generator = GenerateLLVM()
+        with phase('llvmgen'):
+            generator.generate_code(code)
+            return str(generator.module)
+
+    def compile_object(self, source):
+        import llvmlite.binding as llvm
+        from . import run
+
+        llvm_code = self.compile_llvm(source)
+        if errors_reported():
+            return b''
+        with phase('llvm parse'):
+            mod = llvm.parse_assembly(llvm_code)
+        with phase('llvm verify'):
+            mod.verify()
+        with phase('llvm opt'):
+            run.optimize(mod, self.target_machine, self.optlevel)
+        with phase('emit object'):
+            return self.target_machine.emit_object(mod)
+
+    def compile_source(self, source):
+        '''
+        Compile source to the kind of output given by self.emit.
+        '''
+        if self.emit == 'ir':
+            return ''.join('%s\n' % (instr,) for instr in self.compile_ircode(source))
+        elif self.emit == 'll':
+            return self.compile_llvm(source)
+        return self.compile_object(source)
+
+    def compile_file(self, filename):
+        '''
+        Compile a single file and write the output.  Return a BatchResult.
+        '''
+        clear_errors()
+        messages = io.StringIO()
+        start = time.perf_counter()
+        output = None
+        recorder = None
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stderr(messages))
+            if self.phases:
+                recorder = stack.enter_context(record_phases(self.phases == 'memory'))
+            try:
+                with open(filename) as f:
+                    source = f.read()
+                result = self.compile_source(source)
+                if not errors_reported():
+                    output = self.output_filename(filename)
+                    mode = 'wb' if isinstance(result, bytes) else 'w'
+                    with open(output, mode) as f:
+                        f.write(result)
+            except Exception as e:
+                print('%s: %s' % (type(e).__name__, e), file=sys.stderr)
+        errors = messages.getvalue().splitlines()
+        clear_errors()
+        return BatchResult(filename, output, time.perf_counter() - start, errors,
+                           recorder.as_dicts() if recorder else None)
+
+# The compiler of a worker process (see _init_worker())
+_compiler = None
+
+def _init_worker(emit, optlevel, outdir, phases):
+    global _compiler
+    _compiler = BatchCompiler(emit, optlevel, outdir, phases)
+
+def _compile_file(filename):
+    return _compiler.compile_file(filename)
+
+def find_sources(patterns):
+    '''
+    Expand a list of file names, glob patterns and directories into a
+    sorted list of file names (without duplicates).
+    '''
+    filenames = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*.g')
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.exists(pattern):
+            matches = [pattern]
+        filenames.update(name for name in matches if os.path.isfile(name))
+    return sorted(filenames)
+
+def compile_files(filenames, emit='o', optlevel=0, outdir=None, jobs=None, phases=None):
+    '''
+    Compile a list of files using a pool of jobs worker processes
+    (default: one per CPU).  Yields a BatchResult for each file (in
+    the order of filenames).
+    '''
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(filenames) <= 1:
+        compiler = BatchCompiler(emit, optlevel, outdir, phases)
+        for filename in filenames:
+            yield compiler.compile_file(filename)
+        return
+
+    chunksize = max(1, len(filenames) // (jobs * 8))
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(emit, optlevel, outdir, phases)) as pool:
+        yield from pool.map(_compile_file, filenames, chunksize=chunksize)
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.batch')
+    argparser.add_argument('sources', nargs='+', help='files, glob patterns or directories')
+    argparser.add_argument('--emit', choices=('ir', 'll', 'o'), default='o',
+                           help='kind of output to produce (default: o)')
+    argparser.add_argument('-o', dest='outdir', help='directory for the output files')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='optimization level (0-3)')
+    argparser.add_argument('-j', '--jobs', type=int, default=0,
+                           help='number of worker processes (default: one per CPU)')
+    argparser.add_argument('-q', '--quiet', action='store_true',
+                           help='only report files with errors')
+    add_arguments(argparser)
+    args = argparser.parse_args()
+
+    filenames = find_sources(args.sources)
+    if not filenames:
+        sys.stderr.write('No Gone source files found\n')
+        raise SystemExit(1)
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    phases = 'memory' if args.mem_phases else 'time' if args.time_phases else None
+    start = time.perf_counter()
+    failed = 0
+    for result in compile_files(filenames, args.emit, args.optlevel, args.outdir,
+                                args.jobs, phases):
+        if result.ok and args.quiet:
+            continue
+        status = 'ok' if result.ok else 'FAIL'
+        print('%-4s %8.3fs  %s' % (status, result.seconds, result.filename))
+        for message in result.errors:
+            print('         %s' % message)
+        if result.phases:
+            print_phases(result.phases, sys.stdout)
+        failed += not result.ok
+
+    print('%d files, %d failed, %.3fs' % (len(filenames), failed, time.perf_counter() - start))
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
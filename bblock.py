@@ -5,5 +5,478 @@ Project 7: Basic Blocks and Control Flow
 This file defines classes and functions for creating and navigating
 basic blocks.  You need to write all of the code needed yourself.
 Make sure you fully work Exercise 7 first.
+
+Code generation produces structured blocks: a BasicBlock, IfBlock or
+WhileBlock is linked to the block that follows it via next_block and
+the branches of if-statements and bodies of loops are chains of their
+own.  The ControlFlowGraph class at the end of this file turns that
+structure into an explicit graph and provides the analyses needed by
+optimizations:
+
+       cfg = ControlFlowGraph(func.start_block)
+       cfg.blocks              # Blocks in reverse postorder
+       cfg.idom                # Immediate dominators
+       cfg.frontiers           # Dominance frontiers
+       cfg.loops               # Natural loops (with nesting)
+       cfg.liveness()          # Live variables
+       cfg.reaching_definitions()
+
+Sets of blocks, names and definitions are represented as bitsets
+(Python integers) so the dataflow analyses scale to large functions.
 '''
 
+class Block(object):
+    '''
+    Base class for all blocks.  A block holds a list of instructions
+    and a link to the block that follows it.
+    '''
+    def __init__(self):
+        self.instructions = []   # Instructions in the block
+        self.next_block = None   # Link to the next block
+
+        # Control flow edges.  Filled in by ControlFlowGraph.
+        self.predecessors = []
+        self.successors = []
+
+    def append(self, instr):
+        self.instructions.append(instr)
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+class BasicBlock(Block):
+    '''
+    Class for a simple basic block.  Control flow unconditionally
+    flows to the next block.
+    '''
+    pass
+
+class IfBlock(Block):
+    '''
+    Class for a basic-block representing an if-else.  There are
+    two branches to handle each possibility.  The instructions of
+    the block compute the condition stored in testvar.
+    '''
+    def __init__(self):
+        super(IfBlock, self).__init__()
+        self.if_branch = None
+        self.else_branch = None
+        self.testvar = None
+
+class WhileBlock(Block):
+    '''
+    Class for a basic-block representing a while-loop.  The
+    instructions of the block compute the loop test in testvar and
+    are re-executed after every pass through the body.
+    '''
+    def __init__(self):
+        super(WhileBlock, self).__init__()
+        self.body = None
+        self.testvar = None
+
+class BlockVisitor(object):
+    '''
+    Class for visiting basic blocks.  Define a subclass and define
+    methods such as visit_BasicBlock or visit_IfBlock to implement
+    custom processing (similar to ASTs).  visit() follows the
+    next_block links so a whole chain of blocks is visited.
+    '''
+    def visit(self, block):
+        while block is not None:
+            name = 'visit_%s' % type(block).__name__
+            if hasattr(self, name):
+                getattr(self, name)(block)
+            block = block.next_block
+
+def all_blocks(start_block):
+    '''
+    Return a list of all blocks reachable from start_block, including
+    the branches of if-statements and the bodies of loops.
+    '''
+    class Collector(BlockVisitor):
+        def __init__(self):
+            self.blocks = []
+
+        def visit_BasicBlock(self, block):
+            self.blocks.append(block)
+
+        def visit_IfBlock(self, block):
+            self.blocks.append(block)
+            self.visit(block.if_branch)
+            self.visit(block.else_branch)
+
+        def visit_WhileBlock(self, block):
+            self.blocks.append(block)
+            self.visit(block.body)
+
+    collector = Collector()
+    collector.visit(start_block)
+    return collector.blocks
+
+# ----------------------------------------------------------------------
+# Control flow graphs
+# ----------------------------------------------------------------------
+
+def reads(instr):
+    '''
+    Return the names (temporaries or variables) read by an instruction.
+    '''
+    opcode = instr[0]
+    if opcode.startswith(('literal_', 'alloc_', 'global_', 'parm_', 'extern_')):
+        return ()
+    elif opcode.startswith('load_array_'):
+        return instr[1:3]
+    elif opcode.startswith('load_'):
+        return (instr[1],)
+    elif opcode.startswith('store_array_'):
+        # Storing an element updates (so also reads) the array
+        return instr[1:4]
+    elif opcode.startswith(('store_', 'print_', 'return_')):
+        return instr[1:2]
+    elif opcode == 'call_func':
+        return instr[2:-1]
+    elif opcode == 'jump':
+        return ()
+    elif opcode == 'cbranch':
+        return (instr[1],)
+    return instr[1:-1]
+
+def writes(instr):
+    '''
+    Return the names (temporaries or variables) written by an instruction.
+    '''
+    opcode = instr[0]
+    if opcode.startswith(('alloc_', 'global_', 'parm_')):
+        return (instr[1],)
+    elif opcode.startswith('store_'):
+        return (instr[2],)
+    elif (opcode.startswith(('print_', 'return_', 'extern_')) or
+          opcode in ('jump', 'cbranch', 'check_index')):
+        return ()
+    return (instr[-1],)
+
+def bits(bitset):
+    '''
+    Iterate over the positions of the bits set in a bitset.
+    '''
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+class Loop(object):
+    '''
+    A natural loop.  header is the index of the loop header block,
+    blocks is a bitset of the blocks in the loop, parent is the
+    enclosing loop (or None) and depth is the nesting depth (1 for an
+    outermost loop).
+    '''
+    def __init__(self, header, blocks, size):
+        self.header = header
+        self.blocks = blocks
+        self.size = size
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    def __contains__(self, index):
+        return bool(self.blocks >> index & 1)
+
+    def __repr__(self):
+        return '<Loop header=%d blocks=%s depth=%d>' % (self.header, list(bits(self.blocks)), self.depth)
+
+class ControlFlowGraph(object):
+    '''
+    Control flow graph of a function.  Blocks are identified by their
+    index in self.blocks which lists all reachable blocks in reverse
+    postorder (so the start block has index 0).  The graph is built from
+    the structured block links and the predecessors/successors lists of
+    every block are updated.  A block ending in a return instruction has
+    no successors.
+    '''
+    def __init__(self, start_block):
+        self.start_block = start_block
+        self.build_edges(start_block, None)
+        self.number_blocks(start_block)
+        self.preds = [[self.index[id(p)] for p in block.predecessors] for block in self.blocks]
+        self.succs = [[self.index[id(s)] for s in block.successors] for block in self.blocks]
+        self.compute_dominators()
+        self.compute_frontiers()
+        self.compute_loops()
+
+    def build_edges(self, start, follow):
+        '''
+        Create the edges for a chain of blocks.  follow is the block
+        where control goes after the last block of the chain.
+        '''
+        chains = [(start, follow)]
+        edges = []
+        while chains:
+            block, follow = chains.pop()
+            while block is not None:
+                after = block.next_block if block.next_block is not None else follow
+                block.predecessors = []
+                block.successors = []
+                if isinstance(block, IfBlock):
+                    edges.append((block, block.if_branch or after))
+                    edges.append((block, block.else_branch or after))
+                    chains.append((block.if_branch, after))
+                    chains.append((block.else_branch, after))
+                elif isinstance(block, WhileBlock):
+                    edges.append((block, block.body or block))
+                    edges.append((block, after))
+                    chains.append((block.body, block))
+                elif not (block.instructions and block.instructions[-1][0].startswith('return_')):
+                    edges.append((block, after))
+                block = block.next_block
+
+        for source, dest in edges:
+            if dest is not None and dest not in source.successors:
+                source.successors.append(dest)
+                dest.predecessors.append(source)
+
+    def number_blocks(self, start_block):
+        '''
+        Order the reachable blocks in reverse postorder using an
+        iterative depth first search.
+        '''
+        postorder = []
+        visited = { id(start_block) }
+        stack = [(start_block, iter(start_block.successors))]
+        while stack:
+            block, successors = stack[-1]
+            for succ in successors:
+                if id(succ) not in visited:
+                    visited.add(id(succ))
+                    stack.append((succ, iter(succ.successors)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(block)
+
+        self.blocks = postorder[::-1]
+        self.index = { id(block): n for n, block in enumerate(self.blocks) }
+
+        # Drop edges from unreachable blocks
+        for block in self.blocks:
+            block.predecessors = [p for p in block.predecessors if id(p) in self.index]
+
+    # Dominators
+
+    def compute_dominators(self):
+        '''
+        Compute immediate dominators using the iterative algorithm of
+        Cooper, Harvey and Kennedy.  self.idom[n] is the index of the
+        immediate dominator of block n (the start block dominates itself).
+        '''
+        idom = [None] * len(self.blocks)
+        idom[0] = 0
+
+        def intersect(b1, b2):
+            while b1 != b2:
+                while b1 > b2:
+                    b1 = idom[b1]
+                while b2 > b1:
+                    b2 = idom[b2]
+            return b1
+
+        changed = True
+        while changed:
+            changed = False
+            for n in range(1, len(self.blocks)):
+                new_idom = None
+                for p in self.preds[n]:
+                    if idom[p] is not None:
+                        new_idom = p if new_idom is None else intersect(p, new_idom)
+                if idom[n] != new_idom:
+                    idom[n] = new_idom
+                    changed = True
+
+        self.idom = idom
+        self.dom_children = [[] for _ in self.blocks]
+        for n in range(1, len(self.blocks)):
+            self.dom_children[idom[n]].append(n)
+
+    def dominates(self, a, b):
+        '''
+        Return True if block a dominates block b (both are indices)
+        '''
+        while b > a:
+            b = self.idom[b]
+        return a == b
+
+    def compute_frontiers(self):
+        '''
+        Compute the dominance frontier of every block as a bitset.
+        '''
+        frontiers = [0] * len(self.blocks)
+        for n, preds in enumerate(self.preds):
+            if len(preds) >= 2:
+                for p in preds:
+                    runner = p
+                    while runner != self.idom[n]:
+                        frontiers[runner] |= 1 << n
+                        runner = self.idom[runner]
+        self.frontiers = frontiers
+
+    # Loops
+
+    def compute_loops(self):
+        '''
+        Find the natural loops of the graph.  A back edge is an edge
+        whose destination (the loop header) dominates its source.
+        Loops sharing a header are merged.  self.loops is sorted from
+        outermost to innermost and self.loop_of[n] gives the innermost
+        loop containing block n (or None).
+        '''
+        bodies = {}
+        for n, succs in enumerate(self.succs):
+            for header in succs:
+                if self.dominates(header, n):
+                    body = bodies.setdefault(header, { header })
+                    stack = [n]
+                    while stack:
+                        m = stack.pop()
+                        if m not in body:
+                            body.add(m)
+                            stack.extend(self.preds[m])
+
+        loops = []
+        for header, body in bodies.items():
+            blocks = 0
+            for n in body:
+                blocks |= 1 << n
+            loops.append(Loop(header, blocks, len(body)))
+
+        # Visit loops from largest to smallest.  The innermost loop seen so
+        # far that contains the header of a loop is its parent.
+        loops.sort(key=lambda loop: loop.size, reverse=True)
+        self.loop_of = [None] * len(self.blocks)
+        for loop in loops:
+            outer = self.loop_of[loop.header]
+            if outer is not None:
+                loop.parent = outer
+                loop.depth = outer.depth + 1
+                outer.children.append(loop)
+            for n in bodies[loop.header]:
+                self.loop_of[n] = loop
+        self.loops = loops
+
+    def loop_depth(self, n):
+        loop = self.loop_of[n]
+        return loop.depth if loop else 0
+
+    # Dataflow analysis
+
+    def number_names(self):
+        '''
+        Assign a bit number to every name used in the function
+        '''
+        self.names = []
+        self.name_index = {}
+        for block in self.blocks:
+            for instr in block.instructions:
+                for name in reads(instr) + writes(instr):
+                    if name not in self.name_index:
+                        self.name_index[name] = len(self.names)
+                        self.names.append(name)
+            testvar = getattr(block, 'testvar', None)
+            if testvar is not None and testvar not in self.name_index:
+                self.name_index[testvar] = len(self.names)
+                self.names.append(testvar)
+
+    def names_of(self, bitset):
+        '''
+        Convert a bitset of names into a set of names
+        '''
+        return { self.names[n] for n in bits(bitset) }
+
+    def liveness(self):
+        '''
+        Compute the names live on entry to and exit from each block.
+        Returns a pair of lists (live_in, live_out) of bitsets indexed by
+        block.  Use names_of() to decode a bitset.
+        '''
+        self.number_names()
+        index = self.name_index
+        use = [0] * len(self.blocks)
+        defs = [0] * len(self.blocks)
+        for n, block in enumerate(self.blocks):
+            u = d = 0
+            for instr in block.instructions:
+                for name in reads(instr):
+                    bit = 1 << index[name]
+                    if not d & bit:
+                        u |= bit
+                for name in writes(instr):
+                    d |= 1 << index[name]
+            testvar = getattr(block, 'testvar', None)
+            if testvar is not None and not d >> index[testvar] & 1:
+                u |= 1 << index[testvar]
+            use[n] = u
+            defs[n] = d
+
+        live_in = [0] * len(self.blocks)
+        live_out = [0] * len(self.blocks)
+        changed = True
+        while changed:
+            changed = False
+            for n in reversed(range(len(self.blocks))):
+                out = 0
+                for s in self.succs[n]:
+                    out |= live_in[s]
+                new_in = use[n] | (out & ~defs[n])
+                if out != live_out[n] or new_in != live_in[n]:
+                    live_out[n] = out
+                    live_in[n] = new_in
+                    changed = True
+
+        self.live_in = live_in
+        self.live_out = live_out
+        return live_in, live_out
+
+    def reaching_definitions(self):
+        '''
+        Compute the definitions reaching the entry and exit of each
+        block.  Definitions are numbered in self.definitions, a list
+        of tuples (block index, instruction index, name).  Returns a
+        pair of lists (reach_in, reach_out) of bitsets of definitions.
+        '''
+        self.definitions = []
+        defs_of = {}
+        gen = [0] * len(self.blocks)
+        for n, block in enumerate(self.blocks):
+            last = {}
+            for i, instr in enumerate(block.instructions):
+                for name in writes(instr):
+                    d = len(self.definitions)
+                    self.definitions.append((n, i, name))
+                    defs_of[name] = defs_of.get(name, 0) | (1 << d)
+                    last[name] = d
+            for d in last.values():
+                gen[n] |= 1 << d
+
+        kill = [0] * len(self.blocks)
+        for n in range(len(self.blocks)):
+            for d in bits(gen[n]):
+                kill[n] |= defs_of[self.definitions[d][2]]
+            kill[n] &= ~gen[n]
+
+        reach_in = [0] * len(self.blocks)
+        reach_out = list(gen)
+        changed = True
+        while changed:
+            changed = False
+            for n in range(len(self.blocks)):
+                rin = 0
+                for p in self.preds[n]:
+                    rin |= reach_out[p]
+                rout = gen[n] | (rin & ~kill[n])
+                if rin != reach_in[n] or rout != reach_out[n]:
+                    reach_in[n] = rin
+                    reach_out[n] = rout
+                    changed = True
+
+        self.reach_in = reach_in
+        self.reach_out = reach_out
+        return reach_in, reach_out
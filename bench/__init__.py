@@ -0,0 +1,12 @@
+# gone/bench/__init__.py
+'''
+Benchmarks for the Gone compiler.  Each module in this package can be
+run as a program, for example:
+
+       python3 -m gone.bench.astnodes
+
+The suite module times every phase of the compiler and both backends
+on the programs in programs.py and saves the results as JSON:
+
+       python3 -m gone.bench.suite -o results.json
+'''
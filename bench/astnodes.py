@@ -0,0 +1,142 @@
+# gone/bench/astnodes.py
+'''
+Benchmark of the AST node representation.
+
+Parses a large generated program twice: once building the slotted
+nodes of gone.ast and once building equivalent "legacy" nodes that
+store their fields in a per-instance __dict__ (the representation used
+before the nodes had __slots__).  Reports parse time and memory per
+node for both, right after parsing and after setting the type and
+gen_location attributes like the checker and code generator do.
+
+       python3 -m gone.bench.astnodes [-n STATEMENTS]
+'''
+
+import gc
+import time
+import tracemalloc
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+from .. import ast
+from .. import parser
+from ..dfalex import DFALexer
+
+def generate_program(nstatements):
+    '''
+    Generate a straight-line Gone program with the given number of
+    statements.
+    '''
+    lines = ['var x int = 1;', 'var y float = 2.5;']
+    for n in range(nstatements):
+        lines.append('x = (x + %d) * 3 - -x / 7;' % n)
+        lines.append('print y * %d.5 + 1.0;' % n)
+    return '\n'.join(lines) + '\n'
+
+class LegacyAST(object):
+    '''
+    Node representation without __slots__.
+    '''
+    _fields = []
+
+    def __init__(self, *args, **kwargs):
+        assert len(args) == len(self._fields)
+        for name, value in zip(self._fields, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+def legacy_classes():
+    '''
+    Return a dict mapping the names of the node classes in gone.ast to
+    equivalent LegacyAST subclasses.
+    '''
+    classes = {}
+    for name, cls in vars(ast).items():
+        if isinstance(cls, type) and issubclass(cls, ast.AST) and cls is not ast.AST:
+            namespace = { key: value for key, value in vars(cls).items()
+                          if key not in ('__init__', '__slots__', '__dict__', '__weakref__')
+                          and not isinstance(value, type(ast.AST.lineno)) }
+            classes[name] = type(name, (LegacyAST,), namespace)
+    return classes
+
+@contextmanager
+def node_classes(classes):
+    '''
+    Temporarily make the parser build nodes of the given classes.  The
+    parser creates nodes through the namespace GoneParser.nodes.
+    '''
+    saved = parser.GoneParser.nodes
+    namespace = dict(vars(saved))
+    namespace.update(classes)
+    parser.GoneParser.nodes = SimpleNamespace(**namespace)
+    try:
+        yield
+    finally:
+        parser.GoneParser.nodes = saved
+
+def walk(tree):
+    '''
+    Yield the nodes of a tree of either representation.
+    '''
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif hasattr(node, '_fields'):
+            yield node
+            stack.extend(getattr(node, field) for field in node._fields)
+
+def annotate(tree):
+    '''
+    Set the attributes that the checker and code generator add to nodes.
+    '''
+    for node in walk(tree):
+        node.type = 'int'
+        node.gen_location = '__int_0'
+
+def measure(source):
+    '''
+    Parse source.  Return (seconds, bytes per node after parsing,
+    bytes per node after annotation, number of nodes).
+    '''
+    gc.collect()
+    start = time.perf_counter()
+    parser.GoneParser().parse(DFALexer().tokenize(source))
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    tree = parser.GoneParser().parse(DFALexer().tokenize(source))
+    parsed, _ = tracemalloc.get_traced_memory()
+    annotate(tree)
+    annotated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(1 for node in walk(tree))
+    return elapsed, parsed / count, annotated / count, count
+
+def run(nstatements):
+    source = generate_program(nstatements)
+    results = {}
+    with node_classes(legacy_classes()):
+        results['dict'] = measure(source)
+    results['slots'] = measure(source)
+    return results
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.bench.astnodes')
+    argparser.add_argument('-n', dest='nstatements', type=int, default=20000,
+                           help='number of generated statement pairs')
+    args = argparser.parse_args()
+
+    results = run(args.nstatements)
+    print('%-8s %10s %12s %12s %10s' % ('nodes', 'parse(s)', 'bytes/node', 'annotated', 'count'))
+    for name, (elapsed, parsed, annotated, count) in results.items():
+        print('%-8s %10.3f %12.1f %12.1f %10d' % (name, elapsed, parsed, annotated, count))
+
+if __name__ == '__main__':
+    main()
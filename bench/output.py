@@ -0,0 +1,167 @@
+# gone/bench/output.py
+'''
+Benchmark of program output.
+
+Measures how many lines per second a program printing integers and
+floats in a loop can produce with
+
+       interp print      The interpreter calling print() for every value
+       interp buffered   The interpreter writing to its OutputBuffer
+       jit printf        JIT-compiled code calling printf() per value
+       jit buffered      JIT-compiled code calling the runtime (gonert.c)
+
+Output goes to /dev/null, so only the cost of formatting and writing
+it is measured.
+
+       python3 -m gone.bench.output [-n LINES]
+'''
+
+import time
+import ctypes
+
+from .suite import discard_output
+from ..interp import CompiledInterpreter
+
+def loop_code(nlines):
+    '''
+    Linked intermediate code for a loop printing nlines values
+    (alternately integers and floats).
+    '''
+    return [
+        ('alloc_int', 'i'),
+        ('literal_int', 0, 'zero'),
+        ('store_int', 'zero', 'i'),
+        ('literal_int', 1, 'one'),
+        ('literal_int', nlines // 2, 'count'),
+        ('literal_float', 0.25, 'step'),
+        # 6: loop test
+        ('load_int', 'i', 't0'),
+        ('lt_int', 't0', 'count', 't1'),
+        ('cbranch', 't1', 9, 15),
+        # 9: loop body
+        ('print_int', 't0'),
+        ('mul_float', 'step', 'step', 't2'),
+        ('print_float', 't2'),
+        ('add_int', 't0', 'one', 't3'),
+        ('store_int', 't3', 'i'),
+        ('jump', 6),
+        # 15: end
+        ('return_void',),
+    ]
+
+class _Function(object):
+    def __init__(self, name):
+        self.name = name
+
+class PrintInterpreter(CompiledInterpreter):
+    '''
+    The interpreter as it was before output was buffered.
+    '''
+    def compile_print_int(self, next_pc, source):
+        source = self.slot(source)
+        def run(regs):
+            print(regs[source])
+            return next_pc
+        return run
+
+    compile_print_float = compile_print_int
+
+def bench_interp(nlines, interpreter_class):
+    interpreter = interpreter_class()
+    interpreter.register_functions([(_Function('main'), loop_code(nlines))])
+    with discard_output():
+        start = time.perf_counter()
+        interpreter.execute_function('main', [])
+        interpreter.output.flush()
+        return time.perf_counter() - start
+
+def loop_module(nlines, use_printf):
+    '''
+    Return an LLVM module with a main() function printing nlines values
+    through the runtime (or through printf() if use_printf is true).
+    '''
+    from llvmlite.ir import (Module, Function, FunctionType, IntType, DoubleType,
+                             VoidType, PointerType, Constant, GlobalVariable,
+                             ArrayType, IRBuilder)
+
+    int_type, float_type, void_type = IntType(32), DoubleType(), VoidType()
+    module = Module('output')
+    main = Function(module, FunctionType(void_type, []), name='main')
+    entry = main.append_basic_block('entry')
+    loop = main.append_basic_block('loop')
+    done = main.append_basic_block('done')
+
+    builder = IRBuilder(entry)
+    builder.branch(loop)
+    builder.position_at_end(loop)
+    i = builder.phi(int_type)
+    i.add_incoming(Constant(int_type, 0), entry)
+    x = builder.fmul(Constant(float_type, 0.25), Constant(float_type, 0.25))
+
+    if use_printf:
+        printf = Function(module, FunctionType(int_type, [PointerType(IntType(8))], var_arg=True),
+                          name='printf')
+        def format_string(name, text):
+            data = bytearray(text.encode('ascii') + b'\0')
+            var = GlobalVariable(module, ArrayType(IntType(8), len(data)), name)
+            var.global_constant = True
+            var.initializer = Constant(var.type.pointee, data)
+            return builder.bitcast(var, PointerType(IntType(8)))
+        builder.call(printf, [format_string('int_format', '%i\n'), i])
+        builder.call(printf, [format_string('float_format', '%f\n'), x])
+    else:
+        print_int = Function(module, FunctionType(void_type, [int_type]), name='_print_int')
+        print_float = Function(module, FunctionType(void_type, [float_type]), name='_print_float')
+        builder.call(print_int, [i])
+        builder.call(print_float, [x])
+
+    following = builder.add(i, Constant(int_type, 1))
+    i.add_incoming(following, loop)
+    builder.cbranch(builder.icmp_signed('<', following, Constant(int_type, nlines // 2)),
+                    loop, done)
+    builder.position_at_end(done)
+    builder.ret_void()
+    return str(module)
+
+def bench_jit(nlines, use_printf):
+    import llvmlite.binding as llvm
+    from .. import run
+
+    run.load_runtime()
+    run.initialize()
+    target_machine = run.create_target_machine(host=True)
+    mod = llvm.parse_assembly(loop_module(nlines, use_printf))
+    mod.verify()
+    engine = llvm.create_mcjit_compiler(mod, target_machine)
+    main_func = ctypes.CFUNCTYPE(None)(engine.get_function_address('main'))
+    with discard_output():
+        start = time.perf_counter()
+        main_func()
+        run.flush_output()
+        return time.perf_counter() - start
+
+def run_benchmarks(nlines):
+    '''
+    Return a dict mapping the name of each variant to lines per second.
+    '''
+    variants = {
+        'interp print': lambda: bench_interp(nlines, PrintInterpreter),
+        'interp buffered': lambda: bench_interp(nlines, CompiledInterpreter),
+        'jit printf': lambda: bench_jit(nlines, True),
+        'jit buffered': lambda: bench_jit(nlines, False),
+    }
+    return { name: nlines / bench() for name, bench in variants.items() }
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.bench.output')
+    argparser.add_argument('-n', dest='nlines', type=int, default=1000000,
+                           help='number of lines to print')
+    args = argparser.parse_args()
+
+    for name, rate in run_benchmarks(args.nlines).items():
+        print('%-16s %14.0f lines/s' % (name, rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# gone/bench/programs.py
+'''
+Representative Gone programs for the benchmark suite.
+
+Each program is produced by a generator function taking a size
+parameter so the same shapes can be benchmarked at different scales.
+The language has no loops or function definitions yet, so loops are
+unrolled and recursion is expanded into the expression it evaluates:
+
+       numeric        Unrolled integer loop (arithmetic on each index)
+       fib            fib(n) expanded into a tree of additions
+       strings        Concatenation of string literals
+       straightline   Large generated straight-line program
+       nesting        A single deeply nested expression
+       arrays         Unrolled loops filling and summing an array
+
+PROGRAMS maps each name to (generator, default size).
+'''
+
+def numeric(n):
+    '''
+    The body of "for i in range(n): print i * i + 3 * i - (i % 11) / 7"
+    unrolled n times.
+    '''
+    return ''.join('print %d * %d + 3 * %d - %d / 7;\n' % (i, i, i, i % 11)
+                   for i in range(n))
+
+def fib(n):
+    '''
+    Print fib(1) ... fib(n) where fib(k) is written out as the
+    additions made by the recursive definition.
+    '''
+    exprs = ['0', '1']
+    for k in range(2, n + 1):
+        exprs.append('(%s + %s)' % (exprs[k-1], exprs[k-2]))
+    return ''.join('print %s;\n' % expr for expr in exprs[1:])
+
+def strings(n):
+    '''
+    n statements each concatenating ten string literals.
+    '''
+    words = ['"%s"' % word for word in 'the quick brown fox jumps over the lazy gone dog'.split()]
+    return ''.join('print %s;\n' % ' + '.join(words[i % 10:] + words[:i % 10])
+                   for i in range(n))
+
+def straightline(n):
+    '''
+    n independent integer statements.
+    '''
+    return ''.join('print %d + -%d + (%d + %d);\n' % (i, i % 7, i * 3, i % 5)
+                   for i in range(n))
+
+def nesting(depth):
+    '''
+    print -(1 + -(2 + -(3 + ... ))) nested depth levels deep.
+    '''
+    return 'print %s%d%s;\n' % (''.join('-(%d + ' % i for i in range(depth)),
+                                 depth, ')' * depth)
+
+def arrays(n):
+    '''
+    "for i in range(n): a[i] = i + i" followed by a running sum of the
+    elements, unrolled.
+    '''
+    lines = ['var a int[%d];\nvar total int;\n' % n]
+    lines.extend('a[%d] = %d + %d;\n' % (i, i, i) for i in range(n))
+    lines.extend('total = total + a[%d];\n' % i for i in range(n))
+    lines.append('print total;\n')
+    return ''.join(lines)
+
+PROGRAMS = {
+    'numeric': (numeric, 2000),
+    'fib': (fib, 18),
+    'strings': (strings, 2000),
+    'straightline': (straightline, 10000),
+    'nesting': (nesting, 1000),
+    'arrays': (arrays, 2000),
+}
@@ -0,0 +1,240 @@
+# gone/bench/suite.py
+'''
+Benchmark suite for the Gone toolchain.
+
+Compiles and runs each program of gone.bench.programs with the
+interpreter (interp) and the LLVM JIT (run) backends and times every
+phase on the way:
+
+       lex, parse, check, ircode              (both backends)
+       interp setup, execute                  (interp)
+       llvmgen, llvm parse, llvm verify,
+       llvm opt, jit, execute                 (run)
+
+Each program is run --repeat times and the fastest time of each phase
+is kept.  Program output is discarded.  The results are printed and
+can be saved as JSON (-o) to be compared with a later run (--compare):
+
+       python3 -m gone.bench.suite -o before.json
+       ... change the compiler ...
+       python3 -m gone.bench.suite --compare before.json
+
+A backend that can't handle a program (e.g., the LLVM backend doesn't
+implement float operations yet) gets an error entry instead of timings.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+
+from .programs import PROGRAMS
+from ..phases import phase, record_phases
+from ..errors import errors_reported, clear_errors
+
+BACKENDS = ('interp', 'run')
+
+# Phases slower than this (relative to the baseline) are flagged by --compare
+THRESHOLD = 1.10
+
+@contextlib.contextmanager
+def discard_output():
+    '''
+    Send anything written to stdout (by Python or by the C runtime) to
+    /dev/null.
+    '''
+    from ..run import flush_output
+
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            yield
+    finally:
+        flush_output()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+def compile_ircode(source):
+    '''
+    Run the front end with each phase timed separately.
+    '''
+    from ..parser import GoneParser
+    from ..tokenizer import GoneLexer
+    from ..checker import check_program
+    from ..ircode import GenerateCode
+
+    with phase('lex'):
+        tokens = list(GoneLexer().tokenize(source))
+    with phase('parse'):
+        tree = GoneParser().parse(iter(tokens))
+    with phase('check'):
+        check_program(tree)
+    if errors_reported():
+        raise RuntimeError('%d errors in program' % errors_reported())
+    gen = GenerateCode()
+    with phase('ircode'):
+        gen.visit(tree)
+    return gen.code
+
+class _Function(object):
+    # Before functions are implemented (Projects 7/8), the intermediate
+    # code is a flat list that is run as the body of main()
+    def __init__(self, name):
+        self.name = name
+
+def run_interp(code):
+    from ..interp import CompiledInterpreter
+
+    with phase('interp setup'):
+        interpreter = CompiledInterpreter()
+        interpreter.register_functions([(_Function('main'), code)])
+    with phase('execute'), discard_output():
+        interpreter.execute_function('main', [])
+
+def run_llvm(code, optlevel):
+    import ctypes
+    import llvmlite.binding as llvm
+    from .. import run
+    from ..llvmgen import GenerateLLVM
+
+    generator = GenerateLLVM()
+    missing = sorted({ instr[0] for instr in code if not hasattr(generator, 'emit_' + instr[0]) })
+    if missing:
+        raise NotImplementedError('no LLVM code generation for %s' % ', '.join(missing))
+    with phase('llvmgen'):
+        generator.generate_code(code)
+        llvm_ir = str(generator.module)
+    run.load_runtime()
+    run.initialize()
+    target_machine = run.create_target_machine(optlevel, host=True)
+    with phase('llvm parse'):
+        mod = llvm.parse_assembly(llvm_ir)
+    with phase('llvm verify'):
+        mod.verify()
+    with phase('llvm opt'):
+        run.optimize(mod, target_machine, optlevel)
+    with phase('jit'):
+        engine = llvm.create_mcjit_compiler(mod, target_machine)
+        main_func = ctypes.CFUNCTYPE(None)(engine.get_function_address('main'))
+    with phase('execute'), discard_output():
+        main_func()
+
+def run_once(source, backend, optlevel):
+    '''
+    Compile and run source once.  Return a dict mapping phase names to
+    seconds.
+    '''
+    clear_errors()
+    with record_phases() as recorder:
+        code = compile_ircode(source)
+        if backend == 'interp':
+            run_interp(code)
+        else:
+            run_llvm(code, optlevel)
+    return { stats['name']: stats['wall'] for stats in recorder.as_dicts() }
+
+def run_benchmark(source, backend, repeat=3, optlevel=0):
+    '''
+    Benchmark one program on one backend.  Returns a dict with the
+    fastest time of each phase ('phases') and their sum ('total') or
+    with an 'error' message.
+    '''
+    best = {}
+    try:
+        for _ in range(repeat):
+            for name, seconds in run_once(source, backend, optlevel).items():
+                best[name] = min(seconds, best.get(name, seconds))
+    except Exception as e:
+        return { 'error': '%s: %s' % (type(e).__name__, e) }
+    finally:
+        clear_errors()
+    return { 'phases': best, 'total': sum(best.values()) }
+
+def run_suite(names=None, backends=BACKENDS, repeat=3, optlevel=0, scale=1.0):
+    '''
+    Run the benchmarks and return the results as a JSON-serializable dict.
+    '''
+    from ..cache import compiler_version
+
+    results = {}
+    for name in names or PROGRAMS:
+        generate, size = PROGRAMS[name]
+        source = generate(max(1, int(size * scale)))
+        results[name] = { backend: run_benchmark(source, backend, repeat, optlevel)
+                          for backend in backends }
+    return {
+        'compiler_version': compiler_version(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'optlevel': optlevel,
+        'scale': scale,
+        'results': results,
+    }
+
+def print_results(data, baseline=None, file=None):
+    '''
+    Print a table of results.  If a baseline (the results of an earlier
+    run) is given, show the change of each phase relative to it.
+    '''
+    file = file or sys.stdout
+    for name, backends in data['results'].items():
+        for backend, result in backends.items():
+            print('%s (%s)' % (name, backend), file=file)
+            if 'error' in result:
+                print('    error: %s' % result['error'], file=file)
+                continue
+            old = {}
+            if baseline:
+                old = baseline['results'].get(name, {}).get(backend, {})
+            old_phases = dict(old.get('phases', {}), total=old.get('total'))
+            for phase_name, seconds in list(result['phases'].items()) + [('total', result['total'])]:
+                line = '    %-14s %10.4fs' % (phase_name, seconds)
+                before = old_phases.get(phase_name)
+                if before:
+                    ratio = seconds / before
+                    line += '  %6.2fx%s' % (ratio, '  SLOWER' if ratio > THRESHOLD else '')
+                print(line, file=file)
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.bench.suite')
+    argparser.add_argument('programs', nargs='*',
+                           help='programs to run (default: all of %s)' % ', '.join(PROGRAMS))
+    argparser.add_argument('-b', '--backend', action='append', choices=BACKENDS,
+                           help='backend to benchmark (default: all)')
+    argparser.add_argument('-r', '--repeat', type=int, default=3,
+                           help='number of runs of each benchmark (default: 3)')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='LLVM optimization level (0-3)')
+    argparser.add_argument('-s', '--scale', type=float, default=1.0,
+                           help='scale the size of the programs by this factor')
+    argparser.add_argument('-o', '--output', help='save the results to this JSON file')
+    argparser.add_argument('--compare', metavar='JSON',
+                           help='compare with results saved by an earlier run')
+    args = argparser.parse_args()
+    for name in args.programs:
+        if name not in PROGRAMS:
+            argparser.error('unknown program %r' % name)
+
+    data = run_suite(args.programs, args.backend or BACKENDS, args.repeat,
+                     args.optlevel, args.scale)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(data, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+if __name__ == '__main__':
+    main()
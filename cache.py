@@ -0,0 +1,147 @@
+# gone/cache.py
+'''
+Compilation Cache
+=================
+Running a Gone program normally lexes, parses, checks and generates
+code from scratch every time.  This file implements a persistent,
+content-addressed cache for the results of the compiler so that
+re-running an unchanged program skips the entire front end.
+
+Entries are keyed by a hash of the source text, the kind of result
+being stored (e.g., 'ir' for the intermediate code of compile_ircode()
+or 'll' for the LLVM text of compile_llvm()), any extra options that
+affect the result and the version of the compiler itself.  The compiler
+version is a hash of the compiler's own source files so the cache is
+automatically invalidated whenever the compiler changes.
+
+Results are stored under the directory given by the GONE_CACHE_DIR
+environment variable (default ~/.cache/gone).  Setting GONE_CACHE=0
+turns the cache off.  Typical use looks like this:
+
+       cache = CompilationCache()
+       code = cache.cached('ir', source, compile_ircode)
+'''
+
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import tempfile
+
+_path = os.path.dirname(os.path.abspath(__file__))
+
+_version = None
+
+def compiler_version():
+    '''
+    Return a hash identifying the version of the compiler.
+    '''
+    global _version
+    if _version is None:
+        h = hashlib.sha256(sys.version.encode('utf-8'))
+        for filename in sorted(glob.glob(os.path.join(_path, '*.py'))):
+            with open(filename, 'rb') as f:
+                h.update(f.read())
+        _version = h.hexdigest()
+    return _version
+
+def default_directory():
+    return os.environ.get('GONE_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'gone'))
+
+def cache_enabled():
+    return os.environ.get('GONE_CACHE', '1') != '0'
+
+class CompilationCache(object):
+    '''
+    A directory of cached compiler results.  Values stored with put()
+    are pickled unless they are already str or bytes.
+    '''
+    def __init__(self, directory=None):
+        self.directory = directory or default_directory()
+
+    def key(self, kind, source, *options):
+        '''
+        Compute the cache key for a result of a given kind.
+        '''
+        h = hashlib.sha256()
+        for part in (compiler_version(), kind, repr(options), source):
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            h.update(part)
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def filename(self, kind, key):
+        return os.path.join(self.directory, key[:2], '%s.%s' % (key, kind))
+
+    def get(self, kind, source, *options):
+        '''
+        Return a cached value or None if there is none.
+        '''
+        filename = self.filename(kind, self.key(kind, source, *options))
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        tag, data = data[:1], data[1:]
+        if tag == b's':
+            return data.decode('utf-8')
+        elif tag == b'b':
+            return data
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def put(self, kind, source, value, *options):
+        '''
+        Store a value in the cache.  The file is written atomically so
+        that concurrent compilers never see a partial entry.
+        '''
+        if isinstance(value, str):
+            data = b's' + value.encode('utf-8')
+        elif isinstance(value, bytes):
+            data = b'b' + value
+        else:
+            data = b'p' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        filename = self.filename(kind, self.key(kind, source, *options))
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmpname, filename)
+        except OSError:
+            # The cache is only an optimization.  Never fail because of it.
+            pass
+
+    def cached(self, kind, source, compile_func, *options):
+        '''
+        Return the cached result of compile_func(source) if there is
+        one.  Otherwise, call it and cache the result if no errors
+        were reported.
+        '''
+        from .errors import errors_reported
+
+        value = self.get(kind, source, *options)
+        if value is None:
+            value = compile_func(source)
+            if not errors_reported():
+                self.put(kind, source, value, *options)
+        return value
+
+def cached_compile(kind, source, compile_func, *options):
+    '''
+    Run compile_func(source) through the default cache unless caching
+    has been turned off with GONE_CACHE=0.
+    '''
+    from .phases import phase
+
+    with phase('compile'):
+        if not cache_enabled():
+            return compile_func(source)
+        return CompilationCache().cached(kind, source, compile_func, *options)
@@ -95,6 +95,21 @@ that need to be checked:
         a = 37;        // OK
         b = 37;        // Error. b is const
 
+7.  Arrays.
+
+    Arrays have a fixed size given by a positive integer constant and
+    hold ints or floats.  They can only be used by indexing them with
+    an int.  Indices known at compile time must be within the array.
+
+        const n = 10;
+        var a int[n];
+        var b float[4];
+
+        a[2] = 5;        // OK
+        b[0] = a[2];     // Error. float = int
+        a = 3;           // Error. a is an array
+        a[10] = 1;       // Error. Index out of range
+
 Implementation Strategy:
 ------------------------
 You're going to use the NodeVisitor class defined in gone/ast.py to
@@ -173,7 +188,14 @@ fumble around a bit at first.
 
 from .errors import error
 from .ast import *
-from .typesys import check_binop, check_unaryop, error_type, builtin_types, _supported_binops, _supported_unaryops
+from .typesys import (check_binop, check_unaryop, error_type, builtin_types, array_element_types,
+                      _supported_binops, _supported_unaryops)
+
+def is_array(sym):
+    '''
+    Return True if a symbol table entry is the declaration of an array.
+    '''
+    return isinstance(sym, VarDeclaration) and isinstance(sym.typename, ArrayType)
 
 
 class SymbolTable(object):
@@ -207,7 +229,7 @@ class CheckProgramVisitor(NodeVisitor):
         # 2. Set the result type 
         #
         # Hint: Use the check_unaryop() function in typesys.py
-        self.visit(node.expr)
+        yield node.expr
         op = (node.op, node.expr.type)
         node.type = _supported_unaryops.get(op, error_type)
 
@@ -219,15 +241,15 @@ class CheckProgramVisitor(NodeVisitor):
         # Hint: Use the check_binop() function in typesys.py
         # print('visit_Binop:', node)
 
-        self.visit(node.left)
-        self.visit(node.right)
-        if node.left.type != node.right.type:
-            error(node.lineno, 'Type Error: Left and right operands do not have the same type')
-            node.type = error_type
+        yield node.left
+        yield node.right
 
-        # check if operation is supported
+        # check if operation is supported.  Operands of different types
+        # are only allowed by a few operations (such as string * int)
         op = (node.left.type, node.op, node.right.type)
         node.type = _supported_binops.get(op, error_type)
+        if node.type is error_type and node.left.type != node.right.type:
+            error(node.lineno, 'Type Error: Left and right operands do not have the same type')
 
     def visit_AssignmentStatement(self, node):
         # 1. Make sure the location of the assignment is defined
@@ -236,6 +258,9 @@ class CheckProgramVisitor(NodeVisitor):
         self.visit(node.store_location)
         if node.expr:
             self.visit(node.expr)
+            if (node.store_location.type != node.expr.type and
+                        error_type not in (node.store_location.type, node.expr.type)):
+                error(node.lineno, 'Type error %s = %s' % (node.store_location.type, node.expr.type))
 
     def visit_ConstDeclaration(self, node):
         # 1. Check that the constant name is not already defined
@@ -255,7 +280,9 @@ class CheckProgramVisitor(NodeVisitor):
         # 3. Check that the type of the expression (if any) is the same
         self.visit(node.typename)
         node.type = node.typename.type
-        if node.expr:
+        if node.expr and isinstance(node.typename, ArrayType):
+            error(node.lineno, 'Arrays can not be initialized')
+        elif node.expr:
             self.visit(node.expr)
             if (node.expr.type != node.type and
                         node.expr.type != error_type):
@@ -276,12 +303,69 @@ class CheckProgramVisitor(NodeVisitor):
             error(node.lineno, '%s is not defined' % node.name)
             node.type = error_type
 
+    def visit_ArrayType(self, node):
+        # 1. Make sure the element type is valid
+        # 2. Make sure the size is a positive integer constant
+        self.visit(node.typename)
+        node.type = node.typename.type
+        if node.type is not error_type and node.type not in array_element_types:
+            error(node.lineno, 'Arrays of %s are not supported' % node.type)
+            node.type = error_type
+
+        self.visit(node.size)
+        node.length = self.constant_value(node.size)
+        if node.size.type != 'int' or node.length is None:
+            error(node.lineno, 'Array size must be an integer constant')
+            node.type = error_type
+        elif node.length <= 0:
+            error(node.lineno, 'Array size must be positive')
+            node.type = error_type
+
+    def constant_value(self, node):
+        # Return the value of an expression that is a literal or the
+        # name of a constant defined by one (None for anything else)
+        if isinstance(node, Literal):
+            return node.value
+        if isinstance(node, LoadVariable) and isinstance(node.sym, ConstDeclaration):
+            return self.constant_value(node.sym.expr)
+        return None
+
+    def check_array(self, node):
+        # Common checks of LoadArray and StoreArray.  Returns the symbol
+        sym = self._symbol_table.get(node.name)
+        self.visit(node.index)
+        if not sym:
+            error(node.lineno, '%s undefined' % node.name)
+            node.type = error_type
+        elif not is_array(sym):
+            error(node.lineno, '%s is not an array' % node.name)
+            node.type = error_type
+        else:
+            node.type = sym.type
+            if node.index.type not in ('int', error_type):
+                error(node.lineno, 'Type error. Array index must be int')
+            index = self.constant_value(node.index)
+            length = sym.typename.length
+            if index is not None and length is not None and not 0 <= index < length:
+                error(node.lineno, 'Index %d out of range for %s (size %d)' % (index, node.name, length))
+        node.sym = sym
+        return sym
+
+    def visit_LoadArray(self, node):
+        self.check_array(node)
+
+    def visit_StoreArray(self, node):
+        self.check_array(node)
+
     def visit_LoadVariable(self, node):
         # 1. Make sure the location is a valid variable or constant value
         # 2. Assign the type of the variable to the node
 
         sym = self._symbol_table.get(node.name, None)
-        if sym:
+        if is_array(sym):
+            error(node.lineno, '%s is an array' % node.name)
+            node.type = error_type
+        elif sym:
             if isinstance(sym, (ConstDeclaration, VarDeclaration, ParmDeclaration)):
                 node.type = sym.type
             else:
@@ -297,7 +381,10 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure the location can be assigned
         # 2. Assign the appropriate type
         sym = self._symbol_table.get(node.name)
-        if sym:
+        if is_array(sym):
+            error(node.lineno, '%s is an array' % node.name)
+            node.type = error_type
+        elif sym:
             if isinstance(sym, (VarDeclaration, ParmDeclaration)):
                 node.type = sym.type
             elif isinstance(sym, ConstDeclaration):
@@ -321,6 +408,8 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Visit the typename and propagate types
         self.visit(node.typename)
         node.type = node.typename.type
+        if isinstance(node.typename, ArrayType):
+            error(node.lineno, 'Arrays can not be passed to functions')
 
 
     def visit_FunctionPrototype(self, node):
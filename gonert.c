@@ -1,26 +1,343 @@
 /* gonert.c
 
-   This file contains runtime support functions for the Gone language 
+   This file contains runtime support functions for the Gone language
    as well as boot-strapping code related to getting the main program
    to run.
+
+   Output
+   ------
+   The print functions don't go through printf().  Values are formatted
+   by hand into a large buffer that is written to file descriptor 1 when
+   it fills up past a threshold, when _gone_flush() is called and when
+   the program exits.  The threshold (in bytes) is taken from the
+   GONE_FLUSH_THRESHOLD environment variable.  It defaults to the size
+   of the buffer, or to 0 (write every line) if the output is a terminal.
+   It can also be changed with _gone_set_flush_threshold().
+
+   Strings
+   -------
+   A string is a pointer to a gone_string: its length in bytes followed
+   by the UTF-8 encoded characters (and a terminating NUL so the data
+   can be passed to C functions).  Strings are immutable.  Literals are
+   constants emitted by the compiler (see llvmgen.py).  Strings made at
+   run time come from an arena that is never freed.  The empty string
+   and all strings of one byte are preallocated and shared.
 */
 
 #include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+#include <unistd.h>
+
+#define OUTPUT_BUFFER_SIZE 65536
+
+/* Longest line written by a single print: a sign, the digits of a large
+   double as printed by %f (up to 309) and the fraction */
+#define MAX_LINE 352
+
+static char output_buffer[OUTPUT_BUFFER_SIZE];
+static size_t output_used = 0;
+static long flush_threshold = -1;      /* -1 until set */
+static int output_initialized = 0;
+
+static void write_all(const char *data, size_t size) {
+  size_t start = 0;
+  while (start < size) {
+    ssize_t n = write(1, data + start, size - start);
+    if (n <= 0) {
+      break;
+    }
+    start += n;
+  }
+}
+
+void _gone_flush(void) {
+  write_all(output_buffer, output_used);
+  output_used = 0;
+}
+
+void _gone_set_flush_threshold(long threshold) {
+  if (threshold < 0 || threshold > OUTPUT_BUFFER_SIZE - MAX_LINE) {
+    threshold = OUTPUT_BUFFER_SIZE - MAX_LINE;
+  }
+  flush_threshold = threshold;
+}
+
+static void init_output(void) {
+  const char *env = getenv("GONE_FLUSH_THRESHOLD");
+  if (flush_threshold >= 0) {
+    /* Set by _gone_set_flush_threshold() */
+  } else if (env && *env) {
+    _gone_set_flush_threshold(atol(env));
+  } else {
+    _gone_set_flush_threshold(isatty(1) ? 0 : -1);
+  }
+  atexit(_gone_flush);
+  output_initialized = 1;
+}
+
+/* Return a pointer to room for at least MAX_LINE more characters */
+static inline char *output_start(void) {
+  if (!output_initialized) {
+    init_output();
+  }
+  return output_buffer + output_used;
+}
+
+static inline void output_end(char *end) {
+  output_used = end - output_buffer;
+  if (output_used > (size_t) flush_threshold) {
+    _gone_flush();
+  }
+}
+
+/* Write the decimal digits of x at out.  Returns the end of the digits */
+static char *format_unsigned(char *out, unsigned long long x) {
+  char digits[20];
+  int n = 0;
+  do {
+    digits[n++] = '0' + (char) (x % 10);
+    x /= 10;
+  } while (x);
+  while (n) {
+    *out++ = digits[--n];
+  }
+  return out;
+}
+
+/* Format x like printf("%f") does.  Values whose rounding to 6
+   decimals can't be decided exactly here are left to snprintf() */
+static char *format_double(char *out, double x) {
+  double ipart, frac, scaled, lower;
+  unsigned long long whole, decimals;
+  int n;
+
+  if (!isfinite(x) || fabs(x) >= 1e15) {
+    return out + snprintf(out, MAX_LINE, "%f", x);
+  }
+  if (signbit(x)) {
+    *out++ = '-';
+    x = -x;
+  }
+  frac = modf(x, &ipart);              /* Both parts are exact */
+  scaled = frac * 1e6;
+  lower = floor(scaled);
+  if (fabs(scaled - lower - 0.5) < 1e-6) {
+    return out + snprintf(out, MAX_LINE, "%f", x);
+  }
+  whole = (unsigned long long) ipart;
+  decimals = (unsigned long long) lower + (scaled - lower > 0.5);
+  if (decimals == 1000000) {
+    whole += 1;
+    decimals = 0;
+  }
+  out = format_unsigned(out, whole);
+  *out++ = '.';
+  for (n = 5; n >= 0; n--) {
+    out[n] = '0' + (char) (decimals % 10);
+    decimals /= 10;
+  }
+  return out + 6;
+}
 
 void _print_int(int x) {
-  printf("%i\n", x);
+  char *out = output_start();
+  unsigned long long value = (unsigned long long) x;
+  if (x < 0) {
+    *out++ = '-';
+    value = -(long long) x;
+  }
+  out = format_unsigned(out, value);
+  *out++ = '\n';
+  output_end(out);
 }
 
 void _print_float(double x) {
-  printf("%f\n", x);
+  char *out = format_double(output_start(), x);
+  *out++ = '\n';
+  output_end(out);
 }
 
 void _print_bool(int x) {
+  char *out = output_start();
   if (x) {
-    printf("true\n");
+    memcpy(out, "true\n", 5);
+    out += 5;
   } else {
-    printf("false\n");
+    memcpy(out, "false\n", 6);
+    out += 6;
   }
+  output_end(out);
+}
+
+/* Strings */
+
+typedef struct gone_string {
+  int32_t length;
+  char data[];
+} gone_string;
+
+#define ARENA_CHUNK (1 << 20)
+
+static char *arena_next = NULL;
+static char *arena_end = NULL;
+
+static void out_of_memory(void) {
+  fprintf(stderr, "gone: out of memory\n");
+  abort();
+}
+
+static void *arena_alloc(size_t size) {
+  char *result;
+  size = (size + 7) & ~(size_t) 7;
+  if (size > ARENA_CHUNK / 4) {
+    /* Large strings get a block of their own */
+    result = malloc(size);
+    if (!result) {
+      out_of_memory();
+    }
+    return result;
+  }
+  if ((size_t) (arena_end - arena_next) < size) {
+    arena_next = malloc(ARENA_CHUNK);
+    if (!arena_next) {
+      out_of_memory();
+    }
+    arena_end = arena_next + ARENA_CHUNK;
+  }
+  result = arena_next;
+  arena_next += size;
+  return result;
+}
+
+/* Shared strings of length 0 and 1 (indexed by length ? byte + 1 : 0) */
+static gone_string *small_strings[257];
+
+static gone_string *small_string(const char *data, size_t length) {
+  int index = length ? (unsigned char) data[0] + 1 : 0;
+  gone_string *s = small_strings[index];
+  if (!s) {
+    s = arena_alloc(sizeof(gone_string) + 2);
+    s->length = (int32_t) length;
+    s->data[0] = length ? data[0] : 0;
+    s->data[1] = 0;
+    small_strings[index] = s;
+  }
+  return s;
+}
+
+/* Return a new string of the given length.  The caller fills in data */
+static gone_string *new_string(size_t length) {
+  gone_string *s;
+  if (length > INT32_MAX) {
+    fprintf(stderr, "gone: string too long\n");
+    abort();
+  }
+  s = arena_alloc(sizeof(gone_string) + length + 1);
+  s->length = (int32_t) length;
+  s->data[length] = 0;
+  return s;
+}
+
+const gone_string *_gone_str_concat(const gone_string *a, const gone_string *b) {
+  gone_string *s;
+  if (b->length == 0) {
+    return a;
+  }
+  if (a->length == 0) {
+    return b;
+  }
+  s = new_string((size_t) a->length + b->length);
+  memcpy(s->data, a->data, a->length);
+  memcpy(s->data + a->length, b->data, b->length);
+  return s;
+}
+
+const gone_string *_gone_str_repeat(const gone_string *a, int32_t count) {
+  gone_string *s;
+  size_t length;
+  char *out;
+  if (count <= 0 || a->length == 0) {
+    return small_string(NULL, 0);
+  }
+  if (count == 1) {
+    return a;
+  }
+  if ((size_t) a->length * count / count != (size_t) a->length) {
+    new_string((size_t) INT32_MAX + 1);           /* Aborts */
+  }
+  length = (size_t) a->length * count;
+  s = new_string(length);
+  /* Double the copied part until the string is full */
+  memcpy(s->data, a->data, a->length);
+  for (out = s->data + a->length; out < s->data + length; ) {
+    size_t n = out - s->data;
+    if (n > (size_t) (s->data + length - out)) {
+      n = s->data + length - out;
+    }
+    memcpy(out, s->data, n);
+    out += n;
+  }
+  return s;
+}
+
+/* Compare two strings like strcmp(): negative if a < b, 0 if equal and
+   positive if a > b.  Comparing UTF-8 bytes orders by code point */
+int32_t _gone_str_compare(const gone_string *a, const gone_string *b) {
+  int32_t n = a->length < b->length ? a->length : b->length;
+  int result;
+  if (a == b) {
+    return 0;
+  }
+  result = memcmp(a->data, b->data, n);
+  if (result) {
+    return result;
+  }
+  return (a->length > b->length) - (a->length < b->length);
+}
+
+/* Return 1 if a and b are equal */
+int32_t _gone_str_equal(const gone_string *a, const gone_string *b) {
+  return a == b || (a->length == b->length && memcmp(a->data, b->data, a->length) == 0);
+}
+
+const gone_string *_gone_str_from_cstring(const char *data) {
+  size_t length = strlen(data);
+  gone_string *s;
+  if (length <= 1) {
+    return small_string(data, length);
+  }
+  s = new_string(length);
+  memcpy(s->data, data, length);
+  return s;
+}
+
+void _print_string(const gone_string *s) {
+  size_t length = s->length;
+  char *out = output_start();
+  if (output_used + length + 1 > OUTPUT_BUFFER_SIZE) {
+    _gone_flush();
+    out = output_buffer;
+    if (length + 1 > OUTPUT_BUFFER_SIZE) {
+      write_all(s->data, length);
+      length = 0;
+    }
+  }
+  memcpy(out, s->data, length);
+  out += length;
+  *out++ = '\n';
+  output_end(out);
+}
+
+/* Arrays */
+
+/* Called by compiled code when an array index is out of range */
+void _gone_index_error(int index, int size) {
+  _gone_flush();
+  fprintf(stderr, "gone: index %d out of range for array of size %d\n", index, size);
+  exit(1);
 }
 
 /* Bootstrapping code for a stand-alone executable */
@@ -30,7 +347,10 @@ extern void __init(void);
 extern int _gone_main(void);
 
 int main() {
+  int result;
   __init();
-  return _gone_main();
+  result = _gone_main();
+  _gone_flush();
+  return result;
 }
 #endif
@@ -0,0 +1,424 @@
+# gone/incremental.py
+'''
+Incremental Compilation
+=======================
+When one declaration of a large program is edited, compile_ircode()
+still parses, checks and generates code for the whole program.  This
+file implements an incremental front end that only does this work for
+the top-level declarations that actually changed.
+
+The program is lexed and split into declarations at top-level
+statement boundaries (a ; outside of any braces).  Each declaration
+gets a fingerprint computed from its text and from the entries of
+the checker's symbol table for every name it mentions.  The
+fingerprint changes if the declaration changes or if anything it
+depends on is declared differently.  For each fingerprint, the
+following is cached:
+
+       symbols     Symbol table entries the declaration defines
+       code        Its intermediate code
+
+The temporaries in the cached code are renamed with a suffix taken
+from the fingerprint (e.g., __int_3_5d1c06b2e9a4) so they never clash
+with the temporaries of other declarations.  For an unchanged
+declaration, the cached symbols are put back into the symbol table
+and the cached code is appended to the program as is.  Only changed
+declarations are parsed, checked and generated.  Declarations with
+errors are never cached.
+
+Fingerprints are kept in memory and, if a CompilationCache is given,
+saved to disk so that separate runs of the compiler benefit as well:
+
+       compiler = IncrementalCompiler(CompilationCache())
+       code = compiler.compile(source)
+'''
+
+import copy
+import hashlib
+from collections import defaultdict
+
+from . import opt
+from .ast import AST, Literal
+from .cache import compiler_version
+from .checker import CheckProgramVisitor
+from .dfalex import DFALexer
+from .errors import errors_reported
+from .ircode import GenerateCode
+from .parser import GoneParser
+
+def split_declarations(tokens):
+    '''
+    Split a list of tokens into lists of tokens for each top-level
+    declaration or statement.
+    '''
+    chunks = []
+    depth = 0
+    start = 0
+    for n, tok in enumerate(tokens):
+        if tok.type == 'LBRACE':
+            depth += 1
+        elif tok.type == 'RBRACE':
+            depth -= 1
+        if depth <= 0 and tok.type in ('SEMI', 'RBRACE'):
+            chunks.append(tokens[start:n+1])
+            start = n + 1
+            depth = 0
+    if start < len(tokens):
+        chunks.append(tokens[start:])
+    return chunks
+
+def symbol_signature(sym):
+    '''
+    Describe a symbol table entry in the terms that matter to the code
+    that uses it.
+    '''
+    if isinstance(sym, AST):
+        parameters = getattr(sym, 'parameters', None)
+        if parameters is not None:
+            parameters = tuple(getattr(parm, 'type', None) for parm in parameters)
+        length = getattr(getattr(sym, 'typename', None), 'length', None)
+        return (sym.__class__.__name__, getattr(sym, 'type', None), parameters, length)
+    return sym
+
+def symbol_entry(sym):
+    '''
+    Make a copy of a symbol table entry suitable for caching.  The
+    expression of a declaration is dropped since it would drag in the
+    nodes of other declarations.  Literals are kept (they may give the
+    size of an array).
+    '''
+    if isinstance(sym, AST) and 'expr' in sym._fields and not isinstance(sym.expr, Literal):
+        sym = copy.copy(sym)
+        sym.expr = None
+    return sym
+
+def rename_temporaries(code, suffix):
+    '''
+    Rename all of the temporaries in a list of instructions by adding
+    a suffix.  Temporaries keep their __typename_ prefix.
+    '''
+    result = []
+    for instr in code:
+        positions = list(opt.uses(instr))
+        if opt.target(instr) is not None:
+            positions.append(len(instr) - 1)
+        if positions:
+            instr = list(instr)
+            for i in positions:
+                instr[i] = '%s_%s' % (instr[i], suffix)
+            instr = tuple(instr)
+        result.append(instr)
+    return result
+
+def common_prefix(a, b):
+    '''
+    Return the length of the longest common prefix of two strings.
+    '''
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix(a, b, limit):
+    '''
+    Return the length (at most limit) of the longest common suffix of
+    two strings.
+    '''
+    lo, hi = 0, min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a)-mid:len(a)-lo] == b[len(b)-mid:len(b)-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class DeclarationEntry(object):
+    '''
+    Cached results for a single declaration.
+    '''
+    def __init__(self, symbols, code):
+        self.symbols = symbols
+        self.code = code
+
+class Declaration(object):
+    '''
+    The tokens of a top-level declaration along with its fingerprint
+    and entry from the last compilation (if any).  Declarations after
+    an edit are moved by adding offsets to the positions and line
+    numbers of their tokens instead of lexing them again.
+    '''
+    def __init__(self, tokens, offset=0, line_offset=0):
+        self.tokens = tokens
+        self.offset = offset
+        self.line_offset = line_offset
+        self.names = frozenset(tok.value for tok in tokens if tok.type == 'ID')
+        self.key = None
+        self.entry = None
+
+    @property
+    def start(self):
+        return self.tokens[0].index + self.offset
+
+    @property
+    def end(self):
+        return self.tokens[-1].end + self.offset
+
+    def moved(self, offset, line_offset):
+        decl = Declaration.__new__(Declaration)
+        decl.__dict__.update(self.__dict__)
+        decl.offset += offset
+        decl.line_offset += line_offset
+        return decl
+
+    def current_tokens(self):
+        '''
+        Return the tokens with their actual positions and line numbers.
+        '''
+        if not (self.offset or self.line_offset):
+            return self.tokens
+        offset, line_offset = self.offset, self.line_offset
+        return [tok._replace(lineno=tok.lineno + line_offset, index=tok.index + offset,
+                             end=tok.end + offset) for tok in self.tokens]
+
+class IncrementalCompiler(object):
+    '''
+    Compiles programs to intermediate code, reusing the results for
+    declarations that have not changed since an earlier compile().
+
+    Between calls of compile(), the compiler remembers the source and
+    its declarations.  Only the text between the common prefix and
+    suffix of the old and new source is lexed again, and unchanged
+    declarations that depend on nothing that changed are reused without
+    even computing their fingerprint.
+    '''
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.entries = {}
+        self.lexer = DFALexer()
+        self.parser = GoneParser()
+        self.source = None
+        self.declarations = []
+        self.reused = 0
+        self.compiled = 0
+
+    def split(self, source):
+        '''
+        Split source into a list of Declarations.  Return it along with
+        the set of names declared by declarations that were removed.
+        '''
+        if self.source is not None:
+            result = self.split_edited(source)
+            if result is not None:
+                return result
+        tokens = list(self.lexer.tokenize(source))
+        removed = set()
+        for decl in self.declarations:
+            removed.update(decl.entry.symbols if decl.entry else decl.names)
+        return [Declaration(chunk) for chunk in split_declarations(tokens)], removed
+
+    def split_edited(self, source):
+        '''
+        Split source by lexing only the part that differs from the
+        previous source.  Return None if that isn't possible.
+        '''
+        old, decls = self.source, self.declarations
+        prefix = common_prefix(old, source)
+        suffix = common_suffix(old, source, min(len(old), len(source)) - prefix)
+
+        # Declarations entirely inside of the common prefix are kept as is
+        head = 0
+        while head < len(decls) and decls[head].end <= prefix:
+            head += 1
+
+        # Declarations (and the text before them) entirely inside of the
+        # common suffix are moved
+        def gap_start(n):
+            return decls[n-1].end if n else 0
+
+        tail = len(decls)
+        while tail > head and gap_start(tail-1) >= len(old) - suffix:
+            tail -= 1
+
+        start = decls[head-1].end if head else 0
+        lineno = decls[head-1].tokens[-1].lineno + decls[head-1].line_offset if head else 1
+        offset = len(source) - len(old)
+
+        # Lex the edited part up to the first token of the moved declarations
+        middle = []
+        moved = []
+        if tail < len(decls):
+            first = decls[tail].tokens[0]
+            first_index = first.index + decls[tail].offset + offset
+            for tok in self.lexer.tokenize(source, lineno, start):
+                if tok.index >= first_index:
+                    if (tok.index, tok.type, tok.value) != (first_index, first.type, first.value):
+                        return None
+                    line_offset = tok.lineno - (first.lineno + decls[tail].line_offset)
+                    moved = [decl.moved(offset, line_offset) for decl in decls[tail:]]
+                    break
+                middle.append(tok)
+            else:
+                return None
+        else:
+            middle = list(self.lexer.tokenize(source, lineno, start))
+
+        chunks = split_declarations(middle)
+        if moved and chunks and chunks[-1][-1].type not in ('SEMI', 'RBRACE'):
+            return None
+
+        removed = set()
+        for decl in decls[head:tail]:
+            removed.update(decl.entry.symbols if decl.entry else decl.names)
+        return decls[:head] + [Declaration(chunk) for chunk in chunks] + moved, removed
+
+    def fingerprint(self, source, decl, symtab):
+        h = hashlib.sha256(compiler_version().encode('utf-8'))
+        h.update(source[decl.start:decl.end].encode('utf-8'))
+        names = sorted(decl.names)
+        h.update(repr([(name, symbol_signature(symtab.get(name))) for name in names]).encode('utf-8'))
+        return h.hexdigest()
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None and self.cache is not None:
+            entry = self.cache.get('decl', key)
+            if entry is not None:
+                self.entries[key] = entry
+        return entry
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        if self.cache is not None:
+            self.cache.put('decl', key, entry)
+
+    def compile_declaration(self, decl, checker, key):
+        '''
+        Parse, check and generate code for one declaration.  Return a
+        DeclarationEntry or None if there were errors.  The temporaries
+        in the code are made unique by adding part of the key to them.
+        '''
+        nerrors = errors_reported()
+        symtab = checker._symbol_table
+        before = { name: symtab.get(name) for name in decl.names }
+
+        tree = self.parser.parse(iter(decl.current_tokens()))
+        if tree is not None and errors_reported() == nerrors:
+            checker.visit(tree)
+        if tree is None or errors_reported() != nerrors:
+            return None
+
+        gen = GenerateCode()
+        gen.visit(tree)
+        symbols = { name: symbol_entry(symtab[name]) for name in decl.names
+                    if name in symtab and symtab[name] is not before[name] }
+        return DeclarationEntry(symbols, rename_temporaries(gen.code, key[:12]))
+
+    def compile(self, source):
+        '''
+        Generate intermediate code for source.
+        '''
+        nerrors = errors_reported()
+        decls, changed = self.split(source)
+        lexed_ok = errors_reported() == nerrors
+
+        # A program without declarations has nothing to reuse.  Compile it
+        # as a whole so that it is reported the same way (e.g., the syntax
+        # error for an empty program).
+        if not decls:
+            self.source, self.declarations = None, []
+            self.reused = self.compiled = 0
+            if lexed_ok:
+                from .ircode import compile_ircode
+                code = compile_ircode(source)
+                return code if not errors_reported() else []
+            return []
+
+        checker = CheckProgramVisitor()
+        symtab = checker._symbol_table
+        used = defaultdict(int)
+        code = []
+        self.reused = self.compiled = 0
+
+        for decl in decls:
+            if decl.entry is not None and not (decl.names & changed):
+                # Same text and nothing it depends on changed
+                entry, key = decl.entry, decl.key
+                symtab.update(entry.symbols)
+                self.reused += 1
+            else:
+                key = self.fingerprint(source, decl, symtab)
+                entry = self.lookup(key)
+                if entry is not None:
+                    symtab.update(entry.symbols)
+                    self.reused += 1
+                else:
+                    entry = self.compile_declaration(decl, checker, key)
+                    self.compiled += 1
+                    if entry is not None and lexed_ok:
+                        self.store(key, entry)
+                if key != decl.key:
+                    if decl.entry is not None:
+                        changed.update(decl.entry.symbols)
+                    changed.update(entry.symbols if entry else decl.names)
+                decl.key, decl.entry = key, entry
+                if entry is None:
+                    continue
+
+            # The same declaration may appear more than once
+            if used[key]:
+                code.extend(rename_temporaries(entry.code, used[key]))
+            else:
+                code.extend(entry.code)
+            used[key] += 1
+
+        # Remember the declarations for the next compile() unless there
+        # were lexing errors (which would not be reported again)
+        if lexed_ok:
+            self.source, self.declarations = source, decls
+        else:
+            self.source, self.declarations = None, []
+        return code if not errors_reported() else []
+
+_compilers = {}
+
+def compile_ircode(source, optimize=False, cache=None):
+    '''
+    Incremental version of ircode.compile_ircode().  The compiler (and
+    what it remembers about previous compilations) is kept between calls
+    using the same cache.
+    '''
+    directory = cache.directory if cache is not None else None
+    compiler = _compilers.get(directory)
+    if compiler is None:
+        compiler = _compilers[directory] = IncrementalCompiler(cache)
+    code = compiler.compile(source)
+    if optimize and code:
+        from .opt import optimize_code
+        code = optimize_code(code)
+    return code
+
+def main():
+    '''
+    Main program. Used for testing.
+    '''
+    import sys
+    from .cache import CompilationCache, cache_enabled
+
+    if len(sys.argv) != 2:
+        sys.stderr.write('Usage: python3 -m gone.incremental filename\n')
+        raise SystemExit(1)
+
+    source = open(sys.argv[1]).read()
+    compiler = IncrementalCompiler(CompilationCache() if cache_enabled() else None)
+    code = compiler.compile(source)
+    for instr in code:
+        print(instr)
+    sys.stderr.write('%d declarations reused, %d compiled\n' % (compiler.reused, compiler.compiled))
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,68 @@ To run a program use::
     bash % python3 -m gone.interp someprogram.g
 
 '''
+import os
 import sys
+import operator
+from array import array
 from . import bblock
 
+# array.array type codes for the elements of Gone arrays.  Ints are 32
+# bits as in the LLVM backend.
+array_typecodes = {
+    'int': 'i',
+    'float': 'd',
+}
+
+def new_array(typename, size):
+    '''
+    Return a new Gone array of size elements set to zero.
+    '''
+    return array(array_typecodes[typename], [0]) * size
+
+def index_error(index, size):
+    return RuntimeError('Index %d out of range for array of size %d' % (index, size))
+
+def overflow_error(value):
+    # Elements of int arrays are 32-bit (array typecode 'i')
+    return RuntimeError('Value %d does not fit in an int array element' % value)
+
+class OutputBuffer(object):
+    '''
+    Collects the values printed by a program and writes them to
+    sys.stdout in large chunks instead of one print() per value.  The
+    values are converted to strings only when the buffer is written out,
+    which happens once it holds max_lines values and when flush() is
+    called.  By default, max_lines is derived from the size in characters
+    given by the GONE_FLUSH_THRESHOLD environment variable (as for the
+    runtime in gonert.c) assuming about 8 characters per line.
+    Otherwise the buffer holds 8192 values, or just one (every line is
+    written) if the output is a terminal.
+    '''
+    def __init__(self, max_lines=None):
+        if max_lines is None:
+            threshold = os.environ.get('GONE_FLUSH_THRESHOLD')
+            if threshold:
+                max_lines = int(threshold) // 8
+            else:
+                max_lines = 0 if sys.stdout.isatty() else 8192
+        self.max_lines = max(1, max_lines)
+
+        # Always the same list (see CompiledInterpreter.compile_print_int)
+        self.lines = []
+
+    def write_line(self, value):
+        lines = self.lines
+        lines.append(value)
+        if len(lines) >= self.max_lines:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            sys.stdout.write('\n'.join(map(str, self.lines)) + '\n')
+            self.lines.clear()
+        sys.stdout.flush()
+
 class Frame(object):
     '''
     Object representing a stack frame.
@@ -83,6 +142,9 @@ class Interpreter(object):
 
         self.external_libs = [ __import__(name) for name in external_libs ]
 
+        # Buffer for printed values
+        self.output = OutputBuffer()
+
     # Add user-defined functions to the globals.  Builds a dictionary mapping function names
     # to the code associated with each function
     def register_functions(self, functionlist):
@@ -100,19 +162,25 @@ class Interpreter(object):
         self.framestack.append((self.pc, self.frame))
         self.frame = Frame(args)
         self.pc = 0
-        while self.pc < len(code):
-            instr = code[self.pc]
-            opcode = instr[0]
-            self.pc += 1
-            if hasattr(self, 'run_'+opcode):
-                getattr(self, 'run_'+opcode)(*instr[1:])
-            else:
-                print('Warning: No run_'+opcode+'() method')
-            if self.pc < 0:
-                break
-        result = self.frame['return']
-        self.pc, self.frame = self.framestack.pop()
-        return result
+        try:
+            while self.pc < len(code):
+                instr = code[self.pc]
+                opcode = instr[0]
+                self.pc += 1
+                if hasattr(self, 'run_'+opcode):
+                    getattr(self, 'run_'+opcode)(*instr[1:])
+                else:
+                    print('Warning: No run_'+opcode+'() method')
+                if self.pc < 0:
+                    break
+            return self.frame['return']
+        finally:
+            # Also on runtime errors, so that the output printed before
+            # them isn't lost
+            self.pc, self.frame = self.framestack.pop()
+            if len(self.framestack) == 0:
+                # Returning to the caller of the interpreter
+                self.output.flush()
         
     # Interpreter opcodes
 
@@ -132,7 +200,7 @@ class Interpreter(object):
         '''
         Output an integer value.
         '''
-        print(self.frame[source])
+        self.output.write_line(self.frame[source])
 
     run_literal_float = run_literal_int
     run_literal_string = run_literal_int
@@ -150,6 +218,12 @@ class Interpreter(object):
     def run_alloc_bool(self, name):
         self.frame[name] = False
 
+    def run_alloc_array_int(self, name, size):
+        self.frame[name] = new_array('int', size)
+
+    def run_alloc_array_float(self, name, size):
+        self.frame[name] = new_array('float', size)
+
     # Added support for global variable declarations
     def run_global_int(self, name):
         self.globals[name] = 0
@@ -183,6 +257,37 @@ class Interpreter(object):
     run_load_string = run_load_int
     run_load_bool = run_load_int
 
+    def run_load_array_int(self, name, index, target):
+        values = self.frame[name] if name in self.frame else self.globals[name]
+        self.frame[target] = values[self.frame[index]]
+
+    run_load_array_float = run_load_array_int
+
+    def run_store_array_int(self, source, name, index):
+        values = self.frame[name] if name in self.frame else self.globals[name]
+        try:
+            values[self.frame[index]] = self.frame[source]
+        except OverflowError:
+            raise overflow_error(self.frame[source]) from None
+
+    run_store_array_float = run_store_array_int
+
+    def run_check_index(self, index, size):
+        if not 0 <= self.frame[index] < size:
+            raise index_error(self.frame[index], size)
+
+    def run_vector_loop(self, kernel):
+        # Runs a loop all at once if possible (see vectorize.py)
+        def value(name):
+            return self.frame[name] if name in self.frame else self.globals[name]
+        results = kernel.execute({ name: value(name) for name in kernel.scalars },
+                                 { name: value(name) for name in kernel.arrays })
+        for name, result in (results or {}).items():
+            if name in self.frame:
+                self.frame[name] = result
+            else:
+                self.globals[name] = result
+
     def run_add_int(self, left, right, target):
         self.frame[target] = self.frame[left] + self.frame[right]
 
@@ -198,6 +303,7 @@ class Interpreter(object):
         self.frame[target] = self.frame[left] * self.frame[right]
 
     run_mul_float = run_mul_int
+    run_mul_string = run_mul_int
 
     def run_div_int(self, left, right, target):
         self.frame[target] = self.frame[left] // self.frame[right]
@@ -216,7 +322,7 @@ class Interpreter(object):
     run_usub_float = run_usub_int
 
     def run_print_int(self, source):
-        print(self.frame[source])
+        self.output.write_line(self.frame[source])
 
     run_print_float = run_print_int
     run_print_string = run_print_int
@@ -242,6 +348,8 @@ class Interpreter(object):
         target = args[-1]
         argvals = [self.frame[name] for name in args[:-1]]
         if funcname in self.globals:
+            # External functions may produce output of their own
+            self.output.flush()
             func = self.globals[funcname]
             self.frame[target] = func(*argvals)
         elif funcname in self.functions:
@@ -318,12 +426,404 @@ class Interpreter(object):
     def run_jump(self, target):
         self.pc = target
 
+    def run_line(self, lineno):
+        pass
+
     def run_cbranch(self, testvar, true_target, false_target):
         if self.frame[testvar]:
             self.pc = true_target
         else:
             self.pc = false_target
 
+# Factories for the closures made by CompiledInterpreter.  Each one
+# returns a compile_opcode() method that binds the operands of a single
+# instruction into a function run(regs) -> next program counter.
+# Operand names are resolved to integer register slots when the
+# closure is made, so regs is a plain list.
+
+def _binary(func):
+    def compile_binary(self, next_pc, left, right, target):
+        left, right, target = self.slot(left), self.slot(right), self.slot(target)
+        def run(regs):
+            regs[target] = func(regs[left], regs[right])
+            return next_pc
+        return run
+    return compile_binary
+
+def _unary(func):
+    def compile_unary(self, next_pc, source, target):
+        source, target = self.slot(source), self.slot(target)
+        def run(regs):
+            regs[target] = func(regs[source])
+            return next_pc
+        return run
+    return compile_unary
+
+def _alloc(value):
+    def compile_alloc(self, next_pc, name):
+        name = self.slot(name)
+        def run(regs):
+            regs[name] = value
+            return next_pc
+        return run
+    return compile_alloc
+
+def _alloc_array(typename):
+    def compile_alloc_array(self, next_pc, name, size):
+        name = self.slot(name)
+        def run(regs):
+            regs[name] = new_array(typename, size)
+            return next_pc
+        return run
+    return compile_alloc_array
+
+def _global(value):
+    def compile_global(self, next_pc, name):
+        name = self.global_slot(name)
+        globals_ = self.global_values
+        def run(regs):
+            globals_[name] = value
+            return next_pc
+        return run
+    return compile_global
+
+class CompiledInterpreter(Interpreter):
+    '''
+    An interpreter that decodes each linked function exactly once.
+    Instead of looking up a run_opcode() method for every instruction
+    executed, register_functions() translates each instruction into a
+    closure with its operands already bound:
+
+         ('add_int', '_int_1', '_int_2', '_int_3')
+
+    becomes a function run(regs) that performs the addition on the
+    registers of the current frame and returns the index of the next
+    instruction.  The main loop of execute_function() is then simply:
+
+         while pc >= 0:
+             pc = handlers[pc](regs)
+
+    All names are resolved to integer slots during translation.
+    Temporaries, locals and parameters of a function are numbered
+    from 1 (slot 0 holds the return value) and a frame is just a
+    preallocated list of that size.  Global variables are numbered
+    across the whole program and live in the list self.global_values.
+    Whether a load/store refers to a local or a global is decided by
+    looking for the alloc/parm instructions of the function.
+    '''
+    def register_functions(self, functionlist):
+        super(CompiledInterpreter, self).register_functions(functionlist)
+        self.global_slots = {}
+        self.global_values = []
+        self.compiled = {}
+        for name, code in self.functions.items():
+            self.compiled[name] = self.compile_function(code)
+
+    def slot(self, name):
+        '''
+        Return the frame slot of a local name in the function being compiled
+        '''
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+        return self.slots[name]
+
+    def global_slot(self, name):
+        '''
+        Return the slot of a global variable in self.global_values
+        '''
+        if name not in self.global_slots:
+            self.global_slots[name] = len(self.global_values)
+            self.global_values.append(None)
+        return self.global_slots[name]
+
+    def compile_function(self, code):
+        '''
+        Translate linked code into a tuple (handlers, parms, nslots)
+        where handlers is a list of closures (one per instruction plus
+        a final one that returns from the function), parms is the list
+        of parameter slots in argument order and nslots is the size of
+        the frame.
+        '''
+        self.slots = { 'return': 0 }
+        self.locals = set()
+        parms = []
+        for instr in code:
+            if instr[0].startswith(('alloc_', 'parm_')):
+                self.locals.add(instr[1])
+            if instr[0].startswith('parm_'):
+                parms.append((instr[2], self.slot(instr[1])))
+        parms = [slot for _, slot in sorted(parms)]
+
+        handlers = []
+        for pc, instr in enumerate(code):
+            opcode = instr[0]
+            if hasattr(self, 'compile_'+opcode):
+                handlers.append(getattr(self, 'compile_'+opcode)(pc + 1, *instr[1:]))
+            else:
+                print('Warning: No compile_'+opcode+'() method')
+                handlers.append(self.compile_nop(pc + 1))
+
+        # Falling off the end of the code returns from the function
+        handlers.append(lambda regs: -1)
+        return handlers, parms, len(self.slots)
+
+    def execute_function(self, funcname, args):
+        try:
+            return self.run_function(funcname, args)
+        finally:
+            self.output.flush()
+
+    def run_function(self, funcname, args):
+        '''
+        Run a function (without flushing the output afterwards).
+        '''
+        handlers, parms, nslots = self.compiled[funcname]
+        regs = [None] * nslots
+        for slot, value in zip(parms, args):
+            regs[slot] = value
+        pc = 0
+        while pc >= 0:
+            pc = handlers[pc](regs)
+        return regs[0]
+
+    # Instruction translators.  Each compile_opcode(next_pc, *args)
+    # method returns a closure for a single instruction.
+
+    def compile_nop(self, next_pc):
+        return lambda regs: next_pc
+
+    def compile_line(self, next_pc, lineno):
+        return self.compile_nop(next_pc)
+
+    def compile_literal_int(self, next_pc, value, target):
+        target = self.slot(target)
+        def run(regs):
+            regs[target] = value
+            return next_pc
+        return run
+
+    compile_literal_float = compile_literal_int
+    compile_literal_string = compile_literal_int
+    compile_literal_bool = compile_literal_int
+
+    compile_alloc_int = _alloc(0)
+    compile_alloc_float = _alloc(0.0)
+    compile_alloc_string = _alloc('')
+    compile_alloc_bool = _alloc(False)
+
+    compile_alloc_array_int = _alloc_array('int')
+    compile_alloc_array_float = _alloc_array('float')
+
+    compile_global_int = _global(0)
+    compile_global_float = _global(0.0)
+    compile_global_string = _global('')
+    compile_global_bool = _global(False)
+
+    def compile_store_int(self, next_pc, source, target):
+        source = self.slot(source)
+        if target in self.locals:
+            target = self.slot(target)
+            def run(regs):
+                regs[target] = regs[source]
+                return next_pc
+        else:
+            target = self.global_slot(target)
+            globals_ = self.global_values
+            def run(regs):
+                globals_[target] = regs[source]
+                return next_pc
+        return run
+
+    compile_store_float = compile_store_int
+    compile_store_string = compile_store_int
+    compile_store_bool = compile_store_int
+
+    def compile_load_int(self, next_pc, name, target):
+        target = self.slot(target)
+        if name in self.locals:
+            name = self.slot(name)
+            def run(regs):
+                regs[target] = regs[name]
+                return next_pc
+        else:
+            name = self.global_slot(name)
+            globals_ = self.global_values
+            def run(regs):
+                regs[target] = globals_[name]
+                return next_pc
+        return run
+
+    compile_load_float = compile_load_int
+    compile_load_string = compile_load_int
+    compile_load_bool = compile_load_int
+
+    def compile_load_array_int(self, next_pc, name, index, target):
+        index, target = self.slot(index), self.slot(target)
+        if name in self.locals:
+            name = self.slot(name)
+            def run(regs):
+                regs[target] = regs[name][regs[index]]
+                return next_pc
+        else:
+            name = self.global_slot(name)
+            globals_ = self.global_values
+            def run(regs):
+                regs[target] = globals_[name][regs[index]]
+                return next_pc
+        return run
+
+    compile_load_array_float = compile_load_array_int
+
+    def compile_store_array_int(self, next_pc, source, name, index):
+        source, index = self.slot(source), self.slot(index)
+        if name in self.locals:
+            name = self.slot(name)
+            def run(regs):
+                try:
+                    regs[name][regs[index]] = regs[source]
+                except OverflowError:
+                    raise overflow_error(regs[source]) from None
+                return next_pc
+        else:
+            name = self.global_slot(name)
+            globals_ = self.global_values
+            def run(regs):
+                try:
+                    globals_[name][regs[index]] = regs[source]
+                except OverflowError:
+                    raise overflow_error(regs[source]) from None
+                return next_pc
+        return run
+
+    compile_store_array_float = compile_store_array_int
+
+    def compile_check_index(self, next_pc, index, size):
+        index = self.slot(index)
+        def run(regs):
+            if 0 <= regs[index] < size:
+                return next_pc
+            raise index_error(regs[index], size)
+        return run
+
+    def compile_vector_loop(self, next_pc, kernel):
+        globals_ = self.global_values
+        def resolve(names):
+            return [(name, name in self.locals, self.slot(name) if name in self.locals
+                     else self.global_slot(name)) for name in names]
+        scalars, arrays = resolve(kernel.scalars), resolve(kernel.arrays)
+        slots = { name: (local, slot) for name, local, slot in scalars }
+        def run(regs):
+            results = kernel.execute(
+                { name: regs[slot] if local else globals_[slot] for name, local, slot in scalars },
+                { name: regs[slot] if local else globals_[slot] for name, local, slot in arrays })
+            if results:
+                for name, result in results.items():
+                    local, slot = slots[name]
+                    if local:
+                        regs[slot] = result
+                    else:
+                        globals_[slot] = result
+            return next_pc
+        return run
+
+    compile_add_int = compile_add_float = compile_add_string = _binary(operator.add)
+    compile_sub_int = compile_sub_float = _binary(operator.sub)
+    compile_mul_int = compile_mul_float = compile_mul_string = _binary(operator.mul)
+    compile_div_int = _binary(operator.floordiv)
+    compile_div_float = _binary(operator.truediv)
+
+    compile_uadd_int = compile_uadd_float = _unary(operator.pos)
+    compile_usub_int = compile_usub_float = _unary(operator.neg)
+
+    compile_lt_int = compile_lt_float = compile_lt_string = _binary(operator.lt)
+    compile_le_int = compile_le_float = compile_le_string = _binary(operator.le)
+    compile_gt_int = compile_gt_float = compile_gt_string = _binary(operator.gt)
+    compile_ge_int = compile_ge_float = compile_ge_string = _binary(operator.ge)
+    compile_eq_int = compile_eq_float = compile_eq_string = compile_eq_bool = _binary(operator.eq)
+    compile_ne_int = compile_ne_float = compile_ne_string = compile_ne_bool = _binary(operator.ne)
+
+    compile_and_bool = _binary(lambda x, y: x and y)
+    compile_or_bool = _binary(lambda x, y: x or y)
+    compile_not_bool = _unary(operator.not_)
+
+    def compile_print_int(self, next_pc, source):
+        source = self.slot(source)
+        lines = self.output.lines
+        append = lines.append
+        max_lines = self.output.max_lines
+        flush = self.output.flush
+        def run(regs):
+            append(regs[source])
+            if len(lines) >= max_lines:
+                flush()
+            return next_pc
+        return run
+
+    compile_print_float = compile_print_int
+    compile_print_string = compile_print_int
+    compile_print_bool = compile_print_int
+
+    def compile_extern_func(self, next_pc, name, rettypename, *parmtypenames):
+        def run(regs):
+            self.run_extern_func(name, rettypename, *parmtypenames)
+            return next_pc
+        return run
+
+    def compile_call_func(self, next_pc, funcname, *args):
+        target = self.slot(args[-1])
+        argslots = [self.slot(name) for name in args[:-1]]
+        if funcname in self.functions:
+            execute = self.run_function
+            def run(regs):
+                regs[target] = execute(funcname, [regs[n] for n in argslots])
+                return next_pc
+        else:
+            # External functions are bound by extern_func at runtime
+            externs = self.globals
+            flush = self.output.flush
+            def run(regs):
+                func = externs.get(funcname)
+                if func is None:
+                    raise RuntimeError('No function %s found' % funcname)
+                flush()
+                regs[target] = func(*[regs[n] for n in argslots])
+                return next_pc
+        return run
+
+    def compile_return_int(self, next_pc, source):
+        source = self.slot(source)
+        def run(regs):
+            regs[0] = regs[source]
+            return -1
+        return run
+
+    compile_return_float = compile_return_int
+    compile_return_string = compile_return_int
+    compile_return_bool = compile_return_int
+
+    def compile_return_void(self, next_pc):
+        def run(regs):
+            regs[0] = None
+            return -1
+        return run
+
+    def compile_parm_int(self, next_pc, name, num):
+        # Parameters are placed in the registers by execute_function()
+        return self.compile_nop(next_pc)
+
+    compile_parm_float = compile_parm_int
+    compile_parm_string = compile_parm_int
+    compile_parm_bool = compile_parm_int
+
+    def compile_jump(self, next_pc, target):
+        return lambda regs: target
+
+    def compile_cbranch(self, next_pc, testvar, true_target, false_target):
+        testvar = self.slot(testvar)
+        def run(regs):
+            return true_target if regs[testvar] else false_target
+        return run
+
 # BlockLinker.  This block visitor walks through the block structure
 # and turns it into a single sequence of instructions with added
 # jump and cbranch instructions.
@@ -393,36 +893,88 @@ class BlockLinker(bblock.BlockVisitor):
 # ----------------------------------------------------------------------
 
 def main():
-    import sys
-    from .ircode import compile_ircode
+    import argparse
+    from .ircode import compile_ircode, main_function
     from .errors import errors_reported
+    from .cache import cached_compile
+    from .phases import phase, add_arguments, report_phases
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.interp')
+    argparser.add_argument('filename')
+    argparser.add_argument('--reference', action='store_true',
+                           help='use the reference (non-compiled) interpreter')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='optimization level (0 disables the IR optimizer)')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only recompile declarations that changed')
+    argparser.add_argument('--no-vectorize', action='store_true',
+                           help="don't run simple array loops with NumPy (see vectorize.py)")
+    argparser.add_argument('--profile', action='store_true',
+                           help='profile the program and print a report (see profiler.py)')
+    argparser.add_argument('--profile-output', metavar='FILE',
+                           help='profile the program and save the timings in pstats format')
+    add_arguments(argparser)
+    args = argparser.parse_args()
+
+    source = open(args.filename).read()
+    optimize = args.optlevel > 0
+    profile = args.profile or args.profile_output
+    linenos = ('linenos',) if profile else ()
+    with report_phases(args):
+        code = cached_compile('ir', source,
+                              lambda s: compile_ircode(s, optimize, args.incremental, bool(profile)),
+                              optimize, *linenos)
+        if errors_reported():
+            return
+
+        # !!! The program is run as the body of main() until Projects 7/8
+        functions = [main_function(code)]
 
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.interp filename\n')
-        raise SystemExit(1)
-
-    source = open(sys.argv[1]).read()
-    functions = compile_ircode(source)
-    if not errors_reported():
         # Take the list of functions and build fully linked versions
-        linked_functions = []
-        for func in functions:
-            linker = BlockLinker()
-            linker.link_blocks(func.start_block)
-            linked_functions.append((func, linker.code))
+        with phase('link'):
+            # Profiles count the instructions of every iteration
+            if args.no_vectorize or profile:
+                linker_class = BlockLinker
+            else:
+                from .vectorize import VectorizingLinker as linker_class
+            linked_functions = []
+            for func in functions:
+                linker = linker_class()
+                linker.link_blocks(func.start_block)
+                linked_functions.append((func, linker.code))
 
         # Monkey patch os with a putchar() function so certain examples work
         import os
         os.putchar = lambda x: os.write(1, chr(x).encode('latin-1'))
 
-        interpreter = Interpreter()
-        interpreter.register_functions(linked_functions)
-        # Execute the __init function which is responsible for global vars and constants
-        interpreter.execute_function('__init', [])
-
-        # Execute the main() entry point
-        result = interpreter.execute_function('main',[])
-        print('Program Returned: %d' % result)
+        with phase('interp setup'):
+            if profile:
+                from .profiler import ProfilingInterpreter
+                interpreter = ProfilingInterpreter()
+            elif args.reference:
+                interpreter = Interpreter()
+            else:
+                interpreter = CompiledInterpreter()
+            interpreter.register_functions(linked_functions)
+
+        with phase('execute'):
+            try:
+                # Execute the __init function which is responsible for global vars and constants
+                if '__init' in interpreter.functions:
+                    interpreter.execute_function('__init', [])
+
+                # Execute the main() entry point
+                result = interpreter.execute_function('main',[])
+            finally:
+                interpreter.output.flush()
+        if result is not None:
+            print('Program Returned: %d' % result)
+
+    if profile:
+        sys.stdout.flush()
+        interpreter.profile.report(interpreter.functions, source)
+        if args.profile_output:
+            interpreter.profile.dump_stats(args.profile_output, args.filename)
 
 if __name__ == '__main__':
     main()
@@ -156,6 +156,7 @@ To start, your SSA code should only contain the following operators:
        ('add_type',left,right,target )    # target = left + right
        ('sub_type',left,right,target)     # target = left - right
        ('mul_type',left,right,target)     # target = left * right
+                                          # (mul_string: left is a string, right an int)
        ('div_type',left,right,target)     # target = left / right  (integer truncation)
        ('uadd_type',source,target)        # target = +source
        ('uneg_type',source,target)        # target = -source
@@ -191,9 +192,35 @@ A distinction between local and global variables is made:
 
 Note: You may need to extend some of the existing op-codes to handle the new
 bool type as well.
+
+Arrays:
+=======
+Arrays have a fixed size and are allocated like variables.  Elements
+are read and written with the following opcodes (type is int or float):
+
+       ('alloc_array_type', name, size)          # Allocate an array (all zeros)
+       ('load_array_type', name, index, target)  # target = name[index]
+       ('store_array_type', source, name, index) # name[index] = source
+       ('check_index', index, size)              # Stop unless 0 <= index < size
+
+load_array and store_array don't check their index.  Every element
+access is preceded by a check_index instruction instead.  Keeping the
+checks separate lets the optimizer (opt.BoundsCheckElimination) remove
+the ones that can't fail.
+
+Line Numbers:
+=============
+When asked to (GenerateCode(linenos=True)), the code generator marks
+where the code of each source line starts with a pseudo-instruction:
+
+       ('line', lineno)                   # Following code is from line lineno
+
+Backends treat it as a no-op.  The profiler in profiler.py uses it to
+attribute execution counts to source lines.
 '''
 
 from . import ast
+from . import bblock
 from collections import defaultdict
 
 # STEP 1: Map map operator symbol names such as +, -, *, /
@@ -221,9 +248,13 @@ class GenerateCode(ast.NodeVisitor):
     Node visitor class that creates 3-address encoded instruction sequences.
     '''
 
-    def __init__(self):
+    def __init__(self, linenos=False):
         super(GenerateCode, self).__init__()
 
+        # Emit ('line', lineno) instructions?
+        self.linenos = linenos
+        self.lineno = None
+
         # version dictionary for temporaries
         self.versions = defaultdict(int)
 
@@ -242,6 +273,15 @@ class GenerateCode(ast.NodeVisitor):
         self.versions[typename] += 1
         return name
 
+    def emit(self, inst, node):
+        '''
+        Append an instruction generated for node to the code.
+        '''
+        if self.linenos and node.lineno is not None and node.lineno != self.lineno:
+            self.lineno = node.lineno
+            self.code.append(('line', node.lineno))
+        self.code.append(inst)
+
     # You must implement visit_Nodename methods for all of the other
     # AST nodes.  In your code, you will need to make instructions
     # and append them to the self.code list.
@@ -252,31 +292,75 @@ class GenerateCode(ast.NodeVisitor):
     def visit_Literal(self, node):
         target = self.new_temp(node.type)
         inst = ('literal_' + str(node.type), node.value, target)
-        self.code.append(inst)
+        self.emit(inst, node)
         # Save the name of the temporary variable where the value was placed 
         node.gen_location = target
 
     def visit_LoadVariable(self, node):
         target = self.new_temp(node.type)
         inst = ('load_' + str(node.type), node.name, target)
-        self.code.append(inst)
+        self.emit(inst, node)
+        node.gen_location = target
+
+    def visit_LoadArray(self, node):
+        yield node.index
+        self.emit(('check_index', node.index.gen_location, node.sym.typename.length), node)
+        target = self.new_temp(node.type)
+        inst = ('load_array_' + str(node.type), node.name, node.index.gen_location, target)
+        self.emit(inst, node)
         node.gen_location = target
 
+    def visit_VarDeclaration(self, node):
+        if isinstance(node.typename, ast.ArrayType):
+            self.emit(('alloc_array_' + str(node.type), node.name, node.typename.length), node)
+            return
+        self.emit(('alloc_' + str(node.type), node.name), node)
+        if node.expr:
+            self.visit(node.expr)
+            self.emit(('store_' + str(node.type), node.expr.gen_location, node.name), node)
+
+    def visit_ConstDeclaration(self, node):
+        self.visit(node.expr)
+        self.emit(('alloc_' + str(node.type), node.name), node)
+        self.emit(('store_' + str(node.type), node.expr.gen_location, node.name), node)
+
+    def visit_AssignmentStatement(self, node):
+        location = node.store_location
+        if isinstance(location, ast.StoreArray):
+            # The index is evaluated before the value but only checked
+            # when the element is stored
+            self.visit(location.index)
+            self.visit(node.expr)
+            index = location.index.gen_location
+            self.emit(('check_index', index, location.sym.typename.length), node)
+            inst = ('store_array_' + str(location.type), node.expr.gen_location, location.name, index)
+        else:
+            self.visit(node.expr)
+            inst = ('store_' + str(location.type), node.expr.gen_location, location.name)
+        self.emit(inst, node)
+
+    # Operators yield their operands instead of calling self.visit() so
+    # that deeply nested expressions are generated without recursion
+    # (see ast.NodeVisitor)
     def visit_BinOp(self, node):
-        self.visit(node.left)
-        self.visit(node.right)
+        yield node.left
+        yield node.right
         target = self.new_temp(node.type)
-        opcode = binary_ops[node.op] + '_' + str(node.left.type)
-        inst = (opcode, node.left.gen_location, node.right.gen_location, target)
-        self.code.append(inst)
+        left, right = node.left, node.right
+        if node.type == 'string' and left.type != 'string':
+            # int * string is generated as string * int
+            left, right = right, left
+        opcode = binary_ops[node.op] + '_' + str(left.type)
+        inst = (opcode, left.gen_location, right.gen_location, target)
+        self.emit(inst, node)
         node.gen_location = target
 
     def visit_Unaryop(self, node):
-        self.visit(node.expr)
+        yield node.expr
         target = self.new_temp(node.type)
         opcode = unary_ops[node.op] + '_' + str(node.expr.type)
         inst = (opcode, node.expr.gen_location, target)
-        self.code.append(inst)
+        self.emit(inst, node)
         node.gen_location = target
 
     def visit_FunctionCall(self, node):
@@ -286,13 +370,13 @@ class GenerateCode(ast.NodeVisitor):
             args.append(arg.gen_location)
         target = self.new_temp(node.type)
         inst = ('call_func', node.name) + tuple(args) + (target,)
-        self.code.append(inst)
+        self.emit(inst, node)
         node.gen_location = target
 
     def visit_PrintStatement(self, node):
         self.visit(node.expr)
         inst = ('print_' + str(node.expr.type), node.expr.gen_location)
-        self.code.append(inst)
+        self.emit(inst, node)
 
 
 # Project 6 - Comparisons/Booleans
@@ -314,29 +398,66 @@ class GenerateCode(ast.NodeVisitor):
 # emitted outside of a function needs to be placed into a default function
 # called __init(). 
 
+# Until functions are implemented (Projects 7/8), the code of a program
+# is the single flat list of instructions made by GenerateCode and it's
+# run as the body of main().  Backends and passes that work on functions
+# made of blocks (see bblock.py) get it as a function with one block.
+class Function(object):
+    def __init__(self, name, start_block):
+        self.name = name
+        self.start_block = start_block
+
+def main_function(code):
+    '''
+    Return a flat list of instructions as the function main().
+    '''
+    block = bblock.BasicBlock()
+    block.instructions = list(code)
+    return Function('main', block)
+
 # ----------------------------------------------------------------------
 #                          TESTING/MAIN PROGRAM
 #
 # Note: Some changes will be required in later projects.
 # ----------------------------------------------------------------------
 
-def compile_ircode(source):
+def compile_ircode(source, optimize=False, incremental=False, linenos=False):
     '''
-    Generate intermediate code from source.
+    Generate intermediate code from source.  If optimize is true, the
+    code is run through the optimizer in opt.py.  If incremental is
+    true, the code of unchanged declarations is reused from earlier
+    compilations (see incremental.py).  If linenos is true, the code
+    includes ('line', lineno) instructions.  Reused code may have been
+    compiled at other line numbers, so linenos turns incremental off.
     '''
     from .parser import parse
     from .checker import check_program
     from .errors import errors_reported
+    from .phases import phase
+
+    if incremental and not linenos:
+        from .incremental import compile_ircode as compile_incremental
+        from .cache import CompilationCache, cache_enabled
+        with phase('incremental'):
+            return compile_incremental(source, optimize,
+                                       CompilationCache() if cache_enabled() else None)
 
-    ast = parse(source)
-    check_program(ast)
+    with phase('parse'):
+        ast = parse(source)
+    with phase('check'):
+        check_program(ast)
 
     # If no errors occurred, generate code
     if not errors_reported():
-        gen = GenerateCode()
-        gen.visit(ast)
+        gen = GenerateCode(linenos)
+        with phase('ircode'):
+            gen.visit(ast)
 
         # !!!  This part will need to be changed slightly in Projects 7/8
+        if optimize:
+            from .opt import optimize_code
+            with phase('opt'):
+                return optimize_code(gen.code)
         return gen.code
     else:
         return []
@@ -19,7 +19,7 @@ Further instructions are contained in the comments below.
 
 from llvmlite.ir import (
     Module, IRBuilder, Function, IntType, DoubleType, VoidType, Constant, GlobalVariable,
-    FunctionType
+    FunctionType, PointerType, ArrayType, LiteralStructType, MetaDataString
     )
 
 # Declare the LLVM type objects that you want to use for the low-level
@@ -30,7 +30,13 @@ from llvmlite.ir import (
 
 int_type    = IntType(32)         # 32-bit integer
 float_type  = DoubleType()        # 64-bit float
-string_type = None                # Up to you (leave until the end)
+bool_type   = IntType(1)          # 1-bit integer (comparisons)
+
+# Strings are pointers to the gone_string structure of the runtime
+# (gonert.c): a 32-bit length followed by the bytes of the UTF-8 encoded
+# text and a terminating NUL.  They are passed around as byte pointers
+# and only the runtime looks inside.
+string_type = PointerType(IntType(8))
 
 void_type   = VoidType()          # Void type.  This is a special type
                                   # used for internal functions returning
@@ -43,8 +49,34 @@ typemap = {
     'int' : int_type,
     'float' : float_type,
     'string' : string_type,
+    'bool' : bool_type,
+}
+
+# Alignment in bytes of array elements.  Arrays themselves are aligned
+# to array_alignment so that vectorized loops can use aligned loads and
+# stores of whole SIMD registers.
+element_alignment = {
+    int_type: 4,
+    float_type: 8,
 }
 
+array_alignment = 32
+
+# Properties attached to every loop (see GenerateLLVM.loop_metadata)
+loop_properties = [
+    ('llvm.loop.vectorize.enable', True),
+    ('llvm.loop.unroll.enable',),
+]
+
+def string_constant(value):
+    '''
+    Return the LLVM constant for the gone_string holding value.
+    '''
+    data = bytearray(value.encode('utf-8') + b'\0')
+    return Constant(LiteralStructType([int_type, ArrayType(IntType(8), len(data))]),
+                    [Constant(int_type, len(data) - 1),
+                     Constant(ArrayType(IntType(8), len(data)), data)])
+
 # The following class is going to generate the LLVM instruction stream.  
 # The basic features of this class are going to mirror the experiments
 # you tried in Exercise 5.  The execution model is somewhat similar
@@ -72,7 +104,7 @@ typemap = {
 #    storage. 
 
 class GenerateLLVM(object):
-    def __init__(self, name='module'):
+    def __init__(self, name='module', function_name='main'):
         # Perform the basic LLVM initialization.  You need the following parts:
         #
         #    1.  A top-level Module object
@@ -86,7 +118,7 @@ class GenerateLLVM(object):
         self.module = Module(name)
         self.function = Function(self.module,
                                  FunctionType(void_type, []),
-                                 name='main')
+                                 name=function_name)
 
         self.block = self.function.append_basic_block('entry')
         self.builder = IRBuilder(self.block)
@@ -115,6 +147,15 @@ class GenerateLLVM(object):
         # you make anything in LLVM, it gets stored here.
         self.temps = {}
 
+        # String literals, mapping the text of each literal to its global
+        # constant.  Every occurrence of the same text shares the constant
+        self.strings = {}
+
+        # Basic blocks starting at the targets of jumps in linked code
+        # (see generate_code), mapping instruction index to block
+        self.labels = {}
+        self.pc = 0
+
         # Initialize the runtime library functions (see below)
         self.declare_runtime_library()
 
@@ -137,13 +178,65 @@ class GenerateLLVM(object):
                                                 FunctionType(void_type, [float_type]),
                                                 name="_print_float")
 
+        self.runtime['_print_bool'] = Function(self.module,
+                                               FunctionType(void_type, [int_type]),
+                                               name="_print_bool")
+
+        self.runtime['_print_string'] = Function(self.module,
+                                                 FunctionType(void_type, [string_type]),
+                                                 name="_print_string")
+
+        # Reports an array index out of range and stops the program
+        self.runtime['_gone_index_error'] = Function(self.module,
+                                                     FunctionType(void_type, [int_type, int_type]),
+                                                     name="_gone_index_error")
+        self.runtime['_gone_index_error'].attributes.add('noreturn')
+        self.runtime['_gone_index_error'].attributes.add('cold')
+
+        # String operations
+        self.runtime['_gone_str_concat'] = Function(self.module,
+                                                    FunctionType(string_type, [string_type, string_type]),
+                                                    name="_gone_str_concat")
+
+        self.runtime['_gone_str_repeat'] = Function(self.module,
+                                                    FunctionType(string_type, [string_type, int_type]),
+                                                    name="_gone_str_repeat")
+
+        self.runtime['_gone_str_compare'] = Function(self.module,
+                                                     FunctionType(int_type, [string_type, string_type]),
+                                                     name="_gone_str_compare")
+
+        self.runtime['_gone_str_equal'] = Function(self.module,
+                                                   FunctionType(int_type, [string_type, string_type]),
+                                                   name="_gone_str_equal")
+
+    def string_literal(self, value):
+        # Return a pointer to the constant gone_string for value
+        var = self.strings.get(value)
+        if var is None:
+            initializer = string_constant(value)
+            var = GlobalVariable(self.module, initializer.type,
+                                 name='.str.%d' % len(self.strings))
+            var.linkage = 'private'
+            var.global_constant = True
+            var.unnamed_addr = True
+            var.initializer = initializer
+            self.strings[value] = var
+        return var.bitcast(string_type)
+
     def generate_code(self, ircode):
         # Given a sequence of SSA intermediate code tuples, generate LLVM
         # instructions using the current builder (self.builder).  Each
         # opcode tuple (opcode, args) is dispatched to a method of the
         # form self.emit_opcode(args)
 
-        for opcode, *args in ircode:
+        #
+        # The code may also be linked code (see interp.BlockLinker), with
+        # jump and cbranch instructions whose targets are indices into
+        # ircode.  Each target starts a new basic block.
+
+        for self.pc, (opcode, *args) in enumerate(ircode):
+            self.start_instruction()
             if hasattr(self, 'emit_'+opcode):
                 getattr(self, 'emit_'+opcode)(*args)
             else:
@@ -151,8 +244,43 @@ class GenerateLLVM(object):
 
         # Add a return statement.  Note, at this point, we don't really have
         # user-defined functions so this is a bit of hack--it may be removed later.
+        self.pc = len(ircode)
+        self.start_instruction()
         self.builder.ret_void()
 
+    def label(self, pc):
+        '''
+        Return the basic block starting at instruction pc.
+        '''
+        if pc not in self.labels:
+            self.labels[pc] = self.function.append_basic_block('L%d' % pc)
+        return self.labels[pc]
+
+    def start_instruction(self):
+        if self.pc in self.labels:
+            if not self.builder.block.is_terminated:
+                self.builder.branch(self.labels[self.pc])
+            self.builder.position_at_end(self.labels[self.pc])
+        elif self.builder.block.is_terminated:
+            # Unreachable code following a jump
+            self.builder.position_at_end(self.function.append_basic_block('dead'))
+
+    def loop_metadata(self):
+        '''
+        Return a new loop ID for the branch back to the start of a loop.
+        It asks LLVM to vectorize and unroll the loop (see
+        loop_properties).  A loop ID must be a distinct node referring to
+        itself, so it's made with a unique placeholder that is replaced
+        by the reference afterwards.
+        '''
+        properties = [self.module.add_metadata([MetaDataString(self.module, name)] +
+                                               [Constant(bool_type, value) for value in values])
+                      for name, *values in loop_properties]
+        placeholder = MetaDataString(self.module, 'loop %d' % len(self.module.metadata))
+        loop = self.module.add_metadata([placeholder] + properties)
+        loop.operands = (loop,) + loop.operands[1:]
+        return loop
+
     # ----------------------------------------------------------------------
     # Opcode implementation.   You must implement the opcodes.  A few
     # sample opcodes have been given to get you started.
@@ -163,7 +291,10 @@ class GenerateLLVM(object):
         self.temps[target] = Constant(int_type, value)
 
     def emit_literal_float(self, value, target):
-        pass                # You must implement
+        self.temps[target] = Constant(float_type, value)
+
+    def emit_literal_string(self, value, target):
+        self.temps[target] = self.string_literal(value)
     
     # Allocation of variables.  Declare as global variables and set to
     # a sensible initial value.
@@ -173,8 +304,25 @@ class GenerateLLVM(object):
         self.vars[name] = var
 
     def emit_alloc_float(self, name):
-        pass                # You must implement
+        var = GlobalVariable(self.module, float_type, name=name)
+        var.initializer = Constant(float_type, 0.0)
+        self.vars[name] = var
 
+    def emit_alloc_string(self, name):
+        var = GlobalVariable(self.module, string_type, name=name)
+        var.initializer = self.string_literal('')
+        self.vars[name] = var
+
+
+    # Arrays are global variables holding an LLVM array of the elements
+    def emit_alloc_array_int(self, name, size, element_type=int_type):
+        var = GlobalVariable(self.module, ArrayType(element_type, size), name=name)
+        var.initializer = Constant(var.type.pointee, None)
+        var.align = array_alignment
+        self.vars[name] = var
+
+    def emit_alloc_array_float(self, name, size):
+        self.emit_alloc_array_int(name, size, float_type)
 
     # Load/store instructions for variables.  Load needs to pull a
     # value from a global variable and store in a temporary. Store
@@ -183,67 +331,193 @@ class GenerateLLVM(object):
         self.temps[target] = self.builder.load(self.vars[name], target)
 
     def emit_load_float(self, name, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.load(self.vars[name], target)
+
+    def emit_load_string(self, name, target):
+        self.temps[target] = self.builder.load(self.vars[name], target)
 
     def emit_store_int(self, source, target):
         self.builder.store(self.temps[source], self.vars[target])
 
     def emit_store_float(self, source, target):
-        pass                 # You must implement
+        self.builder.store(self.temps[source], self.vars[target])
+
+    def emit_store_string(self, source, target):
+        self.builder.store(self.temps[source], self.vars[target])
+
+
+    # Array elements.  The index has already been checked (check_index)
+    def element_pointer(self, name, index):
+        return self.builder.gep(self.vars[name], [Constant(int_type, 0), self.temps[index]],
+                                inbounds=True)
+
+    def emit_load_array_int(self, name, index, target):
+        pointer = self.element_pointer(name, index)
+        self.temps[target] = self.builder.load(pointer, target,
+                                               align=element_alignment[pointer.type.pointee])
 
+    emit_load_array_float = emit_load_array_int
+
+    def emit_store_array_int(self, source, name, index):
+        pointer = self.element_pointer(name, index)
+        self.builder.store(self.temps[source], pointer, align=element_alignment[pointer.type.pointee])
+
+    emit_store_array_float = emit_store_array_int
+
+    # Bounds check.  A single unsigned comparison also catches negative
+    # indices.  Code generation continues in the in-range block.
+    def emit_check_index(self, index, size):
+        value = self.temps[index]
+        in_range = self.builder.icmp_unsigned('<', value, Constant(int_type, size))
+        ok_block = self.function.append_basic_block('in_range')
+        error_block = self.function.append_basic_block('index_error')
+        branch = self.builder.cbranch(in_range, ok_block, error_block)
+        branch.set_weights([1000, 1])
+
+        self.builder.position_at_end(error_block)
+        self.builder.call(self.runtime['_gone_index_error'], [value, Constant(int_type, size)])
+        self.builder.unreachable()
+        self.builder.position_at_end(ok_block)
 
     # Binary + operator
     def emit_add_int(self, left, right, target):
         self.temps[target] = self.builder.add(self.temps[left], self.temps[right], target)
 
     def emit_add_float(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.fadd(self.temps[left], self.temps[right], target)
+
+    def emit_add_string(self, left, right, target):
+        self.temps[target] = self.builder.call(self.runtime['_gone_str_concat'],
+                                               [self.temps[left], self.temps[right]], target)
 
     # Binary - operator
     def emit_sub_int(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.sub(self.temps[left], self.temps[right], target)
 
     def emit_sub_float(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.fsub(self.temps[left], self.temps[right], target)
 
     # Binary * operator
     def emit_mul_int(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.mul(self.temps[left], self.temps[right], target)
 
     def emit_mul_float(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.fmul(self.temps[left], self.temps[right], target)
+
+    # The string is on the left and the count on the right (see ircode.py)
+    def emit_mul_string(self, left, right, target):
+        self.temps[target] = self.builder.call(self.runtime['_gone_str_repeat'],
+                                               [self.temps[left], self.temps[right]], target)
 
     # Binary / operator
+    # Integer division rounds towards minus infinity like in the
+    # interpreter (Python's //).  sdiv rounds towards zero, so the
+    # quotient is one less if the remainder and divisor differ in sign.
     def emit_div_int(self, left, right, target):
-        pass                 # You must implement
+        left, right = self.temps[left], self.temps[right]
+        quotient = self.builder.sdiv(left, right)
+        remainder = self.builder.srem(left, right)
+        signs = self.builder.xor(remainder, right)
+        adjust = self.builder.and_(self.builder.icmp_signed('!=', remainder, Constant(int_type, 0)),
+                                   self.builder.icmp_signed('<', signs, Constant(int_type, 0)))
+        self.temps[target] = self.builder.sub(quotient, self.builder.zext(adjust, int_type), target)
 
     def emit_div_float(self, left, right, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.fdiv(self.temps[left], self.temps[right], target)
 
     # Unary + operator
     def emit_uadd_int(self, source, target):
-        pass                 # You must implement
+        self.temps[target] = self.temps[source]
 
     def emit_uadd_float(self, source, target):
-        pass                 # You must implement
+        self.temps[target] = self.temps[source]
 
     # Unary - operator
     def emit_usub_int(self, source, target):
-        pass                 # You must implement
         self.temps[target] = self.builder.sub(
             Constant(int_type, 0),
             self.temps[source],
             target)
 
     def emit_usub_float(self, source, target):
-        pass                 # You must implement
+        self.temps[target] = self.builder.fsub(Constant(float_type, 0.0), self.temps[source], target)
+
+    # Integer comparisons
+    def _compare_int(self, op, left, right, target):
+        self.temps[target] = self.builder.icmp_signed(op, self.temps[left], self.temps[right], target)
+
+    def emit_lt_int(self, left, right, target):
+        self._compare_int('<', left, right, target)
+
+    def emit_le_int(self, left, right, target):
+        self._compare_int('<=', left, right, target)
+
+    def emit_gt_int(self, left, right, target):
+        self._compare_int('>', left, right, target)
+
+    def emit_ge_int(self, left, right, target):
+        self._compare_int('>=', left, right, target)
+
+    def emit_eq_int(self, left, right, target):
+        self._compare_int('==', left, right, target)
+
+    def emit_ne_int(self, left, right, target):
+        self._compare_int('!=', left, right, target)
+
+    # String comparisons.  The runtime returns an int that is compared
+    # with 0 to get the bool result
+    def _compare_string(self, op, func, left, right, target):
+        result = self.builder.call(self.runtime[func], [self.temps[left], self.temps[right]])
+        self.temps[target] = self.builder.icmp_signed(op, result, Constant(int_type, 0), target)
+
+    def emit_lt_string(self, left, right, target):
+        self._compare_string('<', '_gone_str_compare', left, right, target)
+
+    def emit_le_string(self, left, right, target):
+        self._compare_string('<=', '_gone_str_compare', left, right, target)
+
+    def emit_gt_string(self, left, right, target):
+        self._compare_string('>', '_gone_str_compare', left, right, target)
+
+    def emit_ge_string(self, left, right, target):
+        self._compare_string('>=', '_gone_str_compare', left, right, target)
+
+    def emit_eq_string(self, left, right, target):
+        self._compare_string('!=', '_gone_str_equal', left, right, target)
+
+    def emit_ne_string(self, left, right, target):
+        self._compare_string('==', '_gone_str_equal', left, right, target)
+
+    # Line numbers (see ircode.py) carry no code
+    def emit_line(self, lineno):
+        pass
+
+    # Jumps in linked code.  A jump back to an earlier instruction closes
+    # a loop and carries the loop's metadata
+    def emit_jump(self, target):
+        branch = self.builder.branch(self.label(target))
+        if target <= self.pc:
+            branch.set_metadata('llvm.loop', self.loop_metadata())
+
+    def emit_cbranch(self, testvar, true_target, false_target):
+        branch = self.builder.cbranch(self.temps[testvar], self.label(true_target),
+                                      self.label(false_target))
+        if min(true_target, false_target) <= self.pc:
+            branch.set_metadata('llvm.loop', self.loop_metadata())
 
     # Print statements
     def emit_print_int(self, source):
         self.builder.call(self.runtime['_print_int'], [self.temps[source]])
 
     def emit_print_float(self, source):
-        pass                 # You must implement
+        self.builder.call(self.runtime['_print_float'], [self.temps[source]])
+
+    def emit_print_string(self, source):
+        self.builder.call(self.runtime['_print_string'], [self.temps[source]])
+
+    def emit_print_bool(self, source):
+        value = self.builder.zext(self.temps[source], int_type)
+        self.builder.call(self.runtime['_print_bool'], [value])
 
     # Extern function declaration.  
     def emit_extern_func(self, name, rettypename, *parmtypenames):
@@ -254,27 +528,36 @@ class GenerateLLVM(object):
 
     # Call an external function.
     def emit_call_func(self, funcname, *args):
-        pass                 # You must implement
+        target = args[-1]
+        argvals = [self.temps[name] for name in args[:-1]]
+        self.temps[target] = self.builder.call(self.vars[funcname], argvals, target)
 
 #######################################################################
 #                      TESTING/MAIN PROGRAM
 #######################################################################
 
-def compile_llvm(source):
+def compile_llvm(source, optimize=False, incremental=False, jobs=0, optlevel=0):
     from .ircode import compile_ircode
+    from .phases import phase
 
     # Compile intermediate code 
     # !!! This needs to be changed in Project 7/8
-    code = compile_ircode(source)
+    code = compile_ircode(source, optimize, incremental)
+
+    # Generate (and optimize at optlevel) in parallel.  See parallel.py
+    if jobs:
+        from .parallel import generate_llvm
+        with phase('llvmgen (parallel)'):
+            return generate_llvm(code, jobs, optlevel)
 
     # Make the low-level code generator
     generator = GenerateLLVM()
 
     # Generate low-level code
     # !!! This needs to be changed in Project 7/8
-    generator.generate_code(code)
-
-    return str(generator.module)
+    with phase('llvmgen'):
+        generator.generate_code(code)
+        return str(generator.module)
 
 def main():
     import sys
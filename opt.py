@@ -0,0 +1,637 @@
+# gone/opt.py
+'''
+SSA Optimizer
+=============
+This file implements optimizations on the intermediate code produced
+by ircode.py.  Since both the interpreter and the LLVM backend take
+their input from the same instruction tuples, improving the code here
+benefits every backend.
+
+The optimizer is organized as a set of passes run by a PassManager.
+Each pass is a class with a method run(func) that rewrites the
+instructions in the blocks of a single function (func.start_block)
+in place and returns True if anything was changed.  Whole-program
+passes can instead define run_program(functions).  The pass manager
+keeps running the passes until nothing changes.  For example:
+
+       manager = PassManager([ConstantFolding(), DeadTemporaryElimination()])
+       manager.run(functions)
+
+The following passes are provided:
+
+       ConstantPropagation       Replace loads of global constants by literals
+       ConstantFolding           Evaluate operations on literal values
+       CopyPropagation           Eliminate copies (uadd, store followed by load)
+       CommonSubexpressions      Reuse previously computed values in a block
+       BoundsCheckElimination    Remove array index checks that can't fail
+       DeadTemporaryElimination  Remove instructions whose results are unused
+
+Use optimize(functions) to run all of them in a sensible order.  Until
+functions are implemented, the code of a program is a flat list of
+instructions.  optimize_code(code) optimizes it as the body of main().
+'''
+
+import operator
+from . import bblock
+
+# Operations that can be evaluated at compile time.  Division is left
+# to fold_division() below.
+foldable_binops = {
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'and': lambda x, y: x and y,
+    'or': lambda x, y: x or y,
+}
+
+foldable_unaryops = {
+    'uadd': operator.pos,
+    'usub': operator.neg,
+    'not': operator.not_,
+}
+
+# Operations that produce a bool regardless of their operand type
+comparison_ops = { 'lt', 'le', 'gt', 'ge', 'eq', 'ne' }
+
+# Range of the 32-bit integers used by the LLVM backend.  Folded
+# results outside of it are left for the backend to compute.
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+def split_opcode(opcode):
+    '''
+    Split an opcode such as 'add_int' into ('add', 'int')
+    '''
+    op, _, typename = opcode.rpartition('_')
+    return op, typename
+
+def is_binop(instr):
+    op, typename = split_opcode(instr[0])
+    return len(instr) == 4 and (op in foldable_binops or op == 'div')
+
+def is_unaryop(instr):
+    op, typename = split_opcode(instr[0])
+    return len(instr) == 3 and op in foldable_unaryops
+
+def uses(instr):
+    '''
+    Return the positions in an instruction that hold temporaries read
+    by the instruction.
+    '''
+    op, _ = split_opcode(instr[0])
+    if op in ('store', 'print', 'return'):
+        return range(1, min(len(instr), 2))
+    elif op == 'load_array':
+        return (2,)
+    elif op == 'store_array':
+        return (1, 3)
+    elif instr[0] == 'check_index':
+        return (1,)
+    elif op == 'call':
+        return range(2, len(instr) - 1)
+    elif is_binop(instr):
+        return (1, 2)
+    elif is_unaryop(instr):
+        return (1,)
+    return ()
+
+def target(instr):
+    '''
+    Return the temporary defined by an instruction (if any)
+    '''
+    op, _ = split_opcode(instr[0])
+    if op in ('literal', 'load', 'load_array', 'call') or is_binop(instr) or is_unaryop(instr):
+        return instr[-1]
+    return None
+
+def is_pure(instr):
+    '''
+    Return True if an instruction has no effect besides defining its target.
+    '''
+    return target(instr) is not None and not instr[0].startswith('call_')
+
+def rename_uses(blocks, mapping):
+    '''
+    Rewrite all uses of temporaries in a set of blocks according to a
+    mapping of old name -> new name.
+    '''
+    if not mapping:
+        return
+
+    def resolve(name):
+        while name in mapping:
+            name = mapping[name]
+        return name
+
+    for block in blocks:
+        for n, instr in enumerate(block.instructions):
+            positions = uses(instr)
+            if any(instr[i] in mapping for i in positions):
+                instr = list(instr)
+                for i in positions:
+                    instr[i] = resolve(instr[i])
+                block.instructions[n] = tuple(instr)
+        if getattr(block, 'testvar', None) in mapping:
+            block.testvar = resolve(block.testvar)
+
+class Pass(object):
+    '''
+    Base class for all optimization passes.
+    '''
+    def run(self, func):
+        '''
+        Optimize a single function.  Return True if the code changed.
+        '''
+        return False
+
+    def run_program(self, functions):
+        '''
+        Optimize a whole program.  By default, optimizes each function.
+        '''
+        changed = False
+        for func in functions:
+            changed |= bool(self.run(func))
+        return changed
+
+class ConstantPropagation(Pass):
+    '''
+    Replace loads of global constants by their literal value.  A global
+    counts as a constant if it is stored exactly once, from a literal,
+    at the start of the program before any function has been called.
+    This covers the values of const declarations such as:
+
+         const pi = 3.14159;
+
+    The program starts in the __init function.  Until functions are
+    implemented, there is no __init and the whole program is the body
+    of main() (see ircode.main_function).  Its variables are then
+    allocated in main() and the store must come before the loads in
+    its first block.  CopyPropagation already handles loads that follow
+    the store in the same block, so this mostly matters for loads after
+    a call and in the other blocks and functions of the program.
+    '''
+    def run_program(self, functions):
+        names = { func.name for func in functions }
+        init = '__init' if '__init' in names else 'main'
+        stores = {}
+        candidates = {}
+        localnames = {}
+        for func in functions:
+            localnames[func] = set()
+            for block in bblock.all_blocks(func.start_block):
+                for instr in block.instructions:
+                    op, typename = split_opcode(instr[0])
+                    if op in ('alloc', 'parm'):
+                        localnames[func].add(instr[1])
+                    elif op == 'store':
+                        stores[instr[2]] = stores.get(instr[2], 0) + 1
+            if func.name == init:
+                # Variables of the program are globals even if they are
+                # allocated in main()
+                localnames[func] = set()
+                literals = {}
+                for n, instr in enumerate(func.start_block.instructions):
+                    op, typename = split_opcode(instr[0])
+                    if op == 'literal':
+                        literals[instr[2]] = instr[1]
+                    elif op == 'store' and instr[1] in literals:
+                        candidates.setdefault(instr[2], (typename, literals[instr[1]], n))
+                    elif op == 'call':
+                        break
+
+        constants = { name: value for name, value in candidates.items() if stores[name] == 1 }
+        changed = False
+        for func in functions:
+            for block in bblock.all_blocks(func.start_block):
+                for n, instr in enumerate(block.instructions):
+                    if (instr[0].startswith('load_') and instr[1] in constants
+                        and instr[1] not in localnames[func]):
+                        typename, value, stored_at = constants[instr[1]]
+                        if func.name == init and block is func.start_block and n < stored_at:
+                            # Loaded before the store
+                            continue
+                        block.instructions[n] = ('literal_' + typename, value, instr[2])
+                        changed = True
+        return changed
+
+class ConstantFolding(Pass):
+    '''
+    Evaluate binary and unary operations whose operands are literals
+    and replace them by a literal of the result.
+    '''
+    def run(self, func):
+        literals = {}
+        changed = False
+        for block in bblock.all_blocks(func.start_block):
+            for n, instr in enumerate(block.instructions):
+                op, typename = split_opcode(instr[0])
+                if op == 'literal':
+                    literals[instr[2]] = instr[1]
+                    continue
+                if any(instr[i] not in literals for i in uses(instr)) or not uses(instr):
+                    continue
+
+                if is_binop(instr):
+                    result = self.fold_binop(op, typename, literals[instr[1]], literals[instr[2]])
+                elif is_unaryop(instr):
+                    result = foldable_unaryops[op](literals[instr[1]])
+                else:
+                    continue
+
+                if result is None:
+                    continue
+                if op in comparison_ops:
+                    typename = 'bool'
+                if typename == 'int' and not INT_MIN <= result <= INT_MAX:
+                    continue
+                block.instructions[n] = ('literal_' + typename, result, instr[-1])
+                literals[instr[-1]] = result
+                changed = True
+        return changed
+
+    def fold_binop(self, op, typename, left, right):
+        if type(left) != type(right):
+            # Mixed operations such as string replication are left alone
+            return None
+        if op == 'div':
+            return self.fold_division(typename, left, right)
+        return foldable_binops[op](left, right)
+
+    def fold_division(self, typename, left, right):
+        if right == 0:
+            return None
+        if typename == 'int':
+            # Only fold where floor and truncating division agree so that
+            # the result is the same in every backend
+            if (left < 0) != (right < 0) and left % right:
+                return None
+            return left // right
+        return left / right
+
+class CopyPropagation(Pass):
+    '''
+    Replace uses of temporaries that are plain copies of another
+    temporary.  A copy is either a unary + or a load of a variable that
+    was just stored in the same block, such as:
+
+         ('store_int', '__int_3', 'a')
+         ('load_int', 'a', '__int_4')       # __int_4 is a copy of __int_3
+    '''
+    def run(self, func):
+        blocks = bblock.all_blocks(func.start_block)
+        copies = {}
+        for block in blocks:
+            stored = {}
+            code = []
+            for instr in block.instructions:
+                op, _ = split_opcode(instr[0])
+                if op == 'uadd' and instr[2] != instr[1]:
+                    copies[instr[2]] = instr[1]
+                    continue
+                elif op == 'load' and instr[1] in stored:
+                    copies[instr[2]] = stored[instr[1]]
+                    continue
+                elif op == 'store':
+                    stored[instr[2]] = instr[1]
+                elif op == 'call':
+                    # Functions may change global variables
+                    stored.clear()
+                code.append(instr)
+            block.instructions = code
+        rename_uses(blocks, copies)
+        return bool(copies)
+
+class CommonSubexpressions(Pass):
+    '''
+    Eliminate repeated computations of the same value within a block.
+    Loads of a variable (or array element) are reused until the variable
+    (any element of the array) is stored or a function is called.
+    '''
+    def run(self, func):
+        blocks = bblock.all_blocks(func.start_block)
+        replaced = {}
+        for block in blocks:
+            available = {}
+            code = []
+            for instr in block.instructions:
+                op, _ = split_opcode(instr[0])
+                if op == 'store':
+                    available.pop((instr[0].replace('store', 'load'), instr[2]), None)
+                elif op == 'store_array':
+                    load = instr[0].replace('store', 'load')
+                    available = { key: value for key, value in available.items()
+                                  if not (key[0] == load and key[1] == instr[2]) }
+                elif op == 'call':
+                    available = { key: value for key, value in available.items()
+                                  if not key[0].startswith('load_') }
+                if is_pure(instr):
+                    if op == 'literal':
+                        # repr() keeps values like 0.0 and -0.0 apart
+                        key = (instr[0], repr(instr[1]))
+                    else:
+                        key = tuple(replaced.get(v, v) for v in instr[:-1])
+                    if key in available:
+                        replaced[instr[-1]] = available[key]
+                        continue
+                    available[key] = instr[-1]
+                code.append(instr)
+            block.instructions = code
+        rename_uses(blocks, replaced)
+        return bool(replaced)
+
+class BoundsCheckElimination(Pass):
+    '''
+    Remove ('check_index', index, size) instructions that can't fail
+    because the index is known to be in the range 0 ... size-1.  The
+    range of each int temporary is tracked from
+
+         - literals, and add/sub/mul of temporaries with known ranges
+         - earlier checks: after a check of an index, the blocks that
+           the check dominates know that the index is in range
+         - induction variables of loops such as
+
+               while i < n {          // n is a literal
+                   ... a[i] ...
+                   i = i + 1;
+               }
+
+           A load of i is below n if it can only be reached from the
+           loop test without passing a store to i.  For this to hold,
+           i must be a local int that is never negative: every store to
+           it is of a literal >= 0 or of i + k (k a literal >= 0) made
+           where i is known to be in range, so i can't overflow.
+
+    Checks are only ever removed, never hoisted out of loops, since a
+    hoisted check could report an error that the program never reaches.
+    '''
+    # Comparisons that bound their left (right for 'gt'/'ge') operand
+    # from above.  The value is added to the literal to get the bound.
+    upper_bounds = { 'lt_int': -1, 'le_int': 0 }
+    lower_bounds = { 'gt_int': -1, 'ge_int': 0 }
+
+    def run(self, func):
+        cfg = bblock.ControlFlowGraph(func.start_block)
+        self.cfg = cfg
+        self.literals = {}
+        self.defs = {}
+        for block in cfg.blocks:
+            for instr in block.instructions:
+                if instr[0] == 'literal_int':
+                    self.literals[instr[2]] = instr[1]
+                if target(instr) is not None:
+                    self.defs[instr[-1]] = instr
+
+        ranges = self.induction_ranges()
+        changed = False
+
+        # Walk the dominator tree.  Ranges learned from checks are undone
+        # when leaving the subtree of the block holding the check.
+        stack = [(0, None)]
+        while stack:
+            n, undo = stack.pop()
+            if undo is not None:
+                for name, value in undo.items():
+                    if value is None:
+                        del ranges[name]
+                    else:
+                        ranges[name] = value
+                continue
+            block = cfg.blocks[n]
+            undo = {}
+            code = []
+            for instr in block.instructions:
+                if instr[0] == 'check_index':
+                    index, size = instr[1], instr[2]
+                    low, high = ranges.get(index, (INT_MIN, INT_MAX))
+                    if 0 <= low and high < size:
+                        changed = True
+                        continue
+                    undo.setdefault(index, ranges.get(index))
+                    ranges[index] = (max(low, 0), min(high, size - 1))
+                elif target(instr) is not None and instr[-1] not in ranges:
+                    result = self.evaluate(instr, ranges)
+                    if result is not None:
+                        ranges[instr[-1]] = result
+                code.append(instr)
+            block.instructions = code
+            stack.append((n, undo))
+            stack.extend((child, None) for child in cfg.dom_children[n])
+        return changed
+
+    def evaluate(self, instr, ranges):
+        '''
+        Return the range (low, high) of the result of instr or None.
+        '''
+        opcode = instr[0]
+        if opcode == 'literal_int':
+            return (instr[1], instr[1])
+        if opcode not in ('add_int', 'sub_int', 'mul_int'):
+            return None
+        left, right = ranges.get(instr[1]), ranges.get(instr[2])
+        if left is None or right is None:
+            return None
+        if opcode == 'add_int':
+            low, high = left[0] + right[0], left[1] + right[1]
+        elif opcode == 'sub_int':
+            low, high = left[0] - right[1], left[1] - right[0]
+        else:
+            products = [x * y for x in left for y in right]
+            low, high = min(products), max(products)
+        if low < INT_MIN or high > INT_MAX:
+            return None
+        return (low, high)
+
+    def loop_bound(self, header):
+        '''
+        If the test of a while loop compares a variable loaded in the
+        loop header with a literal, return (variable, upper bound of the
+        variable in the body).
+        '''
+        test = self.defs.get(getattr(header, 'testvar', None))
+        if test is None:
+            return None
+        if test[0] in self.upper_bounds:
+            var, bound, adjust = test[1], test[2], self.upper_bounds[test[0]]
+        elif test[0] in self.lower_bounds:
+            var, bound, adjust = test[2], test[1], self.lower_bounds[test[0]]
+        else:
+            return None
+        if bound not in self.literals:
+            return None
+        for n, instr in enumerate(header.instructions):
+            if instr[0] == 'load_int' and instr[2] == var:
+                name = instr[1]
+                if any(later[0] == 'store_int' and later[2] == name
+                       for later in header.instructions[n+1:]):
+                    return None
+                return name, self.literals[bound] + adjust
+        return None
+
+    def loop_loads(self, loop, name):
+        '''
+        Return the temporaries holding loads of name in the loop that
+        are only reached from the loop test without a store to name.
+        '''
+        cfg = self.cfg
+        members = [n for n in bblock.bits(loop.blocks) if n != loop.header]
+        stores = { n for n in members
+                   if any(instr[0] == 'store_int' and instr[2] == name
+                          for instr in cfg.blocks[n].instructions) }
+
+        # Forward "must" dataflow: the bound holds on entry to a block if
+        # it holds at the end of every predecessor in the loop (the test
+        # at the header establishes it)
+        holds_in = { n: True for n in members }
+        changed = True
+        while changed:
+            changed = False
+            for n in members:
+                value = all(p == loop.header or (p in holds_in and holds_in[p] and p not in stores)
+                            for p in cfg.preds[n])
+                if value != holds_in[n]:
+                    holds_in[n] = value
+                    changed = True
+
+        loads = []
+        for n in members:
+            if not holds_in[n]:
+                continue
+            for instr in cfg.blocks[n].instructions:
+                if instr[0] == 'store_int' and instr[2] == name:
+                    break
+                if instr[0] == 'load_int' and instr[1] == name:
+                    loads.append(instr[2])
+        return loads
+
+    def induction_ranges(self):
+        '''
+        Return a dict mapping the temporaries holding loads of loop
+        induction variables to their range.
+        '''
+        cfg = self.cfg
+        bounded = {}                    # name -> [(loop, bound)]
+        for loop in cfg.loops:
+            found = self.loop_bound(cfg.blocks[loop.header])
+            if found is not None and found[1] >= 0:
+                name, bound = found
+                bounded.setdefault(name, []).append((loop, bound))
+        if not bounded:
+            return {}
+
+        # Only locals can't be changed by function calls
+        local = { instr[1] for block in cfg.blocks for instr in block.instructions
+                  if instr[0] == 'alloc_int' }
+
+        ranges = {}
+        for name, loops in bounded.items():
+            if name not in local:
+                continue
+            loads = {}
+            for loop, bound in loops:
+                for temp in self.loop_loads(loop, name):
+                    loads[temp] = min(bound, loads.get(temp, bound))
+
+            # Check that name is never negative and can't overflow
+            safe = True
+            for block in cfg.blocks:
+                for instr in block.instructions:
+                    if instr[0] != 'store_int' or instr[2] != name:
+                        continue
+                    source = self.defs.get(instr[1])
+                    if instr[1] in self.literals:
+                        safe = self.literals[instr[1]] >= 0
+                    elif source is not None and source[0] == 'add_int':
+                        left, right = source[1], source[2]
+                        if left not in loads:
+                            left, right = right, left
+                        safe = (left in loads and right in self.literals and
+                                0 <= self.literals[right] <= INT_MAX - loads[left])
+                    else:
+                        safe = False
+                    if not safe:
+                        break
+                if not safe:
+                    break
+            if safe:
+                for temp, bound in loads.items():
+                    ranges[temp] = (0, bound)
+        return ranges
+
+class DeadTemporaryElimination(Pass):
+    '''
+    Remove side-effect free instructions whose result is never used.
+    '''
+    def run(self, func):
+        blocks = bblock.all_blocks(func.start_block)
+        changed = False
+        while True:
+            used = set()
+            for block in blocks:
+                for instr in block.instructions:
+                    used.update(instr[i] for i in uses(instr))
+                if getattr(block, 'testvar', None) is not None:
+                    used.add(block.testvar)
+
+            removed = False
+            for block in blocks:
+                code = [instr for instr in block.instructions
+                        if not is_pure(instr) or instr[-1] in used]
+                if len(code) != len(block.instructions):
+                    block.instructions = code
+                    removed = True
+            if not removed:
+                return changed
+            changed = True
+
+class PassManager(object):
+    '''
+    Runs a list of passes over a program until the code stops changing
+    (or max_iterations is reached).
+    '''
+    def __init__(self, passes=None, max_iterations=10):
+        self.passes = list(passes) if passes is not None else default_passes()
+        self.max_iterations = max_iterations
+
+    def add(self, optpass):
+        self.passes.append(optpass)
+
+    def run(self, functions):
+        for _ in range(self.max_iterations):
+            changed = False
+            for optpass in self.passes:
+                changed |= bool(optpass.run_program(functions))
+            if not changed:
+                break
+        return functions
+
+def default_passes():
+    return [
+        ConstantPropagation(),
+        ConstantFolding(),
+        CopyPropagation(),
+        CommonSubexpressions(),
+        BoundsCheckElimination(),
+        DeadTemporaryElimination(),
+    ]
+
+def optimize(functions):
+    '''
+    Optimize a list of functions using the default passes.
+    '''
+    return PassManager().run(functions)
+
+def optimize_code(code):
+    '''
+    Optimize the flat code of a program (run as the body of main(), see
+    ircode.main_function) and return the optimized code.
+    '''
+    from .ircode import main_function
+    func = main_function(code)
+    optimize([func])
+    return func.start_block.instructions
@@ -0,0 +1,149 @@
+# gone/parallel.py
+'''
+Parallel Code Generation
+========================
+compile_llvm() emits the whole program into a single LLVM module
+using one GenerateLLVM object.  For large programs, generating and
+optimizing that module is the slowest part of compilation.  This file
+spreads the work over several processes instead:
+
+  1. The intermediate code is partitioned into pieces.  Since all of
+     the code lives in main() at this point, main() is cut at places
+     where no temporary is live, so each piece is a self-contained
+     sequence of statements.
+
+  2. Each piece is compiled by a worker of a ProcessPoolExecutor into
+     its own LLVM module holding a function __main_<n>.  The worker
+     declares the global variables and external functions that the
+     piece uses but doesn't define, runs the LLVM optimizer over the
+     module and returns it as bitcode.
+
+  3. The modules are linked (llvm.link_modules) into one module whose
+     main() calls the pieces in order.
+
+The result is LLVM text that can be run or compiled like the output of
+compile_llvm() (it has already been optimized):
+
+       code = compile_ircode(source)
+       llvm_code = generate_llvm(code, jobs=8, optlevel=2)
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import llvmlite.binding as llvm
+from llvmlite.ir import Module, Function, FunctionType, GlobalVariable, IRBuilder, ArrayType
+
+from . import opt
+from . import run
+from .llvmgen import GenerateLLVM, typemap, void_type, array_alignment
+
+# Don't bother splitting code into pieces smaller than this
+MIN_PARTITION = 2000
+
+def split_points(code):
+    '''
+    Return the indices of the instructions before which no temporary
+    is live.  The code may be cut at any of these points.
+    '''
+    last_use = {}
+    for n, instr in enumerate(code):
+        for i in opt.uses(instr):
+            last_use[instr[i]] = n
+
+    points = []
+    horizon = -1
+    for n, instr in enumerate(code):
+        if horizon < n:
+            points.append(n)
+        target = opt.target(instr)
+        if target is not None:
+            horizon = max(horizon, last_use.get(target, n))
+    return points
+
+def partition(code, nparts, min_size=MIN_PARTITION):
+    '''
+    Partition code into at most nparts pieces of about the same size
+    (and at least min_size instructions).  extern_func instructions
+    are left out.  They are declared in every piece.
+    '''
+    code = [instr for instr in code if instr[0] != 'extern_func']
+    nparts = max(1, min(nparts, len(code) // max(min_size, 1)))
+    size = len(code) / nparts
+    pieces = []
+    start = 0
+    for point in split_points(code):
+        if point > start and point >= size * (len(pieces) + 1):
+            pieces.append(code[start:point])
+            start = point
+    pieces.append(code[start:])
+    return pieces
+
+def piece_name(n):
+    return '__main_%d' % n
+
+def generate_piece(name, code, externs, optlevel, arrays=()):
+    '''
+    Generate an optimized LLVM module for one piece of code.  Runs in
+    a worker process.  Returns the module as bitcode.  arrays holds the
+    alloc_array instructions of the whole program.
+    '''
+    generator = GenerateLLVM(name, function_name=name)
+
+    # Variables allocated by other pieces are declared as external
+    allocated = { instr[1] for instr in code if instr[0].startswith('alloc_') }
+    for instr in arrays:
+        op, typename = opt.split_opcode(instr[0])
+        if instr[1] not in allocated:
+            var = GlobalVariable(generator.module, ArrayType(typemap[typename], instr[2]), instr[1])
+            var.align = array_alignment
+            generator.vars[instr[1]] = var
+    for instr in code:
+        op, typename = opt.split_opcode(instr[0])
+        if op in ('load', 'store'):
+            varname = instr[1] if op == 'load' else instr[2]
+            if varname not in allocated and varname not in generator.vars:
+                generator.vars[varname] = GlobalVariable(generator.module, typemap[typename], varname)
+
+    generator.generate_code(externs + code)
+    mod = llvm.parse_assembly(str(generator.module))
+    mod.verify()
+    run.optimize(mod, run.create_target_machine(optlevel), optlevel)
+    return mod.as_bitcode()
+
+def generate_main(names):
+    '''
+    Generate the module with the main() function calling each piece.
+    '''
+    module = Module('module')
+    main = Function(module, FunctionType(void_type, []), name='main')
+    builder = IRBuilder(main.append_basic_block('entry'))
+    for name in names:
+        builder.call(Function(module, FunctionType(void_type, []), name=name), [])
+    builder.ret_void()
+    return llvm.parse_assembly(str(module))
+
+def generate_llvm(code, jobs=None, optlevel=0, min_size=MIN_PARTITION):
+    '''
+    Generate LLVM text for intermediate code using up to jobs worker
+    processes (default: one per CPU).
+    '''
+    run.initialize()
+    jobs = jobs or os.cpu_count() or 1
+    pieces = partition(code, jobs, min_size)
+    names = [piece_name(n) for n in range(len(pieces))]
+    externs = [instr for instr in code if instr[0] == 'extern_func']
+    arrays = [instr for instr in code if instr[0].startswith('alloc_array_')]
+    args = [(name, piece, externs, optlevel, arrays) for name, piece in zip(names, pieces)]
+
+    if jobs > 1 and len(pieces) > 1:
+        with ProcessPoolExecutor(min(jobs, len(pieces)), initializer=run.initialize) as pool:
+            bitcodes = list(pool.map(generate_piece, *zip(*args)))
+    else:
+        bitcodes = [generate_piece(*arg) for arg in args]
+
+    mod = generate_main(names)
+    for bitcode in bitcodes:
+        llvm.link_modules(mod, llvm.parse_bitcode(bitcode))
+    mod.verify()
+    return str(mod)
@@ -73,13 +73,18 @@ empty    :
 To do the project, follow the instructions contained below.
 '''
 
+import os
 import sys
+import pickle
+import hashlib
 # ----------------------------------------------------------------------
 # parsers are defined using SLY.  You inherit from the Parser class
 #
 # See http://sly.readthedocs.io/en/latest/
 # ----------------------------------------------------------------------
+import sly
 from sly import Parser
+from sly.yacc import ParserMeta
 
 # ----------------------------------------------------------------------
 # The following import loads a function error(lineno,msg) that should be
@@ -91,19 +96,106 @@ from .errors import error
 # ----------------------------------------------------------------------
 # Import the lexer class.  It's token list is needed to validate and
 # build the parser object.
-from .tokenizer import GoneLexer
+from .tokenizer import GoneLexer, tokenize_file
 
 # ----------------------------------------------------------------------
 # Get the AST nodes.  
 # Read instructions in ast.py
 from .ast import *
+from . import ast
 
 
-class GoneParser(Parser):
+# ----------------------------------------------------------------------
+# Precomputed parsing tables.
+#
+# SLY computes the LALR(1) tables when the parser class is defined,
+# which dominates the startup time of the compiler.  The metaclass below
+# saves the tables to the file parsetab.pickle (next to this file) the
+# first time they are built and afterwards loads them from there.  Only
+# the grammar itself (which is cheap) is rebuilt.  The saved tables are
+# tagged with a signature of the grammar so that any change to the
+# grammar rules causes them to be rebuilt.
+#
+# Set the environment variable GONE_PARSER_DEBUG to a filename to get
+# a description of the grammar and tables written there.
+# ----------------------------------------------------------------------
+
+_tabfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsetab.pickle')
+
+class ParseTables(object):
+    '''
+    The parts of sly.yacc.LRTable that are needed to parse
+    '''
+    def __init__(self, lr_action, lr_goto, defaulted_states):
+        self.lr_action = lr_action
+        self.lr_goto = lr_goto
+        self.defaulted_states = defaulted_states
+
+def grammar_signature(cls):
+    h = hashlib.sha256(sly.__version__.encode('utf-8'))
+    h.update(repr(getattr(cls, 'precedence', ())).encode('utf-8'))
+    for p in cls._grammar.Productions:
+        h.update(repr((p.name, p.prod, p.prec)).encode('utf-8'))
+    return h.hexdigest()
+
+class CachedParserMeta(ParserMeta):
+    '''
+    Metaclass for parsers that load their tables from _tabfile.
+    This mirrors sly.yacc.ParserMeta.__new__ except for the table
+    construction.
+    '''
+    def __new__(meta, clsname, bases, attributes):
+        del attributes['_']
+        cls = type.__new__(meta, clsname, bases, attributes)
+        if cls.debugfile or not meta.load_tables(cls, list(attributes.items())):
+            cls._build(list(attributes.items()))
+            meta.save_tables(cls)
+        return cls
+
+    @staticmethod
+    def load_tables(cls, definitions):
+        try:
+            with open(_tabfile, 'rb') as f:
+                tables = pickle.load(f)
+        except Exception:
+            return False
+
+        # Build the grammar (but not the tables) using SLY's own methods
+        rules = cls._Parser__collect_rules(definitions)
+        if not cls._Parser__validate_specification():
+            return False
+        cls._Parser__build_grammar(rules)
+        if tables.get('signature') != grammar_signature(cls):
+            return False
+        cls._lrtable = ParseTables(tables['lr_action'], tables['lr_goto'],
+                                   tables['defaulted_states'])
+        return True
+
+    @staticmethod
+    def save_tables(cls):
+        tables = {
+            'signature': grammar_signature(cls),
+            'lr_action': cls._lrtable.lr_action,
+            'lr_goto': cls._lrtable.lr_goto,
+            'defaulted_states': cls._lrtable.defaulted_states,
+        }
+        try:
+            with open(_tabfile + '.tmp', 'wb') as f:
+                pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(_tabfile + '.tmp', _tabfile)
+        except OSError:
+            # Read-only installation.  The tables will just be rebuilt.
+            pass
+
+class GoneParser(Parser, metaclass=CachedParserMeta):
     # Same token set as defined in the lexer
-    debugfile = 'parser.out'
+    debugfile = os.environ.get('GONE_PARSER_DEBUG')
     tokens = GoneLexer.tokens
 
+    # Where the AST node classes come from.  Any object with attributes
+    # named after the classes in ast.py will do (see arena.py)
+    nodes = ast
+
     # ----------------------------------------------------------------------
     # Operator precedence table.   Operators must follow the same 
     # precedence rules as in Python.  Instructions to be given in the project.
@@ -141,7 +233,7 @@ class GoneParser(Parser):
     #
     # @_('PRINT expr SEMI')
     # def print_statement(self, p):
-    #     return PrintStatement(p.expr, lineno=p.lineno)
+    #     return self.nodes.PrintStatement(p.expr, lineno=p.lineno)
     #
     # STARTING OUT
     # ============
@@ -160,7 +252,7 @@ class GoneParser(Parser):
 
     @_('statement')
     def statements(self, p):
-        return Statements([p.statement])
+        return self.nodes.Statements([p.statement])
 
     @_('print_statement',
        'const_declaration',
@@ -173,7 +265,7 @@ class GoneParser(Parser):
 
     @_('PRINT expression SEMI')
     def print_statement(self, p):
-        return PrintStatement(p.expression)
+        return self.nodes.PrintStatement(p.expression)
 
     @_('literal')
     def expression(self, p):
@@ -181,15 +273,15 @@ class GoneParser(Parser):
 
     @_('INTEGER')
     def literal(self, p):
-        return Literal(p.INTEGER, 'int', lineno=p.lineno)
+        return self.nodes.Literal(p.INTEGER, 'int', lineno=p.lineno)
 
     @_('FLOAT')
     def literal(self, p):
-        return Literal(p.FLOAT, 'float', lineno=p.lineno)
+        return self.nodes.Literal(p.FLOAT, 'float', lineno=p.lineno)
 
     @_('STRING')
     def literal(self, p):
-        return Literal(p.STRING, 'string', lineno=p.lineno)
+        return self.nodes.Literal(p.STRING, 'string', lineno=p.lineno)
 
     @_('LPAREN expression RPAREN')
     def expression(self, p):
@@ -200,24 +292,24 @@ class GoneParser(Parser):
        'expression TIMES expression',
        'expression DIVIDE expression')
     def expression(self, p):
-        return BinOp(p[1], p.expression0, p.expression1, lineno=p.lineno)
+        return self.nodes.BinOp(p[1], p.expression0, p.expression1, lineno=p.lineno)
 
     @_('PLUS expression %prec UNARY',
        'MINUS expression %prec UNARY')
     def expression(self, p):
-        return Unaryop(p[0], p.expression, lineno=p.lineno)
+        return self.nodes.Unaryop(p[0], p.expression, lineno=p.lineno)
 
     @_('CONST ID ASSIGN expression SEMI')
     def const_declaration(self, p):
-        return ConstDeclaration(p.ID, p.expression, lineno=p.lineno)
+        return self.nodes.ConstDeclaration(p.ID, p.expression, lineno=p.lineno)
 
     @_('VAR ID datatype SEMI')
     def var_declaration(self, p):
-        return VarDeclaration(p.ID, p.datatype, None, lineno=p.lineno)
+        return self.nodes.VarDeclaration(p.ID, p.datatype, None, lineno=p.lineno)
 
     @_('VAR ID datatype ASSIGN expression SEMI')
     def var_declaration(self, p):
-        return VarDeclaration(p.ID, p.datatype, p.expression, lineno=p.lineno)
+        return self.nodes.VarDeclaration(p.ID, p.datatype, p.expression, lineno=p.lineno)
 
     @_('load_location')
     def expression(self, p):
@@ -229,31 +321,31 @@ class GoneParser(Parser):
 
     @_('typename LBRACKET expression RBRACKET')
     def datatype(self, p):
-        return ArrayType(p.typename, p.expression, lineno=p.lineno)
+        return self.nodes.ArrayType(p.typename, p.expression, lineno=p.lineno)
 
     @_('ID')
     def typename(self, p):
-        return Typename(p.ID, lineno=p.lineno)
+        return self.nodes.Typename(p.ID, lineno=p.lineno)
 
     @_('ID')
     def load_location(self, p):
-        return LoadVariable(p.ID, lineno=p.lineno)
+        return self.nodes.LoadVariable(p.ID, lineno=p.lineno)
 
     @_('store_location ASSIGN expression SEMI')
     def assign_statement(self, p):
-        return AssignmentStatement(p.store_location, p.expression, lineno=p.lineno)
+        return self.nodes.AssignmentStatement(p.store_location, p.expression, lineno=p.lineno)
 
     @_('ID')
     def store_location(self, p):
-        return StoreVariable(p.ID, lineno=p.lineno)
+        return self.nodes.StoreVariable(p.ID, lineno=p.lineno)
 
     @_('ID LPAREN exprlist RPAREN')
     def expression(self, p):
-        return FunctionCall(p.ID, p.exprlist, lineno=p.lineno)
+        return self.nodes.FunctionCall(p.ID, p.exprlist, lineno=p.lineno)
 
     @_('ID LPAREN RPAREN')
     def expression(self, p):
-        return FunctionCall(p.ID, [], lineno=p.lineno)
+        return self.nodes.FunctionCall(p.ID, [], lineno=p.lineno)
 
     @_('exprlist COMMA expression')
     def exprlist(self, p):
@@ -266,16 +358,16 @@ class GoneParser(Parser):
 
     @_('EXTERN func_prototype SEMI')
     def extern_declaration(self, p):
-        return ExternFunctionDeclaration(p.func_prototype, lineno=p.lineno)
+        return self.nodes.ExternFunctionDeclaration(p.func_prototype, lineno=p.lineno)
 
     @_('FUNC ID LPAREN parameters RPAREN datatype')
     def func_prototype(self, p):
-        return FunctionPrototype(p.ID, p.parameters, p.datatype, lineno=p.lineno)
+        return self.nodes.FunctionPrototype(p.ID, p.parameters, p.datatype, lineno=p.lineno)
 
 
     @_('FUNC ID LPAREN RPAREN datatype')
     def func_prototype(self, p):
-        return FunctionPrototype(p.ID, [], p.datatype, lineno=p.lineno)
+        return self.nodes.FunctionPrototype(p.ID, [], p.datatype, lineno=p.lineno)
 
     @_('parm_declaration')
     def parameters(self, p):
@@ -288,16 +380,16 @@ class GoneParser(Parser):
 
     @_('ID datatype')
     def parm_declaration(self, p):
-        return ParmDeclaration(p.ID, p.datatype, lineno=p.lineno)
+        return self.nodes.ParmDeclaration(p.ID, p.datatype, lineno=p.lineno)
 
     @_('ID LBRACKET expression RBRACKET')
     def store_location(self, p):
-        return StoreArray(p.ID, p.expression, lineno=p.lineno)
+        return self.nodes.StoreArray(p.ID, p.expression, lineno=p.lineno)
 
 
     @_('ID LBRACKET expression RBRACKET')
     def load_location(self, p):
-        return LoadArray(p.ID, p.expression, lineno=p.lineno)
+        return self.nodes.LoadArray(p.ID, p.expression, lineno=p.lineno)
 
     # ----------------------------------------------------------------------
     # DO NOT MODIFY
@@ -315,17 +407,28 @@ class GoneParser(Parser):
 #                     DO NOT MODIFY ANYTHING BELOW HERE
 # ----------------------------------------------------------------------
 
-def parse(source):
+def parse(source, lexer=None):
     '''
     Parse source code into an AST. Return the top of the AST tree.
+    A different lexer (such as dfalex.DFALexer) may optionally be given.
     '''
     # import ipdb
     # ipdb.set_trace()
-    lexer = GoneLexer()
+    if lexer is None:
+        lexer = GoneLexer()
     parser = GoneParser()
     ast = parser.parse(lexer.tokenize(source))
     return ast
 
+def parse_file(filename):
+    '''
+    Parse a source file into an AST.  The file is memory-mapped and
+    tokenized incrementally instead of being read into a string.
+    '''
+    parser = GoneParser()
+    ast = parser.parse(tokenize_file(filename))
+    return ast
+
 
 def main():
     '''
@@ -338,7 +441,7 @@ def main():
         raise SystemExit(1)
 
     # Parse and create the AST
-    ast = parse(open(sys.argv[1]).read())
+    ast = parse_file(sys.argv[1])
 
     # Output the resulting parse tree structure
     for depth, node in flatten(ast):
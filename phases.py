@@ -0,0 +1,221 @@
+# gone/phases.py
+'''
+Compiler phase instrumentation.
+
+This file measures how much time and memory each phase of the
+compiler (parsing, checking, code generation, LLVM optimization, ...)
+takes.  Code that implements a phase wraps it in phase():
+
+       with phase('parse'):
+           ast = parse(source)
+
+Phases are only measured while a PhaseRecorder is active.  Otherwise
+phase() does nothing (beyond a function call).  To measure a
+compilation, use record_phases():
+
+       with record_phases(memory=True) as recorder:
+           run(compile_llvm(source))
+       for stats in recorder.as_dicts():
+           ...                         # Send to a metrics system
+       recorder.report()               # Or print a table on stderr
+
+Phases may be nested.  For every phase, the following is recorded:
+
+       wall          Wall clock time (seconds)
+       cpu           CPU time of the process (seconds)
+       peak_rss      Peak resident set size of the process at the end
+                     of the phase (bytes)
+
+With memory=True (slower), the following are recorded as well:
+
+       objects       Change in the number of objects tracked by the
+                     garbage collector
+       alloc_peak    Peak memory allocated by Python during the phase
+                     beyond what was allocated at its start (bytes)
+
+The interp, run, compile, pygen and batch programs print the table
+when given the --time-phases or --mem-phases option.
+'''
+
+import gc
+import sys
+import time
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:                    # Not on Windows
+    resource = None
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_rss_scale = 1 if sys.platform == 'darwin' else 1024
+
+def peak_rss():
+    '''
+    Return the peak resident set size of the process in bytes (0 if
+    not available).
+    '''
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _rss_scale
+
+class PhaseStats(object):
+    '''
+    Measurements for one phase.
+    '''
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.objects = None
+        self.alloc_peak = None
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_rss': self.peak_rss,
+            'objects': self.objects,
+            'alloc_peak': self.alloc_peak,
+        }
+
+class PhaseRecorder(object):
+    '''
+    Collects PhaseStats for the phases run while it is active.
+    '''
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.phases = []
+        self.stack = []
+        self._started_tracing = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _update_alloc_peaks(self):
+        # Fold the peak since the last reset into all of the active
+        # phases so that nested phases can reset it
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self.stack:
+            frame[2] = max(frame[2], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stats = PhaseStats(name, len(self.stack))
+        self.phases.append(stats)
+        objects = len(gc.get_objects()) if self.memory else 0
+        frame = [stats, 0, 0]
+        if self.memory:
+            frame[1] = frame[2] = self._update_alloc_peaks()
+        self.stack.append(frame)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall = time.perf_counter() - wall_start
+            stats.cpu = time.process_time() - cpu_start
+            stats.peak_rss = peak_rss()
+            if self.memory:
+                self._update_alloc_peaks()
+                stats.alloc_peak = frame[2] - frame[1]
+                stats.objects = len(gc.get_objects()) - objects
+            self.stack.pop()
+
+    def as_dicts(self):
+        '''
+        Return the measurements as a list of dicts (one per phase, in
+        the order the phases were started).
+        '''
+        return [stats.as_dict() for stats in self.phases]
+
+    def report(self, file=None):
+        '''
+        Print a table of the measurements.
+        '''
+        print_phases(self.as_dicts(), file)
+
+def print_phases(phases, file=None):
+    '''
+    Print a table of phase measurements given as a list of dicts (as
+    returned by PhaseRecorder.as_dicts()).
+    '''
+    file = file or sys.stderr
+    memory = any(stats['objects'] is not None for stats in phases)
+    header = '%-24s %10s %10s %10s' % ('phase', 'wall', 'cpu', 'peak rss')
+    if memory:
+        header += ' %10s %10s' % ('objects', 'alloc')
+    print(header, file=file)
+    for stats in phases:
+        line = '%-24s %9.4fs %9.4fs %9.1fM' % ('  ' * stats['depth'] + stats['name'],
+                                               stats['wall'], stats['cpu'],
+                                               stats['peak_rss'] / 2**20)
+        if memory:
+            line += ' %+10d %9.1fM' % (stats['objects'], stats['alloc_peak'] / 2**20)
+        print(line, file=file)
+
+# The active recorder (if any)
+_recorder = None
+
+def phase(name):
+    '''
+    Return a context manager measuring the phase with the given name.
+    '''
+    if _recorder is None:
+        return contextlib.nullcontext()
+    return _recorder.phase(name)
+
+@contextlib.contextmanager
+def record_phases(memory=False):
+    '''
+    Record the phases run in the body of the with statement.  Yields
+    the PhaseRecorder.
+    '''
+    global _recorder
+    previous = _recorder
+    recorder = _recorder = PhaseRecorder(memory)
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        _recorder = previous
+
+def add_arguments(argparser):
+    '''
+    Add the --time-phases and --mem-phases options to an argument parser.
+    '''
+    argparser.add_argument('--time-phases', action='store_true',
+                           help='report the time taken by each compiler phase')
+    argparser.add_argument('--mem-phases', action='store_true',
+                           help='report time and memory used by each compiler phase')
+
+@contextlib.contextmanager
+def report_phases(args):
+    '''
+    Record phases and print a report at the end if requested by the
+    options added with add_arguments().
+    '''
+    if not (args.time_phases or args.mem_phases):
+        yield None
+        return
+    with record_phases(args.mem_phases) as recorder:
+        try:
+            yield recorder
+        finally:
+            recorder.report()
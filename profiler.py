@@ -0,0 +1,209 @@
+# gone/profiler.py
+'''
+Interpreter Profiler
+====================
+A subclass of the reference Interpreter (interp.py) that records where
+a Gone program spends its time.  While running, it counts
+
+       - how often each opcode is executed
+       - how often each instruction (function, index) is executed
+       - how many instructions are executed for each source line
+
+and measures, for each Gone function, the number of calls and the
+inclusive (including callees) and exclusive (excluding callees) time
+spent in it.  Source lines come from the ('line', lineno) instructions
+that GenerateCode emits when created with linenos=True.
+
+From the command line, use the --profile option of the interpreter:
+
+       bash % python3 -m gone.interp --profile someprogram.g
+       bash % python3 -m gone.interp --profile-output prog.pstats someprogram.g
+
+The first prints a report on stderr after the program has run.  The
+second also writes the function timings in the format of the standard
+profile module so they can be browsed with pstats:
+
+       >>> import pstats
+       >>> pstats.Stats('prog.pstats').sort_stats('tottime').print_stats()
+'''
+
+import sys
+import time
+import marshal
+from collections import Counter
+
+from .interp import Interpreter, Frame
+
+class FunctionStats(object):
+    '''
+    Calls and time for one Gone function.  callers maps the name of
+    each calling function (None for calls from outside the program) to
+    a FunctionStats of its own for the calls made from there.
+    '''
+    def __init__(self, name, lineno=0):
+        self.name = name
+        self.lineno = lineno
+        self.calls = 0
+        self.primitive_calls = 0        # Calls that aren't recursive
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.callers = {}
+
+    def add(self, inclusive, exclusive, recursive):
+        self.calls += 1
+        self.exclusive += exclusive
+        if not recursive:
+            self.primitive_calls += 1
+            self.inclusive += inclusive
+
+class Profile(object):
+    '''
+    The data collected by a ProfilingInterpreter.
+    '''
+    def __init__(self):
+        self.opcodes = Counter()
+        self.instructions = Counter()
+        self.lines = Counter()
+        self.functions = {}
+
+    def function(self, name, lineno=0):
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = FunctionStats(name, lineno)
+        return stats
+
+    def pstats_dict(self, filename):
+        '''
+        Return the function timings as a dictionary in the format used
+        by the profile and pstats modules.
+        '''
+        def key(stats):
+            return (filename, stats.lineno, stats.name)
+
+        result = {}
+        for stats in self.functions.values():
+            callers = {}
+            for caller, edge in stats.callers.items():
+                if caller is not None:
+                    # Note: (calls, primitive calls) here but the other
+                    # way around for the function itself
+                    callers[key(self.functions[caller])] = (edge.calls, edge.primitive_calls,
+                                                           edge.exclusive, edge.inclusive)
+            result[key(stats)] = (stats.primitive_calls, stats.calls,
+                                  stats.exclusive, stats.inclusive, callers)
+        return result
+
+    def dump_stats(self, outfile, filename='<gone>'):
+        '''
+        Write the function timings to a file that pstats.Stats() can read.
+        '''
+        with open(outfile, 'wb') as f:
+            marshal.dump(self.pstats_dict(filename), f)
+
+    def report(self, code=None, source=None, limit=20, file=None):
+        '''
+        Print a report of the hottest functions, opcodes, lines and
+        instructions.  code is the dict of linked code of each function
+        (to show the instructions) and source the text of the program
+        (to show the lines).
+        '''
+        file = file or sys.stderr
+        source_lines = source.splitlines() if source else []
+
+        print('%10s %10s %12s %12s  %s' % ('calls', 'primitive', 'inclusive', 'exclusive', 'function'),
+              file=file)
+        for stats in sorted(self.functions.values(), key=lambda s: -s.exclusive)[:limit]:
+            print('%10d %10d %11.6fs %11.6fs  %s' % (stats.calls, stats.primitive_calls,
+                                                     stats.inclusive, stats.exclusive, stats.name),
+                  file=file)
+
+        print('\n%10s  %s' % ('count', 'opcode'), file=file)
+        for opcode, count in self.opcodes.most_common(limit):
+            print('%10d  %s' % (count, opcode), file=file)
+
+        print('\n%10s %6s  %s' % ('count', 'line', 'source'), file=file)
+        for lineno, count in self.lines.most_common(limit):
+            text = ''
+            if lineno is not None and 0 < lineno <= len(source_lines):
+                text = source_lines[lineno - 1].strip()
+            print('%10d %6s  %s' % (count, lineno if lineno is not None else '?', text), file=file)
+
+        print('\n%10s %-20s  %s' % ('count', 'instruction', ''), file=file)
+        for (funcname, pc), count in self.instructions.most_common(limit):
+            instr = code[funcname][pc] if code else ''
+            print('%10d %-20s  %s' % (count, '%s:%d' % (funcname, pc), instr), file=file)
+
+class ProfilingInterpreter(Interpreter):
+    '''
+    Reference interpreter that collects a Profile while running.
+    '''
+    def __init__(self, name='module', clock=time.perf_counter):
+        super(ProfilingInterpreter, self).__init__(name)
+        self.profile = Profile()
+        self.clock = clock
+        self.lineno = None
+
+        # Active calls as [funcname, time spent in callees]
+        self.calls = []
+        self.depth = Counter()
+
+    def register_functions(self, functionlist):
+        super(ProfilingInterpreter, self).register_functions(functionlist)
+        for name, code in self.functions.items():
+            first = next((instr[1] for instr in code if instr[0] == 'line'), 0)
+            self.profile.function(name, first)
+
+    def run_line(self, lineno):
+        self.lineno = lineno
+
+    def execute_function(self, funcname, args):
+        profile = self.profile
+        opcodes = profile.opcodes
+        instructions = profile.instructions
+        lines = profile.lines
+        caller = self.calls[-1][0] if self.calls else None
+        call = [funcname, 0.0]
+        self.calls.append(call)
+        recursive = self.depth[funcname] > 0
+        self.depth[funcname] += 1
+        saved_lineno = self.lineno
+        start = self.clock()
+
+        code = self.functions[funcname]
+        self.framestack.append((self.pc, self.frame))
+        self.frame = Frame(args)
+        self.pc = 0
+        while self.pc < len(code):
+            instr = code[self.pc]
+            opcode = instr[0]
+            instructions[funcname, self.pc] += 1
+            self.pc += 1
+            if opcode != 'line':
+                opcodes[opcode] += 1
+                lines[self.lineno] += 1
+            if hasattr(self, 'run_'+opcode):
+                getattr(self, 'run_'+opcode)(*instr[1:])
+            else:
+                print('Warning: No run_'+opcode+'() method')
+            if self.pc < 0:
+                break
+        result = self.frame['return']
+        self.pc, self.frame = self.framestack.pop()
+        if len(self.framestack) == 0:
+            self.output.flush()
+
+        inclusive = self.clock() - start
+        exclusive = inclusive - call[1]
+        self.calls.pop()
+        self.depth[funcname] -= 1
+        self.lineno = saved_lineno
+        if self.calls:
+            self.calls[-1][1] += inclusive
+
+        stats = profile.function(funcname)
+        stats.add(inclusive, exclusive, recursive)
+        edge = stats.callers.get(caller)
+        if edge is None:
+            edge = stats.callers[caller] = FunctionStats(caller)
+        edge.add(inclusive, exclusive, recursive)
+        return result
@@ -0,0 +1,392 @@
+# gone/pygen.py
+'''
+Python Code Generation
+======================
+This is a backend that translates the SSA intermediate code into
+Python source code.  Each Gone function becomes a Python function
+that is compiled once with compile() and then runs at the speed of
+ordinary Python code.  This gives a fast way to run Gone programs
+when LLVM is not available.
+
+The translation is fairly direct.  Temporaries, local variables and
+parameters become Python locals.  Global variables become globals of
+the generated module.  For example, the instructions:
+
+       ('load_int', 'a', '__int_0')
+       ('literal_int', 2, '__int_1')
+       ('mul_int', '__int_0', '__int_1', '__int_2')
+       ('store_int', '__int_2', 'b')
+
+turn into:
+
+       v___int_0 = v_a
+       v___int_1 = 2
+       v___int_2 = v___int_0 * v___int_1
+       v_b = v___int_2
+
+All Gone names get a 'v_' prefix (functions get 'f_') so they can
+never clash with Python keywords or builtins.  Instead of linking the
+blocks into jumps (see interp.BlockLinker), the block structure is
+turned back into structured if/else and while statements.
+
+To run a program use::
+
+    bash % python3 -m gone.pygen someprogram.g
+
+'''
+
+from . import bblock
+from .interp import new_array, index_error, overflow_error
+
+# Python operators corresponding to the binary opcodes
+binary_ops = {
+    'add': '+',
+    'sub': '-',
+    'mul': '*',
+    'lt': '<',
+    'le': '<=',
+    'gt': '>',
+    'ge': '>=',
+    'eq': '==',
+    'ne': '!=',
+    'and': 'and',
+    'or': 'or',
+}
+
+unary_ops = {
+    'uadd': '+',
+    'usub': '-',
+    'not': 'not ',
+}
+
+# Initial values for allocated variables
+initial_values = {
+    'int': '0',
+    'float': '0.0',
+    'string': "''",
+    'bool': 'False',
+}
+
+# Python modules searched for extern function declarations (see interp.py)
+external_libs = ['math', 'os', 'builtins']
+
+def varname(name):
+    return 'v_' + name
+
+def funcname(name):
+    return 'f_' + name
+
+class GeneratePython(bblock.BlockVisitor):
+    '''
+    Block visitor that turns the blocks of a single function into the
+    source code of a Python function.  Each instruction (opcode, *args)
+    is dispatched to a method self.emit_opcode(*args) that emits one
+    or more lines of code.
+    '''
+    def __init__(self):
+        # Lines of generated code
+        self.lines = []
+
+        # Current indentation level
+        self.indent = 1
+
+        # Names declared as locals/parameters in the function
+        self.locals = set()
+
+        # Names that must be declared global in the function
+        self.globals = set()
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def emit_block(self, start_block):
+        '''
+        Emit an indented chain of blocks.  Adds a pass statement if
+        nothing was emitted.
+        '''
+        self.indent += 1
+        nlines = len(self.lines)
+        self.visit(start_block)
+        if len(self.lines) == nlines:
+            self.emit('pass')
+        self.indent -= 1
+
+    def generate_function(self, func):
+        '''
+        Generate the source of a Python function for a Gone function
+        consisting of a name and a starting block.
+        '''
+        parms = []
+        for block in bblock.all_blocks(func.start_block):
+            for instr in block.instructions:
+                if instr[0].startswith(('alloc_', 'parm_')):
+                    self.locals.add(instr[1])
+                if instr[0].startswith('parm_'):
+                    parms.append((instr[2], instr[1]))
+        parms = [varname(name) for _, name in sorted(parms)]
+
+        self.visit(func.start_block)
+        header = ['def %s(%s):' % (funcname(func.name), ', '.join(parms))]
+        if self.globals:
+            header.append('    global %s' % ', '.join(sorted(self.globals)))
+        if len(self.lines) == 0:
+            self.emit('pass')
+        return '\n'.join(header + self.lines) + '\n'
+
+    def local(self, name):
+        return varname(name)
+
+    def variable(self, name):
+        '''
+        Return the Python name of a declared variable, recording it
+        as a global if it's not local to the function.
+        '''
+        if name not in self.locals:
+            self.globals.add(varname(name))
+        return varname(name)
+
+    # Block visitors
+
+    def visit_BasicBlock(self, block):
+        self.generate_code(block.instructions)
+
+    def visit_IfBlock(self, block):
+        self.generate_code(block.instructions)
+        self.emit('if %s:' % self.local(block.testvar))
+        self.emit_block(block.if_branch)
+        if block.else_branch is not None:
+            self.emit('else:')
+            self.emit_block(block.else_branch)
+
+    def visit_WhileBlock(self, block):
+        self.emit('while True:')
+        self.indent += 1
+        self.generate_code(block.instructions)
+        self.emit('if not %s:' % self.local(block.testvar))
+        self.emit('    break')
+        self.indent -= 1
+        self.emit_block(block.body)
+
+    def generate_code(self, ircode):
+        for opcode, *args in ircode:
+            if hasattr(self, 'emit_'+opcode):
+                getattr(self, 'emit_'+opcode)(*args)
+            else:
+                op = opcode.rpartition('_')[0]
+                if len(args) == 3 and op in binary_ops:
+                    self.emit_binary(binary_ops[op], *args)
+                elif len(args) == 2 and op in unary_ops:
+                    self.emit_unary(unary_ops[op], *args)
+                else:
+                    print('Warning: No emit_'+opcode+'() method')
+
+    # Opcode implementation
+
+    def emit_binary(self, op, left, right, target):
+        self.emit('%s = %s %s %s' % (self.local(target), self.local(left), op, self.local(right)))
+
+    def emit_unary(self, op, source, target):
+        self.emit('%s = %s%s' % (self.local(target), op, self.local(source)))
+
+    def emit_div_int(self, left, right, target):
+        self.emit_binary('//', left, right, target)
+
+    def emit_div_float(self, left, right, target):
+        self.emit_binary('/', left, right, target)
+
+    def emit_literal_int(self, value, target):
+        self.emit('%s = %r' % (self.local(target), value))
+
+    emit_literal_float = emit_literal_int
+    emit_literal_string = emit_literal_int
+    emit_literal_bool = emit_literal_int
+
+    def emit_alloc(self, typename, name):
+        self.emit('%s = %s' % (self.variable(name), initial_values[typename]))
+
+    def emit_alloc_int(self, name):
+        self.emit_alloc('int', name)
+
+    def emit_alloc_float(self, name):
+        self.emit_alloc('float', name)
+
+    def emit_alloc_string(self, name):
+        self.emit_alloc('string', name)
+
+    def emit_alloc_bool(self, name):
+        self.emit_alloc('bool', name)
+
+    def emit_alloc_array_int(self, name, size):
+        self.emit("%s = _new_array('int', %d)" % (self.variable(name), size))
+
+    def emit_alloc_array_float(self, name, size):
+        self.emit("%s = _new_array('float', %d)" % (self.variable(name), size))
+
+    emit_global_int = emit_alloc_int
+    emit_global_float = emit_alloc_float
+    emit_global_string = emit_alloc_string
+    emit_global_bool = emit_alloc_bool
+
+    def emit_load_int(self, name, target):
+        self.emit('%s = %s' % (self.local(target), self.variable(name)))
+
+    emit_load_float = emit_load_int
+    emit_load_string = emit_load_int
+    emit_load_bool = emit_load_int
+
+    def emit_store_int(self, source, target):
+        self.emit('%s = %s' % (self.variable(target), self.local(source)))
+
+    emit_store_float = emit_store_int
+    emit_store_string = emit_store_int
+    emit_store_bool = emit_store_int
+
+    def emit_load_array_int(self, name, index, target):
+        self.emit('%s = %s[%s]' % (self.local(target), self.variable(name), self.local(index)))
+
+    emit_load_array_float = emit_load_array_int
+
+    def emit_store_array_int(self, source, name, index):
+        self.emit('try:')
+        self.emit('    %s[%s] = %s' % (self.variable(name), self.local(index), self.local(source)))
+        self.emit('except OverflowError:')
+        self.emit('    raise _overflow_error(%s) from None' % self.local(source))
+
+    emit_store_array_float = emit_store_array_int
+
+    def emit_check_index(self, index, size):
+        self.emit('if not 0 <= %s < %d:' % (self.local(index), size))
+        self.emit('    raise _index_error(%s, %d)' % (self.local(index), size))
+
+    def emit_line(self, lineno):
+        pass
+
+    def emit_print_int(self, source):
+        self.emit('print(%s)' % self.local(source))
+
+    emit_print_float = emit_print_int
+    emit_print_string = emit_print_int
+    emit_print_bool = emit_print_int
+
+    def emit_parm_int(self, name, num):
+        # Parameters are arguments of the Python function
+        pass
+
+    emit_parm_float = emit_parm_int
+    emit_parm_string = emit_parm_int
+    emit_parm_bool = emit_parm_int
+
+    def emit_return_int(self, source):
+        self.emit('return %s' % self.local(source))
+
+    emit_return_float = emit_return_int
+    emit_return_string = emit_return_int
+    emit_return_bool = emit_return_int
+
+    def emit_return_void(self):
+        self.emit('return None')
+
+    def emit_extern_func(self, name, rettypename, *parmtypenames):
+        self.globals.add(funcname(name))
+        self.emit('%s = _extern(%r)' % (funcname(name), name))
+
+    def emit_call_func(self, name, *args):
+        target = args[-1]
+        argnames = [self.local(arg) for arg in args[:-1]]
+        self.emit('%s = %s(%s)' % (self.local(target), funcname(name), ', '.join(argnames)))
+
+def _extern(name):
+    '''
+    Find an extern function in the list of external Python modules.
+    '''
+    for modname in external_libs:
+        func = getattr(__import__(modname), name, None)
+        if func:
+            return func
+    raise RuntimeError('No extern function %s found' % name)
+
+def generate_python(functions):
+    '''
+    Generate the source code of a Python module from a list of
+    Gone functions.
+    '''
+    chunks = []
+    for func in functions:
+        gen = GeneratePython()
+        chunks.append(gen.generate_function(func))
+    return '\n'.join(chunks)
+
+def load_python(pycode, filename='<gone>'):
+    '''
+    Compile generated Python source and return a dictionary
+    mapping Gone function names to Python functions.
+    '''
+    namespace = { '_extern': _extern, '_new_array': new_array, '_index_error': index_error,
+                  '_overflow_error': overflow_error }
+    exec(compile(pycode, filename, 'exec'), namespace)
+    return { name[2:]: value for name, value in namespace.items()
+             if name.startswith('f_') }
+
+#######################################################################
+#                      TESTING/MAIN PROGRAM
+#######################################################################
+
+def compile_python(source, optimize=False, incremental=False):
+    '''
+    Generate Python source code from Gone source.
+    '''
+    from .ircode import compile_ircode, main_function
+    from .errors import errors_reported
+    from .phases import phase
+
+    code = compile_ircode(source, optimize, incremental)
+    if errors_reported():
+        return ''
+    with phase('pygen'):
+        # !!! The program is the body of main() until Projects 7/8
+        return generate_python([main_function(code)])
+
+def main():
+    import argparse
+    from .errors import errors_reported
+    from .cache import cached_compile
+    from .phases import phase, add_arguments, report_phases
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.pygen')
+    argparser.add_argument('filename')
+    argparser.add_argument('-S', '--source', action='store_true',
+                           help='print the generated Python code instead of running it')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='optimization level (0 disables the IR optimizer)')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only recompile declarations that changed')
+    add_arguments(argparser)
+    args = argparser.parse_args()
+
+    source = open(args.filename).read()
+    optimize = args.optlevel > 0
+    with report_phases(args):
+        pycode = cached_compile('py', source,
+                                lambda s: compile_python(s, optimize, args.incremental), optimize)
+        if errors_reported():
+            raise SystemExit(1)
+
+        if args.source:
+            print(pycode)
+            return
+
+        # Monkey patch os with a putchar() function so certain examples work
+        import os
+        os.putchar = lambda x: os.write(1, chr(x).encode('latin-1'))
+
+        with phase('load'):
+            functions = load_python(pycode, args.filename)
+        with phase('execute'):
+            if '__init' in functions:
+                functions['__init']()
+            result = functions['main']()
+        if result is not None:
+            print('Program Returned: %d' % result)
+
+if __name__ == '__main__':
+    main()
@@ -9,33 +9,157 @@
 # Note:  This project will require minor modification in Project 8
 
 import os.path
+import sys
 import ctypes
 import llvmlite.binding as llvm
 
-_path = os.path.dirname(__file__)
+from .cache import CompilationCache, cache_enabled
+from .phases import phase
 
-def run(llvm_ir):
-    # Load the runtime
-    ctypes._dlopen(os.path.join(_path, 'gonert.so'), ctypes.RTLD_GLOBAL)
+_path = os.path.dirname(__file__)
 
-    # Initialize LLVM
-    llvm.initialize()
+def initialize():
+    # llvm.initialize() is no longer needed (and raises) with the
+    # llvmlite versions providing the new pass manager used in optimize()
     llvm.initialize_native_target()
     llvm.initialize_native_asmprinter()
 
+def host_cpu():
+    '''
+    Return the name of the host CPU and the string of its features
+    (like '+sse2,+avx,...').
+    '''
+    try:
+        features = llvm.get_host_cpu_features().flatten()
+    except RuntimeError:
+        # Not available on all platforms
+        features = ''
+    return llvm.get_host_cpu_name(), features
+
+def create_target_machine(optlevel=0, host=False):
+    '''
+    Create a target machine for the host using the given
+    optimization level (0-3).  If host is true, code is generated for
+    the host CPU and may use all of its features (vector instructions
+    in particular), like clang -march=native.  This is only safe for
+    code that runs on this machine (the JIT in run()).  Otherwise, code
+    is generated for a generic CPU of the target so that object files
+    and LLVM code written out can be used elsewhere.
+    '''
     target = llvm.Target.from_default_triple()
-    target_machine = target.create_target_machine()
-    mod = llvm.parse_assembly(llvm_ir)
-    mod.verify()
+    if not host:
+        return target.create_target_machine(opt=optlevel)
+    cpu, features = host_cpu()
+    return target.create_target_machine(cpu=cpu, features=features, opt=optlevel)
+
+def optimize(mod, target_machine, optlevel):
+    '''
+    Run the standard LLVM optimization pipeline for the given level
+    (like clang -O1, -O2, -O3) over a parsed module.  The pipeline
+    includes promotion of memory to registers (mem2reg/SROA), instcombine,
+    GVN, loop optimizations and inlining.  Level 0 leaves the module
+    as is.
+    '''
+    if optlevel <= 0:
+        return mod
+    pto = llvm.create_pipeline_tuning_options(speed_level=optlevel)
+    pto.loop_vectorization = optlevel >= 2
+    pto.slp_vectorization = optlevel >= 2
+    pto.loop_unrolling = optlevel >= 2
+    pto.inlining_threshold = 275 if optlevel >= 3 else 225
+    pass_builder = llvm.create_pass_builder(target_machine, pto)
+    pass_manager = pass_builder.getModulePassManager()
+    pass_manager.run(mod, pass_builder)
+    return mod
+
+def object_cache_options(target_machine, options):
+    # Only the JIT caches objects and it generates code for the host CPU
+    return (target_machine.triple, str(target_machine.target_data)) + host_cpu() + options
+
+def cached_object(llvm_ir, target_machine, *options):
+    '''
+    Return the machine code saved by set_object_cache() for the LLVM IR
+    or None if there is none.
+    '''
+    return CompilationCache().get('o', llvm_ir, *object_cache_options(target_machine, options))
+
+def set_object_cache(engine, llvm_ir, target_machine, *options):
+    '''
+    Attach an object cache to an MCJIT engine.  Machine code emitted
+    for the module is saved in the compilation cache keyed by a hash of
+    the LLVM IR and the target, and loaded from there the next time the
+    same module is compiled instead of running code generation again.
+    '''
+    cache = CompilationCache()
+    options = object_cache_options(target_machine, options)
+
+    def notify(module, buffer):
+        cache.put('o', llvm_ir, buffer, *options)
+
+    def getbuffer(module):
+        return cache.get('o', llvm_ir, *options)
+
+    engine.set_object_cache(notify, getbuffer)
+
+_runtime = None
+
+def load_runtime():
+    '''
+    Load the runtime library so that JIT-compiled code can call it.
+    '''
+    global _runtime
+    if _runtime is None:
+        _runtime = ctypes.CDLL(os.path.join(_path, 'gonert.so'), ctypes.RTLD_GLOBAL)
+    return _runtime
+
+def flush_output():
+    '''
+    Write out the output buffered by the runtime (see gonert.c) and by
+    the C library.
+    '''
+    if _runtime is not None:
+        _runtime._gone_flush()
+    ctypes.CDLL(None).fflush(None)
+
+def run(llvm_ir, optlevel=0, optimized=False):
+    # Load the runtime
+    load_runtime()
+
+    # Initialize LLVM
+    with phase('llvm init'):
+        initialize()
+        target_machine = create_target_machine(optlevel, host=True)
+
+    # With machine code cached by an earlier run, MCJIT won't generate
+    # code and the module doesn't need to be verified and optimized
+    with phase('llvm cache'):
+        cached = cache_enabled() and cached_object(llvm_ir, target_machine, optlevel) is not None
+
+    with phase('llvm parse'):
+        mod = llvm.parse_assembly(llvm_ir)
+    if not cached:
+        with phase('llvm verify'):
+            mod.verify()
+        if not optimized:
+            with phase('llvm opt'):
+                optimize(mod, target_machine, optlevel)
 
-    engine = llvm.create_mcjit_compiler(mod, target_machine)
+    with phase('mcjit'):
+        engine = llvm.create_mcjit_compiler(mod, target_machine)
+        if cache_enabled():
+            set_object_cache(engine, llvm_ir, target_machine, optlevel)
 
-    # Execute the main() function
-    #
-    # !!! Note: Requires modification in Project 8 (see below)
-    main_ptr = engine.get_function_address('main')
+        # Execute the main() function
+        #
+        # !!! Note: Requires modification in Project 8 (see below)
+        main_ptr = engine.get_function_address('main')
     main_func = ctypes.CFUNCTYPE(None)(main_ptr)
-    main_func()
+    with phase('execute'):
+        sys.stdout.flush()
+        try:
+            main_func()
+        finally:
+            flush_output()
 
     # Project 8:  Modify the above code to execute the Gone __init()
     # function that initializes global variables.  Then add code below
@@ -44,16 +168,31 @@ def run(llvm_ir):
 def main():
     from .errors import errors_reported
     from .llvmgen import compile_llvm
-    import sys
+    from .cache import cached_compile
+    from .phases import add_arguments, report_phases
+    import argparse
 
-    if len(sys.argv) != 2:
-        sys.stderr.write("Usage: python3 -m gone.run filename\n")
-        raise SystemExit(1)
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.run')
+    argparser.add_argument('filename')
+    argparser.add_argument('-O', dest='optlevel', type=int, choices=range(4), default=0,
+                           help='optimization level (0-3)')
+    argparser.add_argument('--incremental', action='store_true',
+                           help='only recompile declarations that changed')
+    argparser.add_argument('-j', '--jobs', type=int, default=0,
+                           help='generate code in parallel using this many processes')
+    add_arguments(argparser)
+    args = argparser.parse_args()
 
-    source = open(sys.argv[1]).read()
-    llvm_code = compile_llvm(source)
-    if not errors_reported():
-        run(llvm_code)
+    source = open(args.filename).read()
+    optimize = args.optlevel > 0
+    parallel = ('parallel', args.optlevel) if args.jobs else ()
+    with report_phases(args):
+        llvm_code = cached_compile('ll', source,
+                                   lambda s: compile_llvm(s, optimize, args.incremental,
+                                                          args.jobs, args.optlevel),
+                                   optimize, *parallel)
+        if not errors_reported():
+            run(llvm_code, args.optlevel, optimized=bool(args.jobs))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,7 @@
+# gone/tests/__init__.py
+'''
+Tests for the Gone compiler.  Run them from the directory containing
+the gone package:
+
+       python3 -m unittest discover gone.tests
+'''
@@ -0,0 +1,112 @@
+# gone/tests/test_arrays.py
+'''
+Tests of arrays: checking them in an arena AST, storing values that
+don't fit in an int array and generating and running LLVM code for
+arrays (if llvmlite is installed).
+'''
+
+import io
+import unittest
+import contextlib
+
+from .. import arena
+from ..checker import check_program
+from ..errors import clear_errors, errors_reported
+from ..ircode import compile_ircode, main_function
+from ..interp import BlockLinker, CompiledInterpreter, Interpreter
+
+class ArenaArrayTest(unittest.TestCase):
+    def setUp(self):
+        clear_errors()
+
+    def check(self, source):
+        check_program(arena.parse(source))
+        return errors_reported()
+
+    def test_index_in_range(self):
+        self.assertEqual(self.check('var a int[3]; a[2] = 1; print a[1];'), 0)
+
+    def test_index_out_of_range(self):
+        self.assertEqual(self.check('var a int[3]; print a[3];'), 1)
+
+OPTLEVELS = range(4)
+
+OVERFLOW = 'var a int[2]; a[0] = 2147483647; print a[0]; a[1] = a[0] + 1;'
+
+class IntOverflowTest(unittest.TestCase):
+    def setUp(self):
+        clear_errors()
+
+    def test_interpreters(self):
+        for interpreter_class in (Interpreter, CompiledInterpreter):
+            with self.subTest(interpreter=interpreter_class.__name__):
+                func = main_function(compile_ircode(OVERFLOW))
+                linker = BlockLinker()
+                linker.link_blocks(func.start_block)
+                interpreter = interpreter_class()
+                interpreter.register_functions([(func, linker.code)])
+                output = io.StringIO()
+                with self.assertRaisesRegex(RuntimeError, '2147483648'), \
+                     contextlib.redirect_stdout(output):
+                    interpreter.execute_function('main', [])
+                # The output printed before the error is written out
+                self.assertEqual(output.getvalue(), '2147483647\n')
+
+    def test_python(self):
+        from ..pygen import compile_python, load_python
+
+        functions = load_python(compile_python(OVERFLOW))
+        with self.assertRaisesRegex(RuntimeError, '2147483648'):
+            functions['main']()
+
+INT_ARITHMETIC = '''
+var a int[6];
+var b int[6];
+a[0] = 7; a[1] = -7; a[2] = 3;
+b[0] = a[0] - a[2];
+b[1] = a[0] * a[2];
+b[2] = a[1] / 2;
+b[3] = a[0] / 2;
+b[4] = -a[0];
+b[5] = +a[1];
+'''
+
+class LLVMArrayTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            from .. import llvmgen
+        except ImportError:
+            self.skipTest('llvmlite is not installed')
+        self.llvmgen = llvmgen
+        clear_errors()
+
+    def test_float_array(self):
+        import llvmlite.binding as llvm
+
+        llvm_code = self.llvmgen.compile_llvm('var a float[3]; a[1] = 2.5; print a[1] * -a[0];')
+        self.assertEqual(errors_reported(), 0)
+        llvm.parse_assembly(llvm_code).verify()
+
+    def test_int_arithmetic(self):
+        import ctypes
+        import llvmlite.binding as llvm
+        from .. import run
+
+        llvm_code = self.llvmgen.compile_llvm(INT_ARITHMETIC)
+        self.assertEqual(errors_reported(), 0)
+        run.load_runtime()
+        run.initialize()
+        for optlevel in OPTLEVELS:
+            with self.subTest(optlevel=optlevel):
+                target_machine = run.create_target_machine(optlevel, host=True)
+                mod = llvm.parse_assembly(llvm_code)
+                mod.verify()
+                run.optimize(mod, target_machine, optlevel)
+                engine = llvm.create_mcjit_compiler(mod, target_machine)
+                ctypes.CFUNCTYPE(None)(engine.get_function_address('main'))()
+                b = (ctypes.c_int32 * 6).from_address(engine.get_global_value_address('b'))
+                # Division rounds down as in the interpreter
+                self.assertEqual(list(b), [4, 21, -4, 3, -7, -7])
+
+if __name__ == '__main__':
+    unittest.main()
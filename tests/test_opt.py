@@ -0,0 +1,49 @@
+# gone/tests/test_opt.py
+'''
+Tests of individual optimization passes on the code of main().
+'''
+
+import unittest
+
+from ..ircode import main_function
+from ..opt import ConstantPropagation
+
+class ConstantPropagationTest(unittest.TestCase):
+    def propagate(self, code):
+        func = main_function(code)
+        ConstantPropagation().run_program([func])
+        return func.start_block.instructions
+
+    def test_load_after_call(self):
+        code = self.propagate([
+            ('alloc_int', 'k'),
+            ('literal_int', 3, '__int_0'),
+            ('store_int', '__int_0', 'k'),
+            ('call_func', 'f', '__int_1'),
+            ('load_int', 'k', '__int_2'),
+        ])
+        self.assertEqual(code[-1], ('literal_int', 3, '__int_2'))
+
+    def test_load_before_store(self):
+        code = self.propagate([
+            ('alloc_int', 'k'),
+            ('load_int', 'k', '__int_0'),
+            ('literal_int', 3, '__int_1'),
+            ('store_int', '__int_1', 'k'),
+        ])
+        self.assertEqual(code[1], ('load_int', 'k', '__int_0'))
+
+    def test_stored_twice(self):
+        code = self.propagate([
+            ('alloc_int', 'x'),
+            ('literal_int', 3, '__int_0'),
+            ('store_int', '__int_0', 'x'),
+            ('literal_int', 4, '__int_1'),
+            ('store_int', '__int_1', 'x'),
+            ('call_func', 'f', '__int_2'),
+            ('load_int', 'x', '__int_3'),
+        ])
+        self.assertEqual(code[-1], ('load_int', 'x', '__int_3'))
+
+if __name__ == '__main__':
+    unittest.main()
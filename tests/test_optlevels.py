@@ -0,0 +1,83 @@
+# gone/tests/test_optlevels.py
+'''
+Smoke test compiling and running one program at each optimization
+level (-O0 to -O3) with the interpreter and the Python backend, and
+generating LLVM code for it (if llvmlite is installed).
+'''
+
+import io
+import unittest
+import contextlib
+
+from ..errors import clear_errors, errors_reported
+from ..ircode import compile_ircode, main_function
+from ..interp import BlockLinker, CompiledInterpreter, Interpreter
+
+PROGRAM = '''
+const n = 5;
+var a int[8];
+var x int = n + 2;
+var y int;
+y = x + x + n;
+a[2] = y + 1;
+a[n] = a[2] + a[2];
+print a[n] + -x;
+print y + (x + 1) + (x + 1);
+const s = "ab";
+var t string = s + "c";
+print t * 2;
+'''
+
+OUTPUT = '33\n35\nabcabc\n'
+
+OPTLEVELS = range(4)
+
+class OptimizationLevelTest(unittest.TestCase):
+    def setUp(self):
+        clear_errors()
+
+    def compile(self, optlevel):
+        code = compile_ircode(PROGRAM, optimize=optlevel > 0)
+        self.assertEqual(errors_reported(), 0)
+        return code
+
+    def test_interpreters(self):
+        for optlevel in OPTLEVELS:
+            for interpreter_class in (Interpreter, CompiledInterpreter):
+                with self.subTest(optlevel=optlevel, interpreter=interpreter_class.__name__):
+                    func = main_function(self.compile(optlevel))
+                    linker = BlockLinker()
+                    linker.link_blocks(func.start_block)
+                    interpreter = interpreter_class()
+                    interpreter.register_functions([(func, linker.code)])
+                    output = io.StringIO()
+                    with contextlib.redirect_stdout(output):
+                        interpreter.execute_function('main', [])
+                    self.assertEqual(output.getvalue(), OUTPUT)
+
+    def test_python(self):
+        from ..pygen import compile_python, load_python
+
+        for optlevel in OPTLEVELS:
+            with self.subTest(optlevel=optlevel):
+                functions = load_python(compile_python(PROGRAM, optimize=optlevel > 0))
+                self.assertEqual(errors_reported(), 0)
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    functions['main']()
+                self.assertEqual(output.getvalue(), OUTPUT)
+
+    def test_llvm(self):
+        try:
+            from ..llvmgen import compile_llvm
+        except ImportError:
+            self.skipTest('llvmlite is not installed')
+
+        for optlevel in OPTLEVELS:
+            with self.subTest(optlevel=optlevel):
+                llvm_code = compile_llvm(PROGRAM, optimize=optlevel > 0)
+                self.assertEqual(errors_reported(), 0)
+                self.assertIn('define void @"main"()', llvm_code)
+
+if __name__ == '__main__':
+    unittest.main()
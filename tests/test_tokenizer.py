@@ -0,0 +1,30 @@
+# gone/tests/test_tokenizer.py
+'''
+Tests of illegal characters with GoneLexer.tokenize() and
+tokenize_buffer().
+'''
+
+import unittest
+
+from ..errors import clear_errors, errors_reported
+from ..tokenizer import GoneLexer
+
+SOURCE = 'print 1 $ 2;\nprint é;\n'
+
+class IllegalCharacterTest(unittest.TestCase):
+    def setUp(self):
+        clear_errors()
+
+    def check(self, tokens):
+        self.assertEqual([tok.type for tok in tokens],
+                         ['PRINT', 'INTEGER', 'INTEGER', 'SEMI', 'PRINT', 'SEMI'])
+        self.assertEqual(errors_reported(), 2)
+
+    def test_tokenize(self):
+        self.check(list(GoneLexer().tokenize(SOURCE)))
+
+    def test_tokenize_buffer(self):
+        self.check(list(GoneLexer().tokenize_buffer(SOURCE.encode('utf-8'))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -101,6 +101,10 @@ from .errors import error
 # -----------------------------------------------------------------------
 # The SLY package. https://github.com/dabeaz/sly
 from sly import Lexer
+from sly.lex import Token
+
+import re
+import mmap
 
 # -----------------------------------------------------------------------
 # Lexers are defined by a class that inherits from sly.Lexer.  Follow
@@ -276,10 +280,131 @@ class GoneLexer(Lexer):
 
     # ----------------------------------------------------------------------
     # Bad character error handling
-    def error(self, value):
-        error(self.lineno,"Illegal character %r" % value[0])
+    def error(self, t):
+        # t is an ERROR token whose value is the rest of the input
+        error(self.lineno,"Illegal character %r" % t.value[0])
         self.index += 1
-    
+
+    # ----------------------------------------------------------------------
+    # Tokenizing from a buffer.
+    #
+    # tokenize() needs the whole source as a str.  tokenize_buffer() instead
+    # works directly on any object supporting the buffer protocol (bytes,
+    # mmap, etc.) holding UTF-8 encoded source, so a memory-mapped file
+    # can be tokenized without ever decoding it as a whole.  Only the text
+    # of each token is decoded.  It produces the same tokens as tokenize(),
+    # except that the index of each token is a byte offset.  Line numbers
+    # are tracked incrementally by the token functions as usual.
+    @classmethod
+    def _bytes_master_re(cls):
+        if cls.__dict__.get('_bytes_re_source') is not cls._master_re:
+            cls._bytes_re = re.compile(cls._master_re.pattern.encode('utf-8'), cls.reflags)
+            cls._bytes_re_source = cls._master_re
+        return cls._bytes_re
+
+    def tokenize_buffer(self, buffer, lineno=1, index=0):
+        cls = type(self)
+        master_re = cls._bytes_master_re()
+        ignore = set(cls.ignore.encode('utf-8'))
+        literals = { ord(c) for c in cls.literals }
+        token_funcs = cls._token_funcs
+        ignored_tokens = cls._ignored_tokens
+        remapping = cls._remapping
+        size = len(buffer)
+
+        while index < size:
+            if buffer[index] in ignore:
+                index += 1
+                continue
+
+            tok = Token()
+            tok.lineno = lineno
+            tok.index = index
+            m = master_re.match(buffer, index)
+            if m:
+                tok.end = index = m.end()
+                tok.value = m.group().decode('utf-8')
+                tok.type = m.lastgroup
+
+                if tok.type in remapping:
+                    tok.type = remapping[tok.type].get(tok.value, tok.type)
+
+                if tok.type in token_funcs:
+                    self.index = index
+                    self.lineno = lineno
+                    tok = token_funcs[tok.type](self, tok)
+                    index = self.index
+                    lineno = self.lineno
+                    if not tok:
+                        continue
+
+                if tok.type in ignored_tokens:
+                    continue
+                yield tok
+
+            elif buffer[index] in literals:
+                tok.value = tok.type = chr(buffer[index])
+                tok.end = index = index + 1
+                yield tok
+
+            else:
+                # A lexing error.  Only a small piece of the remaining
+                # input is decoded for the error handler.  It advances
+                # self.index by characters, which are skipped here as
+                # whole UTF-8 sequences.
+                self.index = index
+                self.lineno = lineno
+                tok.type = 'ERROR'
+                tok.value = bytes(buffer[index:index+80]).decode('utf-8', 'replace')
+                self.error(tok)
+                for _ in range(self.index - index):
+                    index += utf8_length(buffer, index)
+                lineno = self.lineno
+
+        self.index = index
+        self.lineno = lineno
+
+def utf8_length(buffer, index):
+    '''
+    Return the length in bytes of the UTF-8 encoded character at
+    buffer[index].  An invalid or truncated sequence counts as a single
+    byte, just like the replacement character it's decoded as.
+    '''
+    if index >= len(buffer):
+        return 0
+    lead = buffer[index]
+    if 0xc2 <= lead < 0xe0:
+        length = 2
+    elif 0xe0 <= lead < 0xf0:
+        length = 3
+    elif 0xf0 <= lead < 0xf5:
+        length = 4
+    else:
+        return 1
+    continuation = buffer[index+1:index+length]
+    if len(continuation) != length - 1 or any(not 0x80 <= b < 0xc0 for b in continuation):
+        return 1
+    return length
+
+def tokenize_file(filename, lexer=None):
+    '''
+    Generate the tokens of a source file by memory-mapping it.  Memory use
+    is bounded by the tokens consumed, not by the size of the file.
+    Only the parser and tokenizer mains read files this way.  The other
+    entry points (interp, run, pygen, compile) read the source as a str
+    because the compilation cache and the incremental compiler work on
+    the source text.
+    '''
+    lexer = lexer or GoneLexer()
+    with open(filename, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return
+        with buffer:
+            yield from lexer.tokenize_buffer(buffer)
+
 # ----------------------------------------------------------------------
 #                DO NOT CHANGE ANYTHING BELOW THIS PART
 #
@@ -298,9 +423,7 @@ def main():
         sys.stderr.write("Usage: python3 -m gone.tokenizer filename\n")
         raise SystemExit(1)
 
-    lexer = GoneLexer()
-    text = open(sys.argv[1]).read()
-    for tok in lexer.tokenize(text):
+    for tok in tokenize_file(sys.argv[1]):
         print(tok)
 
 if __name__ == '__main__':
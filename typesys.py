@@ -31,6 +31,11 @@ error_type = None
 # List of builtin types.  These will get added to the symbol table
 builtin_types = ['int', 'float', 'string', 'bool']
 
+# Types that can be the elements of an array (e.g., 'var a int[10];').
+# Arrays are fixed-size and contiguous, so only types with a fixed-size
+# machine representation are allowed.
+array_element_types = ['int', 'float']
+
 # Dict mapping all valid binary operations to a result type
 
 _supported_binops = {
@@ -0,0 +1,431 @@
+# gone/vectorize.py
+'''
+Vectorized Loops
+================
+Interpreting a loop over an array one instruction at a time costs a
+Python function call per instruction and iteration.  This file finds
+simple counted loops in the block structure of a function and runs
+all of their iterations at once as NumPy operations on the storage of
+the arrays (the array.array objects of interp.py).  For example:
+
+       while i < n {                  // n a literal or unchanged variable
+           c[i] = a[i] * b[i];        // map
+           total = total + a[i];      // sum
+           dot = dot + a[i] * b[i];   // dot product
+           i = i + 1;
+       }
+
+A loop is vectorized if its body is a single basic block containing
+only
+
+       - loads of the induction variable i and of variables that the
+         loop doesn't change
+       - literals and the arithmetic operators
+       - element loads and index checks.  Arrays stored by the loop may
+         only be accessed at index i so iterations are independent.
+       - element stores at index i
+       - reductions: 'x = x + expr' where x is loaded and stored once
+       - the increment 'i = i + k' (k a literal > 0) at the end
+
+VectorizingLinker links the blocks like interp.BlockLinker but puts a
+('vector_loop', kernel) instruction in front of each such loop.  When
+the interpreter reaches it, the kernel computes the results of up to
+CHUNK_SIZE iterations without changing anything.  If the results are
+exactly what running the loop would produce, they're stored and the
+kernel goes on with the next chunk.  Otherwise (a failing index check,
+a division by zero, an int that could overflow, too few iterations to
+be worth it), the kernel stops and the interpreter runs the remaining
+iterations as usual, so any error is reported at the right iteration.
+Either way, the loop test runs next.
+
+Floating point sums are accumulated in order (numpy.cumsum), giving
+the same result as the loop.  NumPy is optional.  Without it, no loop
+is vectorized.
+'''
+
+from . import bblock
+from .interp import BlockLinker, array_typecodes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Loops running fewer iterations than this are left to the interpreter
+MIN_ITERATIONS = 32
+
+# Most iterations run at once (bounds the size of the vectors)
+CHUNK_SIZE = 1 << 16
+
+# NumPy types of the elements of Gone arrays (see interp.array_typecodes)
+element_dtypes = {
+    'i': 'int32',
+    'd': 'float64',
+}
+
+# Ints are computed in 64 bits.  Results that could get this large fall
+# back to the interpreter (which has unbounded ints).
+INT_LIMIT = 2**62
+
+# Limits of the values that can be stored in int arrays
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+class NotVectorizable(Exception):
+    pass
+
+class Fallback(Exception):
+    pass
+
+class LoopKernel(object):
+    '''
+    The body of a counted loop as a list of operations on whole vectors.
+    scalars are the names of the variables read by the loop and arrays
+    the names of the arrays it uses.
+    '''
+    def __init__(self, var, step, limit, inclusive, operations, reductions, stored_arrays):
+        self.var = var                  # Induction variable
+        self.step = step
+        self.limit = limit              # ('literal', value) or ('variable', name)
+        self.inclusive = inclusive      # Test is i <= limit
+        self.operations = operations
+        self.reductions = reductions    # variable -> temporary of the new value
+        self.stored_arrays = stored_arrays
+
+        self.arrays = sorted({ op[2] for op in operations if op[0] in ('load_array', 'store_array') })
+        self.scalars = sorted({ op[2] for op in operations if op[0] == 'load' } |
+                              { var } | ({ limit[1] } if limit[0] == 'variable' else set()))
+
+    def __repr__(self):
+        return '<LoopKernel %s step %d: %d operations>' % (self.var, self.step, len(self.operations))
+
+    def execute(self, scalars, arrays):
+        '''
+        Run the loop given the values of the variables it reads (a dict)
+        and its arrays (a dict of array.array objects).  Stores the new
+        elements in the arrays and returns a dict of the new values of
+        the variables, or returns None without changing anything if the
+        loop has to be interpreted instead.  Long loops are run in
+        chunks of CHUNK_SIZE iterations.  If one of them has to be
+        interpreted, the new values of the chunks before it are returned
+        and the interpreter finishes the loop.
+        '''
+        if numpy is None:
+            return None
+        views = {}
+        for name in self.arrays:
+            values = arrays[name]
+            views[name] = numpy.frombuffer(values, dtype=element_dtypes[values.typecode])
+
+        scalars = dict(scalars)
+        results = None
+        while True:
+            chunk = self.execute_chunk(scalars, views)
+            if chunk is None:
+                return results
+            scalars.update(chunk)
+            results = dict(results or {}, **chunk)
+
+    def execute_chunk(self, scalars, views):
+        start = scalars[self.var]
+        limit = self.limit[1] if self.limit[0] == 'literal' else scalars[self.limit[1]]
+        if not (isinstance(start, int) and isinstance(limit, int)):
+            return None
+        if abs(start) >= INT_LIMIT or abs(limit) >= INT_LIMIT:
+            return None
+        stop = limit + 1 if self.inclusive else limit
+        count = min(len(range(start, stop, self.step)), CHUNK_SIZE)
+        if count < MIN_ITERATIONS:
+            return None
+
+        index = numpy.arange(start, start + count * self.step, self.step, dtype=numpy.int64)
+        try:
+            temps, stores = self.evaluate(index, scalars, views, count)
+        except Fallback:
+            return None
+
+        # Everything has been checked.  Commit the results.
+        for name, value in stores:
+            views[name][index] = value
+        results = { self.var: start + count * self.step }
+        for name, temp in self.reductions.items():
+            results[name] = temps[temp]
+        return results
+
+    def evaluate(self, index, scalars, views, count):
+        temps = {}
+        current = {}            # Elements of stored arrays (as of now)
+        for op in self.operations:
+            kind = op[0]
+            if kind == 'index':
+                temps[op[1]] = index
+            elif kind == 'literal':
+                temps[op[1]] = op[2]
+            elif kind == 'load':
+                temps[op[1]] = scalars[op[2]]
+            elif kind == 'binary':
+                temps[op[1]] = binary(op[2], op[3], temps[op[4]], temps[op[5]])
+            elif kind == 'unary':
+                value = temps[op[3]]
+                temps[op[1]] = value if op[2] == 'uadd' else -value
+            elif kind == 'check':
+                check_range(temps[op[1]], 0, op[2] - 1)
+            elif kind == 'load_array':
+                name, position = op[2], temps[op[3]]
+                if name in current:
+                    temps[op[1]] = current[name]
+                else:
+                    check_range(position, 0, len(views[name]) - 1)
+                    value = views[name][position]
+                    temps[op[1]] = value.astype(numpy.int64) if op[4] == 'int' else value
+            elif kind == 'store_array':
+                name, value = op[2], temps[op[1]]
+                if op[3] == 'int':
+                    check_range(value, INT_MIN, INT_MAX)
+                value = numpy.broadcast_to(value, index.shape)
+                check_range(index, 0, len(views[name]) - 1)
+                current[name] = value
+            elif kind == 'sum':
+                temps[op[1]] = reduce_sum(op[2], temps[op[3]], temps[op[4]], count)
+
+        return temps, list(current.items())
+
+def largest(value):
+    '''
+    Return the largest absolute value of an int vector (or scalar).
+    '''
+    if isinstance(value, numpy.ndarray):
+        return max(abs(int(value.min())), abs(int(value.max()))) if value.size else 0
+    return abs(value)
+
+def check_range(value, low, high):
+    if isinstance(value, numpy.ndarray):
+        if value.size and (value.min() < low or value.max() > high):
+            raise Fallback()
+    elif not low <= value <= high:
+        raise Fallback()
+
+def binary(op, typename, left, right):
+    if typename == 'int':
+        if op in ('add', 'sub') and largest(left) + largest(right) >= INT_LIMIT:
+            raise Fallback()
+        if op == 'mul' and largest(left) * largest(right) >= INT_LIMIT:
+            raise Fallback()
+    if op == 'div':
+        if numpy.any(numpy.asarray(right) == 0):
+            raise Fallback()
+        return left // right if typename == 'int' else left / right
+    if op == 'add':
+        return left + right
+    elif op == 'sub':
+        return left - right
+    return left * right
+
+def reduce_sum(typename, initial, values, count):
+    values = numpy.broadcast_to(values, (count,))
+    if typename == 'int':
+        if largest(initial) + largest(values) * count >= INT_LIMIT:
+            raise Fallback()
+        return initial + int(values.sum())
+    # Accumulate in the order of the loop
+    return float(numpy.cumsum(numpy.concatenate(([initial], values)))[-1])
+
+def plan_loop(block):
+    '''
+    Return a LoopKernel for a WhileBlock or None if the loop can't be
+    vectorized.
+    '''
+    if numpy is None:
+        return None
+    try:
+        return LoopPlanner(block).plan()
+    except NotVectorizable:
+        return None
+
+class LoopPlanner(object):
+    '''
+    Matches the instructions of a while loop against the shape
+    described at the top of this file.
+    '''
+    def __init__(self, block):
+        self.block = block
+
+    def plan(self):
+        block = self.block
+        body = block.body
+        if not isinstance(body, bblock.BasicBlock) or body.next_block is not None:
+            raise NotVectorizable()
+        var, limit, inclusive = self.match_test(block)
+        code = [instr for instr in body.instructions if instr[0] != 'line']
+
+        # The body ends with i = i + step
+        if len(code) < 2 or code[-1][0] != 'store_int' or code[-1][2] != var:
+            raise NotVectorizable()
+        increment = code[-2]
+        if increment[0] != 'add_int' or increment[3] != code[-1][1]:
+            raise NotVectorizable()
+        code = code[:-2]
+
+        # Variables stored by the loop (besides i) must be reductions
+        stored = [instr for instr in code if instr[0].startswith('store_') and
+                  not instr[0].startswith('store_array_')]
+        reductions = {}
+        for instr in stored:
+            reductions[instr[2]] = instr[1]
+        if len(reductions) != len(stored) or var in reductions:
+            raise NotVectorizable()
+        if limit[0] == 'variable' and limit[1] in reductions:
+            raise NotVectorizable()
+
+        stored_arrays = { instr[2] for instr in code if instr[0].startswith('store_array_') }
+        kinds = {}                      # temporary -> 'index', 'vector' or 'scalar'
+        literals = {}
+        operations = []
+        sums = {}                       # temporary of a loaded reduction -> variable
+        for instr in code:
+            opcode = instr[0]
+            op, _, typename = opcode.rpartition('_')
+            if op == 'literal' and typename in ('int', 'float'):
+                kinds[instr[2]] = 'scalar'
+                literals[instr[2]] = instr[1]
+                operations.append(('literal', instr[2], instr[1]))
+            elif opcode == 'load_int' and instr[1] == var:
+                kinds[instr[2]] = 'index'
+                operations.append(('index', instr[2]))
+            elif op == 'load' and typename in ('int', 'float'):
+                if instr[1] in reductions:
+                    if instr[1] in sums.values():
+                        raise NotVectorizable()
+                    sums[instr[2]] = instr[1]
+                kinds[instr[2]] = 'scalar'
+                operations.append(('load', instr[2], instr[1]))
+            elif op in ('add', 'sub', 'mul', 'div') and typename in ('int', 'float'):
+                left, right, target = instr[1:]
+                if left in sums or right in sums:
+                    # The only use of a loaded reduction is 'x + expr'
+                    operations.append(self.match_sum(instr, sums, kinds, reductions, code))
+                    kinds[target] = 'scalar'
+                    continue
+                kinds[target] = self.combine(kinds, left, right)
+                operations.append(('binary', target, op, typename, left, right))
+            elif op in ('uadd', 'usub') and typename in ('int', 'float'):
+                kinds[instr[2]] = self.combine(kinds, instr[1])
+                operations.append(('unary', instr[2], op, instr[1]))
+            elif opcode == 'check_index':
+                self.combine(kinds, instr[1])
+                operations.append(('check', instr[1], instr[2]))
+            elif op == 'load_array' and typename in array_typecodes:
+                name, position, target = instr[1:]
+                self.combine(kinds, position)
+                if name in stored_arrays and kinds[position] != 'index':
+                    raise NotVectorizable()
+                kinds[target] = 'vector'
+                operations.append(('load_array', target, name, position, typename))
+            elif op == 'store_array' and typename in array_typecodes:
+                source, name, position = instr[1:]
+                self.combine(kinds, source)
+                if kinds.get(position) != 'index':
+                    raise NotVectorizable()
+                operations.append(('store_array', source, name, typename))
+            elif op == 'store' and instr[2] in reductions:
+                pass
+            else:
+                raise NotVectorizable()
+
+        # Every reduction must have been matched as 'x = x + expr'
+        matched = { operation[1] for operation in operations if operation[0] == 'sum' }
+        if set(reductions.values()) != matched:
+            raise NotVectorizable()
+
+        # i is only incremented by a positive literal
+        index_temps = [t for t, kind in kinds.items() if kind == 'index']
+        if not (increment[1] in index_temps and increment[2] in literals or
+                increment[2] in index_temps and increment[1] in literals):
+            raise NotVectorizable()
+        step = literals[increment[2] if increment[1] in index_temps else increment[1]]
+        if not (isinstance(step, int) and step > 0):
+            raise NotVectorizable()
+
+        return LoopKernel(var, step, limit, inclusive, operations, reductions, stored_arrays)
+
+    def match_test(self, block):
+        '''
+        Match the loop header 'i < limit' (or <=).  Returns (variable,
+        limit, inclusive) where limit is ('literal', value) or
+        ('variable', name).
+        '''
+        defs = {}
+        for instr in block.instructions:
+            if instr[0] == 'line':
+                continue
+            if instr[0] not in ('literal_int', 'load_int', 'lt_int', 'le_int', 'gt_int', 'ge_int'):
+                raise NotVectorizable()
+            defs[instr[-1]] = instr
+        test = defs.get(block.testvar)
+        if test is None:
+            raise NotVectorizable()
+        if test[0] in ('lt_int', 'le_int'):
+            var, bound = defs.get(test[1]), defs.get(test[2])
+        else:
+            var, bound = defs.get(test[2]), defs.get(test[1])
+        if var is None or bound is None or var[0] != 'load_int':
+            raise NotVectorizable()
+        if bound[0] == 'literal_int':
+            limit = ('literal', bound[1])
+        elif bound[1] != var[1]:
+            limit = ('variable', bound[1])
+        else:
+            raise NotVectorizable()
+        return var[1], limit, test[0] in ('le_int', 'ge_int')
+
+    def combine(self, kinds, *operands):
+        '''
+        Return the kind of the result of an operation on operands.
+        Temporaries defined outside of the loop body are not supported.
+        '''
+        result = 'scalar'
+        for operand in operands:
+            kind = kinds.get(operand)
+            if kind is None:
+                raise NotVectorizable()
+            if kind != 'scalar':
+                result = 'vector'
+        return result
+
+    def match_sum(self, instr, sums, kinds, reductions, code):
+        opcode, left, right, target = instr
+        op, _, typename = opcode.rpartition('_')
+        if op != 'add' or (left in sums and right in sums):
+            raise NotVectorizable()
+        loaded, values = (left, right) if left in sums else (right, left)
+        name = sums[loaded]
+        if reductions[name] != target or kinds.get(values) is None:
+            raise NotVectorizable()
+        # Neither the loaded value nor the sum may be used elsewhere
+        for other in code:
+            if other is instr or other[-1] == loaded:
+                continue
+            if other[0].startswith('store_') and other[2] == name:
+                continue
+            if loaded in other[1:] or target in other[1:]:
+                raise NotVectorizable()
+        return ('sum', target, typename, loaded, values)
+
+class VectorizingLinker(BlockLinker):
+    '''
+    Links blocks like BlockLinker, adding a vector_loop instruction in
+    front of each loop that can be vectorized.  The loop's back edge
+    jumps past it to the loop test.
+    '''
+    def visit_WhileBlock(self, block):
+        kernel = plan_loop(block)
+        if kernel is None:
+            return super(VectorizingLinker, self).visit_WhileBlock(block)
+
+        self.blockmap[id(block)] = len(self.code)
+        self.code.append(('vector_loop', kernel))
+        test = len(self.code)
+        self.code.extend(block.instructions)
+        self.code.append(('cbranch', block.testvar, block.body, block.next_block))
+        self.visit(block.body)
+        self.code.append(('jump', test))